@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Cliente, Pet, Servico, Agendamento
+from .models import Cliente, Pet, Servico, Agendamento, SerieAgendamento, Tarefa
 
 @admin.register(Cliente)
 class ClienteAdmin(admin.ModelAdmin):
@@ -24,4 +24,18 @@ class AgendamentoAdmin(admin.ModelAdmin):
     list_display = ['pet', 'servico', 'data_agendamento', 'status', 'data_criacao']
     list_filter = ['status', 'data_agendamento', 'servico']
     search_fields = ['pet__nome', 'servico__nome', 'pet__cliente__nome']
-    readonly_fields = ['data_criacao', 'data_atualizacao']
\ No newline at end of file
+    readonly_fields = ['data_criacao', 'data_atualizacao']
+
+@admin.register(SerieAgendamento)
+class SerieAgendamentoAdmin(admin.ModelAdmin):
+    list_display = ['pet', 'servico', 'inicio', 'frequencia', 'intervalo', 'ativa']
+    list_filter = ['frequencia', 'ativa', 'servico']
+    search_fields = ['pet__nome', 'servico__nome', 'pet__cliente__nome']
+    readonly_fields = ['data_criacao', 'data_atualizacao']
+
+@admin.register(Tarefa)
+class TarefaAdmin(admin.ModelAdmin):
+    list_display = ['nome', 'chave', 'status', 'executar_em', 'tentativas', 'data_conclusao']
+    list_filter = ['status', 'nome']
+    search_fields = ['nome', 'chave']
+    readonly_fields = ['tentativas', 'erro', 'data_criacao', 'data_inicio', 'data_conclusao']
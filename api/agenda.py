@@ -0,0 +1,437 @@
+import heapq
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.db import connections, router, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Agendamento, SerieAgendamento, Servico
+
+# Horários oferecidos: de hora em hora, das 8h às 17h
+HORA_PRIMEIRO_HORARIO = 8
+HORA_ULTIMO_HORARIO = 17
+
+# Minutos de atendimento por dia de funcionamento (do primeiro horário ao fechamento)
+MINUTOS_POR_DIA = (HORA_ULTIMO_HORARIO + 1 - HORA_PRIMEIRO_HORARIO) * 60
+
+# Só agendamentos ativos ocupam horário
+STATUS_ATIVOS = ['agendado', 'confirmado']
+
+# Transições permitidas nas alterações de status em lote (destino: origens).
+# Reativar um cancelado exige checar conflitos e fica restrito ao fluxo unitário
+TRANSICOES_EM_LOTE = {
+    'confirmado': ['agendado'],
+    'cancelado': ['agendado', 'confirmado'],
+    'concluido': ['agendado', 'confirmado'],
+}
+
+# Até onde as séries são expandidas ao listar os próximos agendamentos
+HORIZONTE_SERIES = timedelta(days=90)
+
+# Máximo de itens por requisição em lote
+MAX_ITENS_LOTE = 500
+
+# Limite de dias por consulta de disponibilidade
+MAX_DIAS_CONSULTA = 31
+
+# Nenhum atendimento dura mais que isso; limita a busca por sobreposições
+DURACAO_MAXIMA = timedelta(days=1)
+
+
+def dias_do_periodo(data_inicio, data_fim):
+    """Lista as datas entre data_inicio e data_fim (inclusive)"""
+    return [data_inicio + timedelta(days=n) for n in range((data_fim - data_inicio).days + 1)]
+
+
+def dia_de_funcionamento(data):
+    """Abrimos de segunda a sábado"""
+    return data.weekday() != 6
+
+
+def inicio_do_dia(data):
+    """Retorna o primeiro instante (com fuso) da data informada"""
+    return timezone.make_aware(datetime.combine(data, time.min))
+
+
+def intervalo_do_dia(data):
+    """
+    Retorna (início, fim) da data para filtrar com data_agendamento__gte/__lt;
+    ao contrário de __date, a faixa pode usar os índices da coluna.
+    """
+    inicio = inicio_do_dia(data)
+    return inicio, inicio + timedelta(days=1)
+
+
+def horarios_do_dia(data):
+    """Retorna os horários de início oferecidos em uma data"""
+    return [
+        timezone.make_aware(datetime.combine(data, time(hora, 0)))
+        for hora in range(HORA_PRIMEIRO_HORARIO, HORA_ULTIMO_HORARIO + 1)
+    ]
+
+
+def calcular_fim(inicio, servico):
+    """Fim do atendimento iniciado em `inicio` para o serviço"""
+    return inicio + timedelta(minutes=servico.duracao_estimada)
+
+
+def sobrepostos(servico_ids, inicio, fim):
+    """
+    Agendamentos ativos dos serviços cujo intervalo [data_agendamento, data_fim)
+    se sobrepõe a [inicio, fim).
+
+    O limite inferior por DURACAO_MAXIMA mantém a consulta como uma faixa
+    fechada sobre o índice agendamento_intervalo_idx.
+    """
+    return Agendamento.objects.filter(
+        servico_id__in=servico_ids,
+        status__in=STATUS_ATIVOS,
+        data_agendamento__gt=inicio - DURACAO_MAXIMA,
+        data_agendamento__lt=fim,
+        data_fim__gt=inicio,
+    ).order_by()
+
+
+def _series_ativas(inicio, fim, servico_ids=None):
+    """Séries ativas que podem ter ocorrências em [inicio, fim)"""
+    series = SerieAgendamento.objects.filter(ativa=True, inicio__lt=fim).filter(
+        Q(data_limite__isnull=True) | Q(data_limite__gte=timezone.localdate(inicio))
+    ).select_related('pet__cliente', 'servico')
+    if servico_ids is not None:
+        series = series.filter(servico_id__in=servico_ids)
+    return series
+
+
+def _materializadas(series, inicio, fim):
+    """Pares (serie_id, data_original) já transformados em agendamentos"""
+    return Agendamento.objects.filter(
+        serie__in=series, data_original__gte=inicio, data_original__lt=fim
+    ).values_list('serie_id', 'data_original')
+
+
+def _ocorrencias_da_serie(serie, materializadas, inicio, fim):
+    for data in serie.ocorrencias(inicio, fim):
+        if (serie.id, data) not in materializadas:
+            yield Agendamento(
+                pet=serie.pet,
+                servico=serie.servico,
+                serie=serie,
+                data_original=data,
+                data_agendamento=data,
+                data_fim=calcular_fim(data, serie.servico),
+                preco=serie.servico.preco,
+                observacoes=serie.observacoes,
+            )
+
+
+def _expandir(series, materializadas, inicio, fim):
+    """
+    Instâncias não salvas das ocorrências não materializadas, em ordem de
+    horário: intercala os geradores de cada série, então quem consome só
+    as primeiras (ex.: próximos 10) não expande o horizonte inteiro.
+    """
+    return heapq.merge(
+        *(_ocorrencias_da_serie(serie, materializadas, inicio, fim) for serie in series),
+        key=lambda agendamento: agendamento.data_agendamento
+    )
+
+
+def ocorrencias_virtuais(inicio, fim, servico_ids=None, excluir_ocorrencia=None):
+    """
+    Ocorrências de séries ativas que começam em [inicio, fim) e ainda não
+    foram materializadas, como instâncias não salvas de Agendamento, em
+    ordem de horário e geradas sob demanda. As séries são expandidas só
+    dentro da janela.
+    """
+    series = list(_series_ativas(inicio, fim, servico_ids))
+    if not series:
+        return []
+
+    materializadas = set(_materializadas(series, inicio, fim))
+    if excluir_ocorrencia:
+        materializadas.add(excluir_ocorrencia)
+    return _expandir(series, materializadas, inicio, fim)
+
+
+async def aocorrencias_virtuais(inicio, fim, servico_ids=None):
+    """Versão assíncrona de ocorrencias_virtuais"""
+    series = [serie async for serie in _series_ativas(inicio, fim, servico_ids)]
+    if not series:
+        return []
+
+    materializadas = {par async for par in _materializadas(series, inicio, fim)}
+    return _expandir(series, materializadas, inicio, fim)
+
+
+def intervalos_virtuais(servico_ids, inicio, fim, excluir_ocorrencia=None):
+    """Intervalos (servico_id, inicio, fim) das ocorrências de séries que tocam [inicio, fim)"""
+    return [
+        (ocorrencia.servico_id, ocorrencia.data_agendamento, ocorrencia.data_fim)
+        for ocorrencia in ocorrencias_virtuais(
+            inicio - DURACAO_MAXIMA, fim, servico_ids, excluir_ocorrencia
+        )
+        if ocorrencia.data_fim > inicio
+    ]
+
+
+def existe_conflito(servico_id, inicio, fim, excluir_id=None, excluir_ocorrencia=None):
+    """
+    Verifica se [inicio, fim) colide com algum agendamento ativo do serviço,
+    inclusive ocorrências ainda não materializadas de séries
+    """
+    conflitos = sobrepostos([servico_id], inicio, fim)
+    if excluir_id:
+        conflitos = conflitos.exclude(id=excluir_id)
+    return conflitos.exists() or bool(
+        intervalos_virtuais([servico_id], inicio, fim, excluir_ocorrencia)
+    )
+
+
+def bloquear_serie(serie):
+    """
+    Bloqueia a agenda dos dias das ocorrências da série (salva ou não) dentro
+    do horizonte e retorna essas ocorrências como pares (início, fim). Deve
+    ser chamada dentro de atomic().
+    """
+    inicio = max(serie.inicio, timezone.now())
+    ocorrencias = [
+        (data, calcular_fim(data, serie.servico))
+        for data in serie.ocorrencias(inicio, inicio + HORIZONTE_SERIES)
+    ]
+    bloquear_agenda([(serie.servico_id, comeco, termino) for comeco, termino in ocorrencias])
+    return ocorrencias
+
+
+def conflitos_da_serie(serie):
+    """
+    Datas das ocorrências da série (já salva) dentro do horizonte que colidem
+    com agendamentos ativos ou com ocorrências de outras séries do serviço.
+    Bloqueia a agenda dos dias dessas ocorrências: deve ser chamada dentro
+    de atomic().
+    """
+    ocorrencias = bloquear_serie(serie)
+    if not ocorrencias:
+        return []
+
+    comeco, termino = ocorrencias[0][0], ocorrencias[-1][1]
+    # As ocorrências da própria série (virtuais ou materializadas) não contam
+    ocupados = [
+        *sobrepostos([serie.servico_id], comeco, termino).exclude(serie=serie).values_list(
+            'data_agendamento', 'data_fim'
+        ),
+        *(
+            (ocorrencia.data_agendamento, ocorrencia.data_fim)
+            for ocorrencia in ocorrencias_virtuais(comeco - DURACAO_MAXIMA, termino, [serie.servico_id])
+            if ocorrencia.serie_id != serie.id
+        ),
+    ]
+    linha = LinhaDoTempo(ocupados)
+    return [data for data, fim in ocorrencias if not linha.livre(data, fim)]
+
+def dias_bloqueados(reservas):
+    """
+    Pares (servico_id, dia) que uma lista de (servico_id, inicio, fim) precisa
+    bloquear, em ordem. Cada reserva bloqueia todos os dias que toca, então
+    duas reservas sobrepostas sempre disputam ao menos um mesmo par.
+    """
+    return sorted({
+        (servico_id, dia)
+        for servico_id, inicio, fim in reservas
+        for dia in dias_do_periodo(timezone.localdate(inicio), timezone.localdate(fim))
+    })
+
+
+def bloquear_agenda(reservas):
+    """
+    Serializa as gravações que disputam a agenda dos mesmos serviços e dias
+    até o fim da transação atual (deve ser chamada dentro de atomic()).
+
+    No PostgreSQL usa um advisory lock por (serviço, dia), pedidos em ordem
+    numa única consulta; nos demais bancos bloqueia as linhas dos serviços
+    com SELECT ... FOR UPDATE (ignorado no SQLite, que já serializa escritas).
+    """
+    pares = dias_bloqueados(reservas)
+    if not pares:
+        return
+
+    conexao = connections[router.db_for_write(Agendamento)]
+    if conexao.vendor == 'postgresql':
+        with conexao.cursor() as cursor:
+            cursor.execute(
+                'SELECT pg_advisory_xact_lock(servico, dia) '
+                'FROM unnest(%s::integer[], %s::integer[]) WITH ORDINALITY AS t(servico, dia, ordem) '
+                'ORDER BY ordem',
+                [[servico_id for servico_id, _ in pares], [dia.toordinal() for _, dia in pares]]
+            )
+            cursor.fetchall()
+    else:
+        list(Servico.objects.select_for_update().filter(
+            id__in={servico_id for servico_id, _ in pares}
+        ).order_by('id').values_list('id', flat=True))
+
+
+def buscar_ocupados(servico_ids, data_inicio, data_fim):
+    """
+    Busca os intervalos ocupados dos serviços no período, como tuplas
+    (servico_id, data_agendamento, data_fim): os agendamentos em uma única
+    consulta, mais as ocorrências de séries expandidas em memória.
+    """
+    inicio = inicio_do_dia(data_inicio)
+    fim = inicio_do_dia(data_fim + timedelta(days=1))
+    return [
+        *sobrepostos(servico_ids, inicio, fim).values_list('servico_id', 'data_agendamento', 'data_fim'),
+        *intervalos_virtuais(servico_ids, inicio, fim),
+    ]
+
+
+async def abuscar_ocupados(servico_ids, data_inicio, data_fim):
+    """Versão assíncrona de buscar_ocupados"""
+    inicio = inicio_do_dia(data_inicio)
+    fim = inicio_do_dia(data_fim + timedelta(days=1))
+    ocupados = [
+        intervalo async for intervalo in
+        sobrepostos(servico_ids, inicio, fim).values_list('servico_id', 'data_agendamento', 'data_fim')
+    ]
+    return ocupados + [
+        (ocorrencia.servico_id, ocorrencia.data_agendamento, ocorrencia.data_fim)
+        for ocorrencia in await aocorrencias_virtuais(inicio - DURACAO_MAXIMA, fim, servico_ids)
+        if ocorrencia.data_fim > inicio
+    ]
+
+
+class LinhaDoTempo:
+    """
+    Intervalos ocupados de um serviço, fundidos e ordenados, para responder
+    se um intervalo está livre em O(log n) com busca binária.
+    """
+
+    def __init__(self, intervalos):
+        self.inicios = []
+        self.fins = []
+        for inicio, fim in sorted(intervalos):
+            if self.fins and inicio <= self.fins[-1]:
+                self.fins[-1] = max(self.fins[-1], fim)
+            else:
+                self.inicios.append(inicio)
+                self.fins.append(fim)
+
+    def livre(self, inicio, fim):
+        """Verifica se [inicio, fim) não toca nenhum intervalo ocupado"""
+        posicao = bisect_right(self.fins, inicio)
+        return posicao == len(self.inicios) or self.inicios[posicao] >= fim
+
+    def ocupar(self, inicio, fim):
+        """Marca como ocupado um intervalo livre, mantendo a ordem"""
+        posicao = bisect_right(self.fins, inicio)
+        self.inicios.insert(posicao, inicio)
+        self.fins.insert(posicao, fim)
+
+
+def reservar_em_lote(candidatos):
+    """
+    Confere uma lista de (servico_id, inicio, fim) contra os agendamentos
+    ativos (e ocorrências de séries) e entre si, com uma única consulta de
+    agendamentos para o lote inteiro.
+    Retorna, na mesma ordem, True para os que cabem na agenda.
+    """
+    if not candidatos:
+        return []
+
+    servico_ids = {servico_id for servico_id, _, _ in candidatos}
+    inicio = min(inicio for _, inicio, _ in candidatos)
+    fim = max(fim for _, _, fim in candidatos)
+    existentes = [
+        *sobrepostos(servico_ids, inicio, fim).values_list('servico_id', 'data_agendamento', 'data_fim'),
+        *intervalos_virtuais(servico_ids, inicio, fim),
+    ]
+
+    intervalos = defaultdict(list)
+    for servico_id, inicio, fim in existentes:
+        intervalos[servico_id].append((inicio, fim))
+    linhas = defaultdict(lambda: LinhaDoTempo([]))
+    linhas.update({servico_id: LinhaDoTempo(lista) for servico_id, lista in intervalos.items()})
+
+    aceitos = []
+    for servico_id, inicio, fim in candidatos:
+        livre = linhas[servico_id].livre(inicio, fim)
+        if livre:
+            linhas[servico_id].ocupar(inicio, fim)
+        aceitos.append(livre)
+    return aceitos
+
+
+def alterar_status_em_lote(ids, novo_status, atuais):
+    """
+    Aplica `novo_status` (uma das chaves de TRANSICOES_EM_LOTE) com um único
+    UPDATE aos agendamentos `ids` que ainda estão numa das origens permitidas;
+    o filtro por status protege contra alterações feitas desde a leitura de
+    `atuais` ({id: status anterior}). O UPDATE não dispara sinais: eventos,
+    sincronização, resumos, lembretes e cache são atualizados aqui. Retorna
+    quantos mudaram.
+    """
+    from . import cache as cache_api
+    from . import eventos, relatorios, sincronizacao, tarefas
+
+    agora = timezone.now()
+    with transaction.atomic():
+        atualizados = Agendamento.objects.filter(id__in=ids, status__in=TRANSICOES_EM_LOTE[novo_status]).update(
+            status=novo_status, data_atualizacao=agora
+        )
+        if atualizados:
+            alterados = list(Agendamento.objects.com_relacionados().filter(
+                id__in=ids, status=novo_status, data_atualizacao=agora
+            ).order_by('id'))
+            eventos.registrar_em_lote(alterados, 'status', atuais)
+            sincronizacao.registrar(Agendamento, [agendamento.id for agendamento in alterados])
+            relatorios.agendar_recalculo(
+                relatorios.bucket(agendamento.data_agendamento, agendamento.servico_id)
+                for agendamento in alterados
+            )
+            if novo_status not in STATUS_ATIVOS:
+                tarefas.cancelar_lembretes(agendamento.id for agendamento in alterados)
+            cache_api.invalidar_apos_commit(Agendamento)
+    return atualizados
+
+
+def calcular_disponibilidade(servicos, data_inicio, data_fim, ocupados):
+    """
+    Calcula em memória os horários livres de cada serviço em cada dia
+    do período, a partir dos intervalos ocupados já carregados.
+    """
+    intervalos = {servico.id: [] for servico in servicos}
+    for servico_id, inicio, fim in ocupados:
+        intervalos[servico_id].append((inicio, fim))
+    linhas = {servico_id: LinhaDoTempo(lista) for servico_id, lista in intervalos.items()}
+
+    disponibilidade = []
+    for dia in dias_do_periodo(data_inicio, data_fim):
+        horarios = horarios_do_dia(dia)
+        for servico in servicos:
+            livres = [
+                timezone.localtime(horario).strftime('%H:%M')
+                for horario in horarios
+                if linhas[servico.id].livre(horario, calcular_fim(horario, servico))
+            ]
+            disponibilidade.append({
+                'data': dia.isoformat(),
+                'servico_id': servico.id,
+                'servico': servico.nome,
+                'horarios_disponiveis': livres,
+                'total_horarios': len(livres),
+            })
+
+    return disponibilidade
+
+
+def horarios_disponiveis(servicos, data_inicio, data_fim):
+    """Disponibilidade dos serviços no período com uma consulta de agendamentos"""
+    ocupados = buscar_ocupados([servico.id for servico in servicos], data_inicio, data_fim)
+    return calcular_disponibilidade(servicos, data_inicio, data_fim, ocupados)
+
+
+async def ahorarios_disponiveis(servicos, data_inicio, data_fim):
+    """Versão assíncrona de horarios_disponiveis"""
+    ocupados = await abuscar_ocupados([servico.id for servico in servicos], data_inicio, data_fim)
+    return calcular_disponibilidade(servicos, data_inicio, data_fim, ocupados)
@@ -0,0 +1,93 @@
+from functools import reduce
+from operator import or_
+
+from django.db import connections
+from django.db.models import Case, CharField, IntegerField, Q, TextField, Value, When
+from django.db.models.functions import Greatest
+from django.db.models.lookups import IContains
+from rest_framework import filters
+from rest_framework.settings import api_settings
+
+
+@CharField.register_lookup
+@TextField.register_lookup
+class Contem(IContains):
+    """
+    `icontains` que no PostgreSQL vira `coluna ILIKE '%termo%'`.
+
+    O icontains do Django gera UPPER("coluna"::text) LIKE UPPER(...), uma
+    expressão que os índices GIN de trigramas da migração 0007 (sobre a
+    coluna pura) não atendem; o ILIKE sobre a coluna usa o índice.
+    """
+    lookup_name = 'contem'
+
+    def as_sql(self, compiler, connection):
+        return IContains(self.lhs, self.rhs).as_sql(compiler, connection)
+
+    def as_postgresql(self, compiler, connection):
+        lhs_sql, lhs_params = self.process_lhs(compiler, connection)
+        rhs_sql, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs_sql} ILIKE {rhs_sql}', (*lhs_params, *rhs_params)
+
+
+def _maior(expressoes):
+    return expressoes[0] if len(expressoes) == 1 else Greatest(*expressoes)
+
+
+def relevancia(termo, campos, vendor):
+    """
+    Expressão de relevância do termo nos campos.
+
+    No PostgreSQL usa a similaridade de trigramas (pg_trgm); nos demais
+    bancos (ex.: SQLite dos testes) pontua igualdade, prefixo e trecho.
+    """
+    if vendor == 'postgresql':
+        from django.contrib.postgres.search import TrigramWordSimilarity
+
+        return _maior([TrigramWordSimilarity(termo, campo) for campo in campos])
+
+    return _maior([
+        Case(
+            When(**{f'{campo}__iexact': termo}, then=Value(3)),
+            When(**{f'{campo}__istartswith': termo}, then=Value(2)),
+            When(**{f'{campo}__icontains': termo}, then=Value(1)),
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+        for campo in campos
+    ])
+
+
+def buscar(queryset, termo, campos):
+    """
+    Filtra as linhas que contêm cada palavra do termo em algum dos campos
+    e anota `relevancia`.
+
+    O filtro é um ILIKE '%palavra%' por campo (lookup `contem`), que no
+    PostgreSQL usa os índices GIN de trigramas criados na migração 0007.
+    """
+    for palavra in termo.split():
+        queryset = queryset.filter(
+            reduce(or_, (Q(**{f'{campo}__contem': palavra}) for campo in campos))
+        )
+    return queryset.annotate(relevancia=relevancia(termo, campos, connections[queryset.db].vendor))
+
+
+class BuscaFilter(filters.SearchFilter):
+    """
+    SearchFilter com ranking: busca nos `search_fields` da view e, sem um
+    `?ordering=` explícito, ordena os resultados pela relevância.
+    Deve vir depois do OrderingFilter em `filter_backends`.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        termo = ' '.join(self.get_search_terms(request))
+        campos = self.get_search_fields(view, request)
+        if not termo or not campos:
+            return queryset
+
+        queryset = buscar(queryset, termo, campos)
+        if not request.query_params.get(api_settings.ORDERING_PARAM):
+            desempate = queryset.query.order_by or queryset.model._meta.ordering
+            queryset = queryset.order_by('-relevancia', *desempate)
+        return queryset
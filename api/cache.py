@@ -0,0 +1,219 @@
+import hashlib
+import threading
+import time
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from rest_framework.response import Response
+
+PREFIXO = 'api'
+CHAVE_ACERTOS = f'{PREFIXO}:estatisticas:acertos'
+CHAVE_FALHAS = f'{PREFIXO}:estatisticas:falhas'
+
+# Validadores de GET condicional guardados junto com a resposta
+CABECALHOS_GUARDADOS = ('ETag', 'Last-Modified')
+
+_local = threading.local()
+
+
+def compartilhado():
+    """
+    As versões dos modelos valem para todos os processos? Com um cache local
+    (LocMemCache) cada processo teria as suas, e uma gravação feita por outro
+    processo não mudaria o ETag deste (ver API_CACHE_COMPARTILHADO).
+    """
+    return settings.API_CACHE_COMPARTILHADO
+
+
+def _chave_versao(modelo):
+    return f'{PREFIXO}:versao:{modelo._meta.label_lower}'
+
+
+def _chave_modificacao(modelo):
+    return f'{PREFIXO}:modificado:{modelo._meta.label_lower}'
+
+
+def _nova_versao():
+    # Baseada no relógio: se a versão for descartada do cache, a nova
+    # nunca coincide com a de respostas antigas ainda guardadas
+    return time.time_ns()
+
+
+def versoes(modelos):
+    """Versão atual de cada modelo, criando as que ainda não existem"""
+    chaves = [_chave_versao(modelo) for modelo in modelos]
+    atuais = cache.get_many(chaves)
+    faltando = {chave: _nova_versao() for chave in chaves if chave not in atuais}
+    if faltando:
+        cache.set_many(faltando, None)
+        atuais.update(faltando)
+    return [atuais[chave] for chave in chaves]
+
+
+async def aversoes(modelos):
+    """Versão assíncrona de versoes"""
+    chaves = [_chave_versao(modelo) for modelo in modelos]
+    atuais = await cache.aget_many(chaves)
+    faltando = {chave: _nova_versao() for chave in chaves if chave not in atuais}
+    if faltando:
+        await cache.aset_many(faltando, None)
+        atuais.update(faltando)
+    return [atuais[chave] for chave in chaves]
+
+
+def invalidar(modelo):
+    """Muda a versão do modelo, descartando as respostas que dependem dele"""
+    chave = _chave_versao(modelo)
+    try:
+        cache.incr(chave)
+    except ValueError:
+        cache.set(chave, _nova_versao(), None)
+    cache.set(_chave_modificacao(modelo), int(time.time()), None)
+
+
+def _pendentes():
+    if not hasattr(_local, 'modelos'):
+        _local.modelos = set()
+    return _local.modelos
+
+
+def _invalidar_pendentes():
+    modelos = set(_pendentes())
+    _pendentes().clear()
+    for modelo in modelos:
+        invalidar(modelo)
+
+
+def invalidar_apos_commit(modelo):
+    """
+    Muda a versão do modelo depois do commit da transação atual (na hora,
+    fora de uma transação). Antes do commit, uma leitura concorrente ainda vê
+    as linhas antigas e as guardaria em cache sob a versão nova. Os modelos se
+    acumulam até o primeiro callback, como em relatorios.agendar_recalculo.
+    """
+    _pendentes().add(modelo)
+    transaction.on_commit(_invalidar_pendentes, robust=True)
+
+
+def estado(modelos):
+    """
+    (versões, última modificação em segundos) dos modelos, sem consultar o
+    banco. Modelo sem data guardada (cache novo ou descartado) conta como
+    modificado agora: o Last-Modified nunca fica anterior a uma gravação.
+    """
+    atuais = versoes(modelos)
+    chaves = [_chave_modificacao(modelo) for modelo in modelos]
+    datas = cache.get_many(chaves)
+    faltando = {chave: int(time.time()) for chave in chaves if chave not in datas}
+    if faltando:
+        cache.set_many(faltando, None)
+        datas.update(faltando)
+    return atuais, max(datas.values())
+
+
+def _montar_chave(nome, versoes_modelos, partes):
+    assinatura = ':'.join(str(parte) for parte in [*versoes_modelos, *partes])
+    return f'{PREFIXO}:{nome}:{hashlib.md5(assinatura.encode()).hexdigest()}'
+
+
+def chave(nome, modelos, *partes):
+    """Monta a chave de cache de `nome` atrelada às versões dos modelos"""
+    return _montar_chave(nome, versoes(modelos), partes)
+
+
+async def achave(nome, modelos, *partes):
+    """Versão assíncrona de chave"""
+    return _montar_chave(nome, await aversoes(modelos), partes)
+
+
+def _incrementar(chave_contador):
+    try:
+        cache.incr(chave_contador)
+    except ValueError:
+        cache.set(chave_contador, 1, None)
+
+
+async def _aincrementar(chave_contador):
+    try:
+        await cache.aincr(chave_contador)
+    except ValueError:
+        await cache.aset(chave_contador, 1, None)
+
+
+def registrar_acesso(acerto):
+    """Contabiliza um acerto ou uma falha do cache"""
+    _incrementar(CHAVE_ACERTOS if acerto else CHAVE_FALHAS)
+
+
+async def aregistrar_acesso(acerto):
+    """Versão assíncrona de registrar_acesso"""
+    await _aincrementar(CHAVE_ACERTOS if acerto else CHAVE_FALHAS)
+
+
+def estatisticas():
+    """
+    Acertos, falhas e taxa de acerto acumulados (de todos os processos só
+    com um cache compartilhado; no LocMemCache, os deste processo)
+    """
+    contadores = cache.get_many([CHAVE_ACERTOS, CHAVE_FALHAS])
+    acertos = contadores.get(CHAVE_ACERTOS, 0)
+    falhas = contadores.get(CHAVE_FALHAS, 0)
+    total = acertos + falhas
+    return {
+        'acertos': acertos,
+        'falhas': falhas,
+        'taxa_acerto': round(acertos / total, 4) if total else None,
+    }
+
+
+class RespostaEmCacheMixin:
+    """
+    Guarda em cache as respostas GET das ações em `cache_acoes`.
+
+    A chave inclui a versão de cada modelo em `cache_modelos`, que muda
+    depois do commit de cada gravação (ver signals.py), então nenhuma
+    resposta obsoleta é servida. Isso só vale com o cache compartilhado por
+    todos os processos que gravam no banco (ver compartilhado()); sem ele,
+    as respostas não são guardadas.
+    """
+    cache_acoes = ()
+    cache_modelos = ()
+    cache_timeout = None
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method == 'GET' and self.action_map.get('get') in self.cache_acoes and compartilhado():
+            self.get = partial(self._resposta_em_cache, self.get)
+        return super().dispatch(request, *args, **kwargs)
+
+    def _resposta_em_cache(self, handler, request, *args, **kwargs):
+        chave_resposta = chave(
+            f'resposta:{self.basename}:{self.action}', self.cache_modelos, request.get_full_path()
+        )
+        guardada = cache.get(chave_resposta)
+        registrar_acesso(guardada is not None)
+
+        if guardada is not None:
+            cabecalhos = guardada['cabecalhos']
+            response = get_conditional_response(
+                request, etag=cabecalhos.get('ETag')
+            ) or Response(guardada['dados'])
+            for cabecalho, valor in cabecalhos.items():
+                response[cabecalho] = valor
+            response['X-Cache'] = 'HIT'
+            return response
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            timeout = self.cache_timeout or settings.API_CACHE_TIMEOUT
+            cache.set(chave_resposta, {
+                'dados': response.data,
+                'cabecalhos': {
+                    cabecalho: response[cabecalho]
+                    for cabecalho in CABECALHOS_GUARDADOS if cabecalho in response
+                },
+            }, timeout)
+        response['X-Cache'] = 'MISS'
+        return response
@@ -0,0 +1,129 @@
+"""
+Respostas parciais (sparse fieldsets): `?fields=id,nome` devolve só os
+campos listados e `?omit=observacoes` remove campos da resposta.
+
+O serializer descarta os campos não pedidos e a view carrega do banco só
+as colunas (e os JOINs) que os campos restantes usam, com .only().
+"""
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.serializers import ListSerializer, SerializerMethodField
+
+PARAMETRO_CAMPOS = 'fields'
+PARAMETRO_OMITIR = 'omit'
+
+
+def ler_lista(params, nome):
+    """Nomes separados por vírgula em `nome`, ou None se o parâmetro não veio"""
+    if nome not in params:
+        return None
+    return {campo.strip() for campo in params[nome].split(',') if campo.strip()}
+
+
+def campos_pedidos(params, nomes):
+    """Os nomes (na ordem recebida) que sobram depois de ?fields= e ?omit="""
+    escolhidos = ler_lista(params, PARAMETRO_CAMPOS)
+    omitidos = ler_lista(params, PARAMETRO_OMITIR) or set()
+    return [nome for nome in nomes if (escolhidos is None or nome in escolhidos) and nome not in omitidos]
+
+
+class CamposDinamicosMixin:
+    """
+    Filtra os campos do serializer principal da requisição (GET) por
+    ?fields= e ?omit=. Nomes desconhecidos são ignorados.
+
+    Campos de método (SerializerMethodField) precisam declarar em
+    `Meta.colunas_por_metodo` as colunas que leem; sem isso a view não
+    restringe as colunas carregadas.
+    """
+
+    def get_fields(self):
+        campos = super().get_fields()
+        request = self.context.get('request')
+        if request is None or request.method not in SAFE_METHODS or not self._principal():
+            return campos
+
+        pedidos = set(campos_pedidos(request.query_params, campos))
+        return {nome: campo for nome, campo in campos.items() if nome in pedidos}
+
+    def _principal(self):
+        # Serializer da view (ou o filho do ListSerializer da listagem), não um aninhado
+        return self.parent is None or (isinstance(self.parent, ListSerializer) and self.parent.parent is None)
+
+
+def _caminho(modelo, atributos):
+    """
+    Converte os atributos de `source` (['pet', 'cliente', 'nome']) no lookup
+    'pet__cliente__nome'. Retorna (lookup, relações percorridas) ou None se
+    algum atributo não for uma coluna do modelo.
+    """
+    nomes = []
+    relacoes = []
+    for posicao, atributo in enumerate(atributos):
+        if atributo.startswith('get_') and atributo.endswith('_display') and posicao == len(atributos) - 1:
+            atributo = atributo[len('get_'):-len('_display')]
+        try:
+            campo = modelo._meta.get_field(atributo)
+        except FieldDoesNotExist:
+            return None
+        if not campo.concrete or campo.many_to_many:
+            return None
+        nomes.append(atributo)
+        if posicao < len(atributos) - 1:
+            if not campo.many_to_one and not campo.one_to_one:
+                return None
+            relacoes.append('__'.join(nomes))
+            modelo = campo.related_model
+    return '__'.join(nomes), relacoes
+
+
+def colunas_necessarias(serializer, modelo, extras=()):
+    """
+    Colunas e relações (para select_related) usadas pelos campos do
+    serializer, ou None quando algum campo não pode ser mapeado com segurança.
+    """
+    colunas = {modelo._meta.pk.name, *extras}
+    relacoes = set()
+    colunas_por_metodo = getattr(getattr(serializer, 'Meta', None), 'colunas_por_metodo', {})
+    for nome, campo in serializer.fields.items():
+        if isinstance(campo, SerializerMethodField):
+            if nome not in colunas_por_metodo:
+                return None
+            colunas.update(colunas_por_metodo[nome])
+            continue
+        if campo.source == '*':
+            return None
+        caminho = _caminho(modelo, campo.source_attrs)
+        if caminho is None:
+            return None
+        lookup, percorridas = caminho
+        colunas.add(lookup)
+        relacoes.update(percorridas)
+    # O FK de cada relação carregada também precisa vir na consulta
+    return colunas | relacoes, relacoes
+
+
+class CamposEsparsosMixin:
+    """
+    Com ?fields= ou ?omit=, list e retrieve carregam só as colunas usadas
+    pelos campos que sobraram no serializer e só fazem os JOINs necessários.
+    """
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        params = self.request.query_params
+        if self.action not in ('list', 'retrieve') or (
+            PARAMETRO_CAMPOS not in params and PARAMETRO_OMITIR not in params
+        ):
+            return queryset
+
+        # A paginação keyset lê os campos de ordenação da última linha da página
+        extras = getattr(self.pagination_class, 'ordenacao_keyset', ())
+        necessarias = colunas_necessarias(self.get_serializer(), queryset.model, extras)
+        if necessarias is None:
+            return queryset
+        colunas, relacoes = necessarias
+        queryset = queryset.select_related(None)
+        if relacoes:
+            queryset = queryset.select_related(*relacoes)
+        return queryset.only(*colunas)
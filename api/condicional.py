@@ -0,0 +1,63 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from . import cache as cache_api
+
+
+def modelos_envolvidos(modelo, relacionados=()):
+    """O modelo e os modelos alcançados pelos caminhos em `relacionados` (ex.: 'pet__cliente')"""
+    modelos = [modelo]
+    for caminho in relacionados:
+        atual = modelo
+        for nome in caminho.split('__'):
+            atual = atual._meta.get_field(nome).related_model
+        modelos.append(atual)
+    return list(dict.fromkeys(modelos))
+
+
+def validadores(modelos, *partes):
+    """
+    Calcula (etag, last_modified) a partir das versões dos modelos no cache,
+    que mudam a cada gravação (ver signals.py): nenhuma consulta ao banco.
+    """
+    versoes, last_modified = cache_api.estado(modelos)
+    texto = ':'.join(str(valor) for valor in [*versoes, *partes])
+    etag = quote_etag(hashlib.md5(texto.encode()).hexdigest())
+    return etag, last_modified
+
+
+class RespostaCondicionalMixin:
+    """
+    Emite ETag e Last-Modified em list e retrieve e responde 304 a
+    If-None-Match / If-Modified-Since antes de qualquer consulta.
+
+    Os validadores vêm das versões por modelo do cache de respostas: o
+    modelo da view e os de `condicional_relacionados`, as relações cujos
+    dados aparecem no serializer (ex.: nome do pet em um agendamento), para
+    que alterações nelas também mudem o ETag. Sem um cache compartilhado
+    entre os processos as versões não são confiáveis e a resposta sai sem
+    validadores.
+    """
+    condicional_relacionados = ()
+
+    def list(self, request, *args, **kwargs):
+        return self._resposta_condicional(request, super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._resposta_condicional(request, super().retrieve, request, *args, **kwargs)
+
+    def _resposta_condicional(self, request, gerar, *args, **kwargs):
+        if not cache_api.compartilhado():
+            return gerar(*args, **kwargs)
+        etag, last_modified = validadores(
+            modelos_envolvidos(self.get_queryset().model, self.condicional_relacionados),
+            request.get_full_path(), request.accepted_media_type
+        )
+        nao_modificado = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        response = nao_modificado or gerar(*args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+        return response
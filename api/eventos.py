@@ -0,0 +1,164 @@
+"""
+Feed de alterações da agenda.
+
+Cada gravação de agendamento registra um EventoAgenda na mesma transação
+(ver signals.py e as ações em lote); o id do evento é a posição no feed.
+Os clientes recebem os eventos por Server-Sent Events e, ao reconectar,
+retomam do último id recebido (cabeçalho Last-Event-ID ou ?desde=).
+
+Para que ler "id > último recebido" nunca pule eventos, os ids precisam ser
+confirmados em ordem: a inserção de eventos é serializada até o fim da
+transação (ver bloquear_feed), então nenhuma transação gera um id enquanto
+outra com id menor ainda não confirmou. O registro de alterações da
+sincronização (sincronizacao.py) usa o mesmo bloqueio.
+"""
+import asyncio
+import json
+import time
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, router, transaction
+
+from .models import EventoAgenda
+
+# Chave do advisory lock (PostgreSQL) que ordena as inserções no feed e no
+# registro de alterações da sincronização.
+# Chaves de 64 bits não colidem com as de (serviço, dia) de agenda.bloquear_agenda
+CHAVE_BLOQUEIO_FEED = 0x4645454441474e44
+
+# Eventos por leitura do feed
+LIMITE_EVENTOS = 100
+
+# Fluxo SSE: intervalo entre consultas, comentário de keep-alive e duração
+# máxima da conexão (o navegador reconecta sozinho com Last-Event-ID)
+INTERVALO_CONSULTA = 1
+INTERVALO_PING = 15
+DURACAO_CONEXAO = 300
+RECONEXAO_MS = 3000
+
+
+def _serializar(agendamento):
+    from .serializers import AgendamentoSerializer
+
+    return AgendamentoSerializer(agendamento).data
+
+
+def _evento(agendamento, tipo, status_anterior=None):
+    return EventoAgenda(
+        agendamento_id=agendamento.id,
+        tipo=tipo,
+        status_anterior=status_anterior or '',
+        dados={'id': agendamento.id} if tipo == 'excluido' else _serializar(agendamento),
+    )
+
+
+def bloquear_feed(conexao):
+    """
+    Segura a inserção de eventos e de alterações da sincronização até o fim
+    da transação atual (deve ser chamada dentro de atomic()). No PostgreSQL
+    usa um advisory lock; o SQLite já serializa as escritas. São as últimas
+    gravações da transação, então o bloqueio dura só até o commit; quem
+    também bloqueia a agenda deve fazê-lo antes (agenda.bloquear_agenda).
+    """
+    if conexao.vendor == 'postgresql':
+        with conexao.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [CHAVE_BLOQUEIO_FEED])
+
+
+def registrar(agendamento, tipo, status_anterior=None):
+    """Registra uma alteração de um agendamento"""
+    evento = _evento(agendamento, tipo, status_anterior)
+    banco = router.db_for_write(EventoAgenda)
+    with transaction.atomic(using=banco, savepoint=False):
+        bloquear_feed(connections[banco])
+        evento.save(using=banco)
+
+
+def registrar_em_lote(agendamentos, tipo, status_anteriores=None):
+    """
+    Registra com um único INSERT as alterações feitas por bulk_create/update,
+    que não disparam sinais. `status_anteriores` mapeia id -> status.
+    """
+    status_anteriores = status_anteriores or {}
+    novos = [
+        _evento(agendamento, tipo, status_anteriores.get(agendamento.id))
+        for agendamento in agendamentos
+    ]
+    if not novos:
+        return
+    banco = router.db_for_write(EventoAgenda)
+    with transaction.atomic(using=banco, savepoint=False):
+        bloquear_feed(connections[banco])
+        EventoAgenda.objects.using(banco).bulk_create(novos)
+
+
+def publicados(desde, limite=LIMITE_EVENTOS):
+    """
+    Eventos posteriores a `desde`. Como os ids são confirmados em ordem, um
+    evento que ainda não aparece terá id maior que todos os já lidos,
+    qualquer que seja a sua data_criacao.
+    """
+    return EventoAgenda.objects.filter(id__gt=desde).order_by('id')[:limite]
+
+
+def _posicao_atual():
+    return EventoAgenda.objects.order_by('-id').values_list('id', flat=True)
+
+
+def posicao_atual():
+    """Último evento publicado: de onde um cliente recém-carregado deve seguir"""
+    return _posicao_atual().first() or 0
+
+
+async def aposicao_atual():
+    """Versão assíncrona de posicao_atual"""
+    return await _posicao_atual().afirst() or 0
+
+
+def ler_posicao(request):
+    """Posição informada pelo cliente (Last-Event-ID ou ?desde=), ou None"""
+    valor = request.headers.get('Last-Event-ID') or request.GET.get('desde')
+    if valor is None:
+        return None
+    posicao = int(valor)
+    if posicao < 0:
+        raise ValueError(valor)
+    return posicao
+
+
+def como_dict(evento):
+    return {
+        'id': evento.id,
+        'tipo': evento.tipo,
+        'agendamento_id': evento.agendamento_id,
+        'status_anterior': evento.status_anterior,
+        'dados': evento.dados,
+        'data_criacao': evento.data_criacao,
+    }
+
+
+def formatar_sse(evento):
+    dados = json.dumps(como_dict(evento), cls=DjangoJSONEncoder, ensure_ascii=False)
+    return f'id: {evento.id}\nevent: {evento.tipo}\ndata: {dados}\n\n'
+
+
+async def fluxo(desde):
+    """Gera o fluxo SSE a partir da posição `desde` até DURACAO_CONEXAO"""
+    yield f'retry: {RECONEXAO_MS}\n\n'
+    inicio = ultimo_envio = time.monotonic()
+
+    while time.monotonic() - inicio < DURACAO_CONEXAO:
+        eventos = [evento async for evento in publicados(desde)]
+        for evento in eventos:
+            yield formatar_sse(evento)
+            desde = evento.id
+
+        if eventos:
+            ultimo_envio = time.monotonic()
+            if len(eventos) == LIMITE_EVENTOS:
+                continue
+        elif time.monotonic() - ultimo_envio >= INTERVALO_PING:
+            yield ': ping\n\n'
+            ultimo_envio = time.monotonic()
+
+        await asyncio.sleep(INTERVALO_CONSULTA)
@@ -0,0 +1,293 @@
+"""
+Instrumentação por requisição: consultas SQL, tempo de banco, tempo da
+view, tempo de renderização e tempo total.
+
+Cada resposta recebe um cabeçalho Server-Timing; os totais por rota ficam
+agregados em memória (por processo) e são expostos no formato de texto do
+Prometheus em /api/interno/metricas/. Consultas repetidas na mesma
+requisição (N+1) são registradas no log com o trecho do código que as fez.
+
+Com vários workers (gunicorn -w N), cada processo tem os próprios totais e
+o endpoint devolve os do worker que atendeu a requisição: o Prometheus deve
+coletar cada worker separadamente (ou a API rodar com um único processo por
+instância), usando o rótulo `pid` de api_processo_info para distingui-los.
+"""
+import logging
+import os
+import threading
+import time
+import traceback
+from collections import Counter, defaultdict
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+
+from . import cache as cache_api
+
+logger = logging.getLogger(__name__)
+
+# Limites (segundos) do histograma de tempo total
+LIMITES_HISTOGRAMA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+# Trechos de código ignorados ao procurar quem fez a consulta
+IGNORAR_NO_RASTREIO = (os.sep + 'django' + os.sep, os.sep + 'rest_framework' + os.sep, __file__)
+
+
+def percentil(valores, p):
+    """Percentil p (0-100) de uma lista já ordenada"""
+    if not valores:
+        return 0.0
+    return valores[min(len(valores) - 1, round(p / 100 * (len(valores) - 1)))]
+
+
+class RegistroConsultas:
+    """
+    execute_wrapper que mede as consultas de uma requisição e detecta
+    repetições (sem `limiar_duplicadas`, só conta e cronometra)
+    """
+
+    def __init__(self, limiar_duplicadas=None):
+        self.total = 0
+        self.tempo = 0.0
+        self.limiar_duplicadas = limiar_duplicadas
+        self.contagem = Counter()
+        self.origens = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.tempo += time.perf_counter() - inicio
+            self.total += 1
+            if self.limiar_duplicadas:
+                # O SQL vem parametrizado: o mesmo texto com parâmetros diferentes é a mesma consulta
+                self.contagem[sql] += 1
+                if self.contagem[sql] == self.limiar_duplicadas:
+                    self.origens[sql] = origem_da_consulta()
+
+    @property
+    def duplicadas(self):
+        """{sql: (repetições, origem)} das consultas que atingiram o limiar"""
+        return {sql: (self.contagem[sql], origem) for sql, origem in self.origens.items()}
+
+
+def origem_da_consulta():
+    """Primeiro trecho do projeto (fora do Django/DRF) na pilha da consulta"""
+    for quadro in reversed(traceback.extract_stack()[:-2]):
+        if quadro.filename.startswith(str(settings.BASE_DIR)) and not any(
+            trecho in quadro.filename for trecho in IGNORAR_NO_RASTREIO
+        ):
+            return f'{os.path.relpath(quadro.filename, settings.BASE_DIR)}:{quadro.lineno} em {quadro.name}'
+    return 'desconhecida'
+
+
+class Metricas:
+    """Totais por (rota, método), protegidos por lock (os workers podem ter threads)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.limpar()
+
+    def limpar(self):
+        with self.lock:
+            self.requisicoes = Counter()
+            self.consultas = Counter()
+            self.duplicadas = Counter()
+            self.segundos = defaultdict(float)
+            self.histograma = defaultdict(lambda: [0] * len(LIMITES_HISTOGRAMA))
+
+    def registrar(self, rota, metodo, status, tempos, consultas, duplicadas):
+        chave = (rota, metodo)
+        with self.lock:
+            self.requisicoes[(rota, metodo, status)] += 1
+            self.consultas[chave] += consultas
+            self.duplicadas[chave] += duplicadas
+            for fase, segundos in tempos.items():
+                self.segundos[(rota, metodo, fase)] += segundos
+            baldes = self.histograma[chave]
+            for posicao, limite in enumerate(LIMITES_HISTOGRAMA):
+                if tempos['total'] <= limite:
+                    baldes[posicao] += 1
+
+    def prometheus(self):
+        """Métricas no formato de texto do Prometheus"""
+        def rotulos(**valores):
+            return '{' + ','.join(f'{nome}="{valor}"' for nome, valor in valores.items()) + '}'
+
+        linhas = [
+            '# HELP api_processo_info Processo que respondeu (os totais abaixo são só deste processo)',
+            '# TYPE api_processo_info gauge',
+            f'api_processo_info{rotulos(pid=os.getpid())} 1',
+        ]
+        with self.lock:
+            linhas.append('# HELP api_requisicoes_total Requisições atendidas')
+            linhas.append('# TYPE api_requisicoes_total counter')
+            for (rota, metodo, status), total in sorted(self.requisicoes.items()):
+                linhas.append(f'api_requisicoes_total{rotulos(rota=rota, metodo=metodo, status=status)} {total}')
+
+            linhas.append('# HELP api_consultas_total Consultas SQL executadas')
+            linhas.append('# TYPE api_consultas_total counter')
+            for (rota, metodo), total in sorted(self.consultas.items()):
+                linhas.append(f'api_consultas_total{rotulos(rota=rota, metodo=metodo)} {total}')
+
+            linhas.append('# HELP api_consultas_duplicadas_total Consultas repetidas na mesma requisição')
+            linhas.append('# TYPE api_consultas_duplicadas_total counter')
+            for (rota, metodo), total in sorted(self.duplicadas.items()):
+                linhas.append(f'api_consultas_duplicadas_total{rotulos(rota=rota, metodo=metodo)} {total}')
+
+            linhas.append('# HELP api_tempo_segundos_total Tempo acumulado por fase (db, view, render, total)')
+            linhas.append('# TYPE api_tempo_segundos_total counter')
+            for (rota, metodo, fase), segundos in sorted(self.segundos.items()):
+                linhas.append(
+                    f'api_tempo_segundos_total{rotulos(rota=rota, metodo=metodo, fase=fase)} {segundos:.6f}'
+                )
+
+            linhas.append('# HELP api_duracao_segundos Tempo total das requisições')
+            linhas.append('# TYPE api_duracao_segundos histogram')
+            for (rota, metodo), baldes in sorted(self.histograma.items()):
+                quantidade = sum(
+                    total for (r, m, _), total in self.requisicoes.items() if (r, m) == (rota, metodo)
+                )
+                for limite, total in zip(LIMITES_HISTOGRAMA, baldes):
+                    linhas.append(f'api_duracao_segundos_bucket{rotulos(rota=rota, metodo=metodo, le=limite)} {total}')
+                linhas.append(f'api_duracao_segundos_bucket{rotulos(rota=rota, metodo=metodo, le="+Inf")} {quantidade}')
+                linhas.append(f'api_duracao_segundos_count{rotulos(rota=rota, metodo=metodo)} {quantidade}')
+                linhas.append(
+                    f'api_duracao_segundos_sum{rotulos(rota=rota, metodo=metodo)} '
+                    f'{self.segundos[(rota, metodo, "total")]:.6f}'
+                )
+
+        estatisticas = cache_api.estatisticas()
+        linhas.append('# HELP api_cache_acessos_total Acessos ao cache de respostas da API')
+        linhas.append('# TYPE api_cache_acessos_total counter')
+        linhas.append(f'api_cache_acessos_total{rotulos(resultado="acerto")} {estatisticas["acertos"]}')
+        linhas.append(f'api_cache_acessos_total{rotulos(resultado="falha")} {estatisticas["falhas"]}')
+        return '\n'.join(linhas) + '\n'
+
+
+metricas = Metricas()
+
+
+def _instalar(registro):
+    for conexao in connections.all():
+        conexao.execute_wrappers.append(registro)
+
+
+def _remover(registro):
+    for conexao in connections.all():
+        conexao.execute_wrappers.remove(registro)
+
+
+class InstrumentacaoMiddleware:
+    """
+    Mede cada requisição e adiciona o cabeçalho Server-Timing:
+    db (tempo e número de consultas), view (Python da view, sem o banco,
+    incluindo a serialização), render (codificação da resposta) e total.
+    Deve ser o primeiro middleware, para que o total inclua os demais.
+
+    Funciona nos dois modos: sob ASGI as views assíncronas (e o feed SSE)
+    continuam no event loop, sem passar por uma thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.ativo = getattr(settings, 'INSTRUMENTACAO_ATIVA', True)
+        self.limiar_duplicadas = getattr(settings, 'INSTRUMENTACAO_LIMIAR_DUPLICADAS', 3)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.ativo:
+            return self.get_response(request)
+
+        registro = RegistroConsultas(self.limiar_duplicadas)
+        request._instrumentacao = {}
+        inicio = time.perf_counter()
+        _instalar(registro)
+        try:
+            response = self.get_response(request)
+        finally:
+            _remover(registro)
+        return self._registrar(request, response, registro, inicio)
+
+    async def __acall__(self, request):
+        if not self.ativo:
+            return await self.get_response(request)
+
+        registro = RegistroConsultas(self.limiar_duplicadas)
+        request._instrumentacao = {}
+        inicio = time.perf_counter()
+        # O ORM assíncrono executa as consultas na thread das chamadas
+        # thread_sensitive da requisição: o wrapper é instalado nas conexões dela
+        await sync_to_async(_instalar)(registro)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(_remover)(registro)
+        return self._registrar(request, response, registro, inicio)
+
+    def _registrar(self, request, response, registro, inicio):
+        fim = time.perf_counter()
+        marcas = request._instrumentacao
+        inicio_view = marcas.get('inicio_view', inicio)
+        fim_view = marcas.get('fim_view', fim)
+        tempos = {
+            'db': registro.tempo,
+            'view': max(0.0, fim_view - inicio_view - registro.tempo),
+            'render': fim - fim_view if 'fim_view' in marcas else 0.0,
+            'total': fim - inicio,
+        }
+
+        duplicadas = registro.duplicadas
+        for sql, (repeticoes, origem) in duplicadas.items():
+            logger.warning(
+                'Consulta repetida %d vezes em %s %s (origem: %s): %s',
+                repeticoes, request.method, request.path, origem, sql[:300]
+            )
+
+        rota = request.resolver_match.view_name if request.resolver_match else 'nao_encontrada'
+        metricas.registrar(
+            rota, request.method, response.status_code, tempos, registro.total, len(duplicadas)
+        )
+
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={tempos["db"] * 1000:.1f};desc="{registro.total} consultas'
+            + (f', {len(duplicadas)} repetidas' if duplicadas else '') + '"',
+            f'view;dur={tempos["view"] * 1000:.1f}',
+            f'render;dur={tempos["render"] * 1000:.1f}',
+            f'total;dur={tempos["total"] * 1000:.1f}',
+        ])
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if self.ativo:
+            request._instrumentacao['inicio_view'] = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # Chamado logo antes de renderizar a resposta do DRF
+        if self.ativo:
+            request._instrumentacao['fim_view'] = time.perf_counter()
+        return response
+
+
+def metricas_prometheus(request):
+    """
+    Métricas agregadas deste processo (cada worker do gunicorn tem as suas;
+    ver o início do módulo). Exige o cabeçalho
+    `Authorization: Bearer <METRICAS_TOKEN>` quando o token está configurado;
+    sem token, só responde para INTERNAL_IPS.
+    """
+    token = getattr(settings, 'METRICAS_TOKEN', '')
+    if token:
+        autorizado = request.headers.get('Authorization') == f'Bearer {token}'
+    else:
+        autorizado = request.META.get('REMOTE_ADDR') in getattr(settings, 'INTERNAL_IPS', ['127.0.0.1'])
+    if not autorizado:
+        return HttpResponseForbidden()
+    return HttpResponse(metricas.prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
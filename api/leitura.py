@@ -0,0 +1,206 @@
+"""
+Listagem rápida: as linhas das listas são montadas direto de .values(),
+sem o to_representation campo a campo do serializer.
+
+O plano de leitura sai dos campos do próprio serializer (coluna de cada
+campo, rótulos das choices, conversão de datas), então a saída é idêntica
+à do serializer. Um serializer com algum campo que o plano não sabe
+reproduzir continua usando o caminho normal.
+"""
+from functools import cache
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.response import Response
+from rest_framework.settings import ISO_8601, api_settings
+
+from .campos import campos_pedidos
+
+# Campos cujo valor lido do banco já é a representação do DRF
+CAMPOS_SEM_CONVERSAO = (
+    serializers.IntegerField,
+    serializers.BooleanField,
+    serializers.CharField,
+    serializers.ChoiceField,
+)
+
+# Campos convertidos pelo próprio to_representation (não dependem do contexto)
+CAMPOS_CONVERTIDOS = (
+    serializers.DecimalField,
+    serializers.DateField,
+    serializers.TimeField,
+    serializers.FloatField,
+)
+
+
+def _coluna(modelo, atributos):
+    """
+    Lookup de .values() para os atributos de `source`, o campo do modelo
+    e, para get_X_display, os rótulos das choices. None se não for uma
+    coluna alcançável só por relações obrigatórias.
+    """
+    nomes = []
+    rotulos = None
+    for posicao, atributo in enumerate(atributos):
+        ultimo = posicao == len(atributos) - 1
+        exibicao = ultimo and atributo.startswith('get_') and atributo.endswith('_display')
+        if exibicao:
+            atributo = atributo[len('get_'):-len('_display')]
+        try:
+            campo = modelo._meta.get_field(atributo)
+        except FieldDoesNotExist:
+            return None
+        if not campo.concrete or campo.many_to_many:
+            return None
+        nomes.append(atributo)
+        if not ultimo:
+            # Relação nula levaria o serializer a outro caminho (valor padrão ou erro)
+            if not (campo.many_to_one or campo.one_to_one) or campo.null:
+                return None
+            modelo = campo.related_model
+        elif exibicao:
+            if not campo.choices:
+                return None
+            rotulos = {valor: str(rotulo) for valor, rotulo in campo.flatchoices}
+    return '__'.join(nomes), campo, rotulos
+
+
+def _rotulo(rotulos):
+    return lambda valor: rotulos.get(valor, str(valor))
+
+
+def _data_hora(campo, fuso):
+    # Como DateTimeField.to_representation em ISO 8601, com o fuso resolvido uma vez
+    def converter(valor):
+        if valor.tzinfo is None or fuso is None:
+            return campo.to_representation(valor)
+        texto = valor.astimezone(fuso).isoformat()
+        return texto[:-6] + 'Z' if texto.endswith('+00:00') else texto
+    return converter
+
+
+class PlanoLeitura:
+    """Colunas de .values() e a conversão de cada campo da resposta"""
+
+    def __init__(self, campos, anotacoes=()):
+        # (nome na resposta, coluna, campo do serializer, conversão)
+        self.campos = campos
+        # Anotações do queryset lidas pelos campos de método
+        self.anotacoes = set(anotacoes)
+
+    @property
+    def colunas(self):
+        return list(dict.fromkeys(coluna for _, coluna, _, _ in self.campos))
+
+    def filtrar(self, params):
+        """Plano só com os campos pedidos em ?fields= / ?omit="""
+        nomes = set(campos_pedidos(params, [nome for nome, _, _, _ in self.campos]))
+        return PlanoLeitura([campo for campo in self.campos if campo[0] in nomes], self.anotacoes)
+
+    def _conversores(self):
+        fuso = timezone.get_current_timezone() if settings.USE_TZ else None
+        conversores = []
+        for nome, _, campo, conversao in self.campos:
+            if isinstance(conversao, dict):
+                conversores.append((nome, _rotulo(conversao)))
+            elif conversao == 'data_hora':
+                conversores.append((nome, _data_hora(campo, getattr(campo, 'timezone', fuso))))
+            elif conversao == 'campo':
+                conversores.append((nome, campo.to_representation))
+        return conversores
+
+    def linhas(self, registros):
+        """Converte os dicionários de .values() nas linhas da resposta"""
+        pares = [(nome, coluna) for nome, coluna, _, _ in self.campos]
+        conversores = self._conversores()
+        resultado = []
+        for registro in registros:
+            linha = {nome: registro[coluna] for nome, coluna in pares}
+            for nome, converter in conversores:
+                valor = linha[nome]
+                if valor is not None:
+                    linha[nome] = converter(valor)
+            resultado.append(linha)
+        return resultado
+
+
+def _conversao(campo, campo_modelo, rotulos):
+    """Como converter o valor lido do banco, ou None se o plano não souber reproduzir o campo"""
+    if rotulos is not None:
+        return rotulos if isinstance(campo, serializers.CharField) else None
+    if campo_modelo.is_relation:
+        # Só o id da relação; um objeto relacionado viraria str(objeto)
+        if isinstance(campo, serializers.PrimaryKeyRelatedField) and campo.pk_field is None:
+            return 'valor'
+        return None
+    if isinstance(campo, serializers.DateTimeField):
+        formato = getattr(campo, 'format', api_settings.DATETIME_FORMAT)
+        return 'data_hora' if formato == ISO_8601 else 'campo'
+    if isinstance(campo, serializers.CharField) and not isinstance(campo_modelo, (models.CharField, models.TextField)):
+        return 'campo'
+    if isinstance(campo, CAMPOS_SEM_CONVERSAO):
+        return 'valor'
+    if isinstance(campo, CAMPOS_CONVERTIDOS):
+        return 'campo'
+    return None
+
+
+@cache
+def plano_do_serializer(serializer_class):
+    """
+    Plano com todos os campos do serializer, ou None se algum deles não
+    puder ser lido de .values() com o mesmo resultado.
+
+    Campos de método só entram se estiverem em `Meta.metodos_anotados`
+    (o método devolve a anotação de mesmo nome do queryset).
+    """
+    serializer = serializer_class()
+    metodos_anotados = getattr(serializer.Meta, 'metodos_anotados', ())
+    campos = []
+    anotacoes = []
+    for nome, campo in serializer.fields.items():
+        if campo.write_only:
+            continue
+        if isinstance(campo, serializers.SerializerMethodField):
+            if nome not in metodos_anotados:
+                return None
+            campos.append((nome, nome, campo, 'valor'))
+            anotacoes.append(nome)
+            continue
+        if campo.source == '*':
+            return None
+        coluna = _coluna(serializer.Meta.model, campo.source_attrs)
+        conversao = coluna and _conversao(campo, coluna[1], coluna[2])
+        if conversao is None:
+            return None
+        campos.append((nome, coluna[0], campo, conversao))
+    return PlanoLeitura(campos, anotacoes)
+
+
+class ListagemRapidaMixin:
+    """
+    `list` lê as linhas com .values() segundo o plano do serializer e
+    pagina os dicionários (inclusive na paginação keyset). Desligado com
+    LISTAGEM_RAPIDA = False ou quando o serializer não tem plano.
+    """
+
+    def list(self, request, *args, **kwargs):
+        plano = None
+        if getattr(settings, 'LISTAGEM_RAPIDA', True):
+            plano = plano_do_serializer(self.get_serializer_class())
+        queryset = self.filter_queryset(self.get_queryset())
+        if plano is None or not plano.anotacoes <= set(queryset.query.annotations):
+            return super().list(request, *args, **kwargs)
+
+        plano = plano.filtrar(request.query_params)
+        # A paginação keyset lê os campos de ordenação da última linha
+        extras = getattr(self.pagination_class, 'ordenacao_keyset', ())
+        registros = queryset.values(*plano.colunas, *extras)
+
+        pagina = self.paginate_queryset(registros)
+        if pagina is not None:
+            return self.get_paginated_response(plano.linhas(pagina))
+        return Response(plano.linhas(registros))
@@ -0,0 +1,139 @@
+import json
+import statistics
+import time as cronometro
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.utils import timezone
+
+from api.instrumentacao import RegistroConsultas, percentil
+from api.models import Cliente, Pet, Servico
+
+
+class Command(BaseCommand):
+    help = (
+        'Repete as requisições dos principais endpoints da API no próprio processo e mede '
+        'latência (p50/p95/p99) e consultas por requisição; use após o populatedb em volume'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticoes', type=int, default=30, help='Requisições medidas por endpoint')
+        parser.add_argument('--aquecimento', type=int, default=3, help='Requisições descartadas por endpoint')
+        parser.add_argument('--filtro', help='Mede só os endpoints cujo nome contém o texto')
+        parser.add_argument('--salvar', help='Grava os resultados em JSON')
+        parser.add_argument('--comparar', help='JSON de uma execução anterior para mostrar a variação')
+
+    def handle(self, *args, **options):
+        self.cliente_http = Client(
+            HTTP_HOST=settings.ALLOWED_HOSTS[0].lstrip('.') if settings.ALLOWED_HOSTS else 'localhost'
+        )
+        anterior = {}
+        if options['comparar']:
+            with open(options['comparar']) as arquivo:
+                anterior = json.load(arquivo)
+
+        endpoints = [
+            (nome, url) for nome, url in self.endpoints()
+            if not options['filtro'] or options['filtro'] in nome
+        ]
+        if not endpoints:
+            raise CommandError('Nenhum endpoint para medir')
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{'endpoint':<32} {'p50':>9} {'p95':>9} {'p99':>9} {'consultas':>10}"
+        ))
+        resultados = {}
+        for nome, url in endpoints:
+            resultado = self.medir(url, options['repeticoes'], options['aquecimento'])
+            resultados[nome] = resultado
+            linha = (
+                f"{nome:<32} {resultado['p50']:>7.1f}ms {resultado['p95']:>7.1f}ms "
+                f"{resultado['p99']:>7.1f}ms {resultado['consultas']:>10}"
+            )
+            if nome in anterior:
+                variacao = (resultado['p50'] / anterior[nome]['p50'] - 1) * 100 if anterior[nome]['p50'] else 0
+                linha += f"   p50 {variacao:+.0f}% (antes {anterior[nome]['p50']:.1f}ms, {anterior[nome]['consultas']} consultas)"
+            estilo = self.style.ERROR if resultado['erros'] else self.style.SUCCESS
+            self.stdout.write(estilo(linha))
+
+        if options['salvar']:
+            with open(options['salvar'], 'w') as arquivo:
+                json.dump(resultados, arquivo, indent=2)
+            self.stdout.write(f"Resultados gravados em {options['salvar']}")
+
+    def endpoints(self):
+        """Requisições medidas, com ids e datas tirados do próprio banco"""
+        cliente = Cliente.objects.order_by('id').first()
+        pet = Pet.objects.order_by('id').first()
+        servicos = list(Servico.objects.filter(ativo=True).order_by('id').values_list('id', flat=True)[:3])
+        if not (cliente and pet and servicos):
+            raise CommandError('Banco vazio: rode antes o populatedb com --clientes, --pets e --agendamentos')
+
+        dia = timezone.localdate() + timedelta(days=1)
+        semana = dia + timedelta(days=6)
+        ids = ','.join(str(servico_id) for servico_id in servicos)
+        pagina_profunda = max(1, Cliente.objects.count() // 20 // 2)
+        termo = cliente.nome.split()[0]
+
+        return [
+            ('clientes: lista', '/api/clientes/'),
+            ('clientes: página profunda', f'/api/clientes/?page={pagina_profunda}'),
+            ('clientes: cursor', '/api/clientes/?paginacao=cursor'),
+            ('clientes: busca', f'/api/clientes/?search={termo}'),
+            ('clientes: detalhes_completos', f'/api/clientes/{cliente.id}/detalhes_completos/'),
+            ('pets: lista', '/api/pets/'),
+            ('pets: detalhes_completos', f'/api/pets/{pet.id}/detalhes_completos/'),
+            ('servicos: lista', '/api/servicos/'),
+            ('agendamentos: lista', '/api/agendamentos/'),
+            ('agendamentos: cursor', '/api/agendamentos/?paginacao=cursor'),
+            ('agendamentos: por status', '/api/agendamentos/?status=confirmado'),
+            ('agendamentos: hoje', '/api/agendamentos/hoje/'),
+            ('agendamentos: proximos', '/api/agendamentos/proximos/'),
+            ('disponibilidade: dia', f'/api/agendamentos/horarios_disponiveis/?data={dia}&servico_id={servicos[0]}'),
+            ('disponibilidade: semana', (
+                f'/api/agendamentos/horarios_disponiveis/?data_inicio={dia}&data_fim={semana}&servico_ids={ids}'
+            )),
+            ('busca global', f'/api/busca/?q={termo}'),
+            ('dashboard: estatisticas', '/api/dashboard/estatisticas/'),
+            ('dashboard: proximos', '/api/dashboard/proximos_agendamentos/'),
+            ('relatorios: receita', f'/api/relatorios/receita/?ano={dia.year}'),
+            ('relatorios: ocupacao', f'/api/relatorios/ocupacao/?ano={dia.year}&mes={dia.month}'),
+        ]
+
+    def requisitar(self, url):
+        # Conta as consultas sem o custo do registro de DEBUG
+        contador = RegistroConsultas()
+        inicio = cronometro.perf_counter()
+        with connection.execute_wrapper(contador):
+            resposta = self.cliente_http.get(url, secure=True)
+            if resposta.streaming:
+                b''.join(resposta.streaming_content)
+        return (cronometro.perf_counter() - inicio) * 1000, contador.total, resposta.status_code
+
+    def medir(self, url, repeticoes, aquecimento):
+        for _ in range(aquecimento):
+            self.requisitar(url)
+
+        latencias = []
+        consultas = []
+        erros = 0
+        for _ in range(repeticoes):
+            latencia, total, codigo = self.requisitar(url)
+            latencias.append(latencia)
+            consultas.append(total)
+            erros += codigo >= 400
+        latencias.sort()
+
+        return {
+            'url': url,
+            'p50': percentil(latencias, 50),
+            'p95': percentil(latencias, 95),
+            'p99': percentil(latencias, 99),
+            'media': statistics.fmean(latencias),
+            # Pior caso entre as repetições (respostas em cache não consultam o banco)
+            'consultas': max(consultas),
+            'erros': erros,
+        }
@@ -0,0 +1,130 @@
+import json
+import statistics
+import threading
+import time as cronometro
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+from django.db.backends.signals import connection_created
+from django.test import Client
+
+from api.instrumentacao import percentil
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede a latência por requisição no modo de conexão atual (DB_CONEXOES) e quantas conexões '
+        'foram abertas; rode uma vez por modo e compare, ex.: '
+        'DB_CONEXOES=por_requisicao ... --salvar antes.json e DB_CONEXOES=pool ... --comparar antes.json'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url', default='/api/agendamentos/hoje/', help='Endpoint requisitado (de preferência sem cache)'
+        )
+        parser.add_argument('--requisicoes', type=int, default=200, help='Requisições medidas')
+        parser.add_argument('--concorrencia', type=int, default=1, help='Threads fazendo requisições')
+        parser.add_argument('--salvar', help='Grava o resultado em JSON')
+        parser.add_argument('--comparar', help='JSON de uma execução anterior para mostrar a variação')
+
+    def handle(self, *args, **options):
+        if options['requisicoes'] < 1 or options['concorrencia'] < 1:
+            raise CommandError('--requisicoes e --concorrencia devem ser positivos')
+
+        banco = connections['default'].settings_dict
+        modo = getattr(settings, 'DB_CONEXOES', 'por_requisicao')
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"Modo {modo}: CONN_MAX_AGE={banco['CONN_MAX_AGE']}, "
+            f"pool={banco['OPTIONS'].get('pool', False)}, "
+            f"cursores no servidor={'não' if banco.get('DISABLE_SERVER_SIDE_CURSORS') else 'sim'}"
+        ))
+
+        self.conexoes = set()
+        self.lock = threading.Lock()
+        connection_created.connect(self.contar_conexao)
+        try:
+            # Primeira requisição fora da medição (carrega URLs, abre o pool)
+            self.requisitar(Client(), options['url'])
+            self.conexoes.clear()
+
+            por_thread = [options['requisicoes'] // options['concorrencia']] * options['concorrencia']
+            por_thread[0] += options['requisicoes'] % options['concorrencia']
+            inicio = cronometro.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['concorrencia']) as executor:
+                resultados = list(executor.map(
+                    lambda quantidade: self.rodar(options['url'], quantidade), por_thread
+                ))
+            duracao = cronometro.perf_counter() - inicio
+        finally:
+            connection_created.disconnect(self.contar_conexao)
+
+        latencias = sorted(latencia for latencias, _ in resultados for latencia in latencias)
+        erros = sum(erros for _, erros in resultados)
+        resultado = {
+            'modo': modo,
+            'url': options['url'],
+            'p50': percentil(latencias, 50),
+            'p95': percentil(latencias, 95),
+            'p99': percentil(latencias, 99),
+            'media': statistics.fmean(latencias),
+            'requisicoes_por_segundo': len(latencias) / duracao,
+            'conexoes_abertas': len(self.conexoes),
+            'erros': erros,
+        }
+
+        estilo = self.style.ERROR if erros else self.style.SUCCESS
+        self.stdout.write(estilo(
+            f"p50 {resultado['p50']:.1f}ms  p95 {resultado['p95']:.1f}ms  p99 {resultado['p99']:.1f}ms  "
+            f"{resultado['requisicoes_por_segundo']:.0f} req/s  "
+            f"{resultado['conexoes_abertas']} conexões abertas em {len(latencias)} requisições"
+            + (f'  {erros} erros' if erros else '')
+        ))
+
+        if options['comparar']:
+            with open(options['comparar']) as arquivo:
+                anterior = json.load(arquivo)
+            variacao = (resultado['p50'] / anterior['p50'] - 1) * 100 if anterior['p50'] else 0
+            self.stdout.write(
+                f"p50 {variacao:+.0f}% em relação a {anterior['modo']} "
+                f"({anterior['p50']:.1f}ms, {anterior['conexoes_abertas']} conexões abertas)"
+            )
+
+        if options['salvar']:
+            with open(options['salvar'], 'w') as arquivo:
+                json.dump(resultado, arquivo, indent=2)
+            self.stdout.write(f"Resultado gravado em {options['salvar']}")
+
+    def contar_conexao(self, sender, connection, **kwargs):
+        # Com pool o sinal é enviado a cada empréstimo: conta as conexões do driver distintas
+        # (o conjunto mantém as referências, então os ids não são reaproveitados)
+        with self.lock:
+            self.conexoes.add(connection.connection)
+
+    def rodar(self, url, quantidade):
+        cliente_http = Client()
+        latencias = []
+        erros = 0
+        try:
+            for _ in range(quantidade):
+                latencia, codigo = self.requisitar(cliente_http, url)
+                latencias.append(latencia)
+                erros += codigo >= 400
+        finally:
+            connections.close_all()
+        return latencias, erros
+
+    def requisitar(self, cliente_http, url):
+        # O Client de testes não fecha as conexões entre requisições; aqui o ciclo
+        # do servidor WSGI é repetido: close_old_connections antes e depois de cada uma
+        inicio = cronometro.perf_counter()
+        close_old_connections()
+        resposta = cliente_http.get(
+            url, secure=True,
+            HTTP_HOST=settings.ALLOWED_HOSTS[0].lstrip('.') if settings.ALLOWED_HOSTS else 'localhost'
+        )
+        if resposta.streaming:
+            b''.join(resposta.streaming_content)
+        close_old_connections()
+        return (cronometro.perf_counter() - inicio) * 1000, resposta.status_code
@@ -0,0 +1,74 @@
+import statistics
+import time as cronometro
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError, URLError
+from urllib.request import urlopen
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.instrumentacao import percentil
+
+# Pares (síncrono, assíncrono) comparados por padrão; {servico} e {data} são preenchidos
+CAMINHOS = [
+    ('/api/agendamentos/horarios_disponiveis/?data={data}&servico_id={servico}',
+     '/api/async/agendamentos/horarios_disponiveis/?data={data}&servico_id={servico}'),
+    ('/api/agendamentos/hoje/', '/api/async/agendamentos/hoje/'),
+    ('/api/agendamentos/proximos/', '/api/async/agendamentos/proximos/'),
+    ('/api/dashboard/estatisticas/', '/api/async/dashboard/estatisticas/'),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede vazão e latência (p50/p95/p99) dos endpoints de leitura em servidores no ar, '
+        'ex.: gunicorn (WSGI) em :8000 e uvicorn (ASGI) em :8001'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='+', help='URL base de cada servidor (ex.: http://localhost:8000)')
+        parser.add_argument('--requisicoes', type=int, default=500, help='Requisições por endpoint')
+        parser.add_argument('--concorrencia', type=int, default=50, help='Conexões simultâneas')
+        parser.add_argument('--servico', type=int, default=1, help='Serviço da consulta de disponibilidade')
+        parser.add_argument('--timeout', type=float, default=30, help='Timeout por requisição (s)')
+
+    def handle(self, *args, **options):
+        self.requisicoes = options['requisicoes']
+        self.concorrencia = options['concorrencia']
+        self.timeout = options['timeout']
+        parametros = {'data': timezone.localdate().isoformat(), 'servico': options['servico']}
+
+        for base in options['urls']:
+            self.stdout.write(self.style.MIGRATE_HEADING(f'== {base} =='))
+            for sincrono, assincrono in CAMINHOS:
+                for caminho in (sincrono, assincrono):
+                    self.medir(base.rstrip('/') + caminho.format(**parametros))
+            self.stdout.write('')
+
+    def requisitar(self, url):
+        inicio = cronometro.perf_counter()
+        try:
+            with urlopen(url, timeout=self.timeout) as resposta:
+                resposta.read()
+                ok = resposta.status == 200
+        except (HTTPError, URLError, OSError):
+            ok = False
+        return ok, (cronometro.perf_counter() - inicio) * 1000
+
+    def medir(self, url):
+        inicio = cronometro.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concorrencia) as executor:
+            resultados = list(executor.map(self.requisitar, [url] * self.requisicoes))
+        duracao = cronometro.perf_counter() - inicio
+
+        latencias = sorted(latencia for ok, latencia in resultados if ok)
+        falhas = len(resultados) - len(latencias)
+        self.stdout.write(self.style.SUCCESS(url))
+        self.stdout.write(
+            f'  {len(latencias) / duracao:.1f} req/s | '
+            f'p50 {percentil(latencias, 50):.1f} ms | '
+            f'p95 {percentil(latencias, 95):.1f} ms | '
+            f'p99 {percentil(latencias, 99):.1f} ms | '
+            f'média {statistics.fmean(latencias) if latencias else 0:.1f} ms | '
+            f'falhas {falhas}'
+        )
@@ -0,0 +1,109 @@
+import time as cronometro
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from api import agenda
+from api.models import Cliente, Pet, Servico, Agendamento
+
+# Índices avaliados; no cenário "antes" eles são removidos temporariamente
+INDICES = [
+    'agendamento_intervalo_idx',
+    'agendamento_keyset_idx',
+    'agendamento_pet_historico_idx',
+    'agendamento_status_data_idx',
+    'cliente_keyset_idx',
+    'cliente_cadastro_idx',
+    'servico_ativo_nome_idx',
+]
+
+
+class Desfazer(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara planos e tempos das consultas principais com e sem os índices de consulta. '
+        'Remove os índices das tabelas reais dentro de uma transação, bloqueando-as '
+        '(ACCESS EXCLUSIVE no PostgreSQL) até o fim da medição: use só em um banco de teste'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticoes', type=int, default=20, help='Execuções por consulta')
+        parser.add_argument('--analyze', action='store_true', help='Usa EXPLAIN ANALYZE (PostgreSQL)')
+        parser.add_argument(
+            '--confirmar', action='store_true',
+            help='Roda mesmo com DEBUG desligado (tabelas bloqueadas durante a medição)'
+        )
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['confirmar']:
+            raise CommandError(
+                'As tabelas de agendamentos, clientes e serviços ficam bloqueadas para leitura e escrita '
+                'enquanto os índices estão removidos. Rode em um banco de teste (DEBUG=True) '
+                'ou passe --confirmar.'
+            )
+        self.repeticoes = options['repeticoes']
+        self.opcoes_explain = {'analyze': True} if options['analyze'] and connection.vendor == 'postgresql' else {}
+
+        consultas = self.consultas()
+
+        self.stdout.write(self.style.MIGRATE_HEADING('== Antes (sem os índices) =='))
+        try:
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    for indice in INDICES:
+                        cursor.execute(f'DROP INDEX IF EXISTS {connection.ops.quote_name(indice)}')
+                self.medir(consultas)
+                # DDL é transacional no PostgreSQL e no SQLite: os índices voltam
+                raise Desfazer
+        except Desfazer:
+            pass
+
+        self.stdout.write(self.style.MIGRATE_HEADING('== Depois (com os índices) =='))
+        self.medir(consultas)
+
+    def consultas(self):
+        agora = timezone.now()
+        hoje = timezone.localdate()
+        inicio_hoje, fim_hoje = agenda.intervalo_do_dia(hoje)
+        servico = Servico.objects.order_by('id').first()
+        pet = Pet.objects.order_by('id').first()
+        servico_id = servico.id if servico else 0
+        pet_id = pet.id if pet else 0
+
+        return [
+            ('hoje (__date, forma antiga)',
+             lambda: Agendamento.objects.filter(data_agendamento__date=hoje)),
+            ('hoje (faixa)',
+             lambda: Agendamento.objects.filter(data_agendamento__gte=inicio_hoje, data_agendamento__lt=fim_hoje)),
+            ('conflito de intervalo',
+             lambda: agenda.sobrepostos([servico_id], agora, agora + timedelta(hours=1))),
+            ('próximos',
+             lambda: Agendamento.objects.filter(data_agendamento__gte=agora).order_by('data_agendamento')[:10]),
+            ('histórico do pet',
+             lambda: Agendamento.objects.filter(pet_id=pet_id).order_by('-data_agendamento')[:10]),
+            ('filtro por status',
+             lambda: Agendamento.objects.filter(status='confirmado').order_by('data_agendamento')[:20]),
+            ('clientes novos (30 dias)',
+             lambda: Cliente.objects.filter(data_cadastro__gte=inicio_hoje - timedelta(days=30))),
+            ('clientes keyset',
+             lambda: Cliente.objects.order_by('nome', 'id')[:20]),
+            ('serviços ativos',
+             lambda: Servico.objects.filter(ativo=True).order_by('nome')),
+        ]
+
+    def medir(self, consultas):
+        for nome, consulta in consultas:
+            inicio = cronometro.perf_counter()
+            for _ in range(self.repeticoes):
+                list(consulta())
+            media_ms = (cronometro.perf_counter() - inicio) * 1000 / self.repeticoes
+
+            self.stdout.write(self.style.SUCCESS(f'{nome}: {media_ms:.2f} ms'))
+            self.stdout.write(consulta().explain(**self.opcoes_explain))
+            self.stdout.write('')
@@ -1,23 +1,128 @@
-from django.core.management.base import BaseCommand
-from datetime import datetime, timedelta
+import math
+import random
+import time as cronometro
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from api import agenda, relatorios, sincronizacao
+from api import cache as cache_api
 from api.models import Cliente, Pet, Servico, Agendamento
 
+SERVICOS = [
+    {'nome': 'Banho', 'descricao': 'Banho completo com produtos premium', 'preco': 35.00, 'duracao_estimada': 60},
+    {'nome': 'Tosa', 'descricao': 'Tosa higiênica ou completa', 'preco': 50.00, 'duracao_estimada': 90},
+    {'nome': 'Banho e Tosa', 'descricao': 'Combo completo', 'preco': 75.00, 'duracao_estimada': 120},
+    {'nome': 'Consulta Veterinária', 'descricao': 'Consulta com veterinário', 'preco': 100.00, 'duracao_estimada': 30},
+    {'nome': 'Vacinação', 'descricao': 'Aplicação de vacinas', 'preco': 80.00, 'duracao_estimada': 20},
+]
+
+NOMES = [
+    'Ana', 'Carlos', 'Marina', 'João', 'Beatriz', 'Pedro', 'Juliana', 'Lucas', 'Fernanda', 'Rafael',
+    'Camila', 'Gabriel', 'Larissa', 'Mateus', 'Patrícia', 'Thiago', 'Aline', 'Bruno', 'Letícia', 'Diego',
+]
+SOBRENOMES = [
+    'Silva', 'Santos', 'Oliveira', 'Pereira', 'Souza', 'Lima', 'Costa', 'Ferreira', 'Almeida', 'Rodrigues',
+    'Gomes', 'Martins', 'Araújo', 'Barbosa', 'Ribeiro', 'Carvalho', 'Rocha', 'Dias', 'Moreira', 'Cardoso',
+]
+NOMES_PETS = [
+    'Rex', 'Mimi', 'Thor', 'Luna', 'Bob', 'Mel', 'Fred', 'Nina', 'Toby', 'Lola',
+    'Max', 'Bela', 'Simba', 'Pipoca', 'Zeca', 'Amora', 'Bidu', 'Frida', 'Paçoca', 'Chico',
+]
+# Raças por espécie, nas chaves de Pet.ESPECIE_CHOICES
+RACAS = {
+    'C': ['Vira-lata', 'Labrador', 'Poodle', 'Shih Tzu', 'Golden Retriever', 'Bulldog'],
+    'G': ['Siamês', 'Persa', 'Vira-lata', 'Maine Coon'],
+    'O': ['Coelho', 'Hamster', 'Porquinho-da-índia', 'Calopsita', 'Periquito', 'Canário'],
+}
+# Distribuição das espécies (cães são a maioria)
+PESOS_ESPECIES = {'C': 60, 'G': 30, 'O': 10}
+
+# Status dos agendamentos passados e futuros, com seus pesos
+STATUS_PASSADOS = {'concluido': 85, 'cancelado': 12, 'confirmado': 3}
+STATUS_FUTUROS = {'agendado': 60, 'confirmado': 30, 'cancelado': 10}
+
+# Fração dos agendamentos gerados no futuro
+FRACAO_FUTUROS = 0.05
+
+# Limite do histórico gerado; acima disso é preciso mais serviços
+MAX_DIAS = 365 * 20
+
+
 class Command(BaseCommand):
-    help = 'Popula o banco de dados com dados iniciais'
-    
+    help = (
+        'Popula o banco com os serviços iniciais e, opcionalmente, com dados sintéticos em volume '
+        '(ex.: --clientes 100000 --pets 300000 --agendamentos 5000000 --servicos 500)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clientes', type=int, default=0, help='Clientes a gerar')
+        parser.add_argument('--pets', type=int, default=0, help='Pets a gerar (distribuídos entre os clientes)')
+        parser.add_argument('--agendamentos', type=int, default=0, help='Agendamentos a gerar')
+        parser.add_argument(
+            '--servicos', type=int, default=len(SERVICOS),
+            help='Total de serviços; além do catálogo, cria unidades extras (cada serviço atende um por vez)'
+        )
+        parser.add_argument('--ocupacao', type=float, default=0.7, help='Fração dos horários ocupados (0-1)')
+        parser.add_argument('--lote', type=int, default=5000, help='Linhas por bulk_create')
+        parser.add_argument('--semente', type=int, default=None, help='Semente do gerador aleatório')
+        parser.add_argument('--sem-resumos', action='store_true', help='Não reconstrói os resumos diários')
+
     def handle(self, *args, **options):
+        self.lote = options['lote']
+        self.aleatorio = random.Random(options['semente'])
+        if not 0 < options['ocupacao'] <= 1:
+            raise CommandError('--ocupacao deve estar entre 0 e 1')
+
         self.stdout.write('Populando banco de dados com dados iniciais...')
-        
-        # Criar serviços
-        servicos = [
-            {'nome': 'Banho', 'descricao': 'Banho completo com produtos premium', 'preco': 35.00, 'duracao_estimada': 60},
-            {'nome': 'Tosa', 'descricao': 'Tosa higiênica ou completa', 'preco': 50.00, 'duracao_estimada': 90},
-            {'nome': 'Banho e Tosa', 'descricao': 'Combo completo', 'preco': 75.00, 'duracao_estimada': 120},
-            {'nome': 'Consulta Veterinária', 'descricao': 'Consulta com veterinário', 'preco': 100.00, 'duracao_estimada': 30},
-            {'nome': 'Vacinação', 'descricao': 'Aplicação de vacinas', 'preco': 80.00, 'duracao_estimada': 20},
-        ]
-        
-        for servico_data in servicos:
+        servicos = self.criar_servicos(options['servicos'])
+
+        if options['clientes']:
+            self.criar_clientes(options['clientes'])
+        if options['pets']:
+            self.criar_pets(options['pets'])
+        if options['agendamentos']:
+            self.criar_agendamentos(options['agendamentos'], servicos, options['ocupacao'])
+            if not options['sem_resumos']:
+                self.etapa('Resumos diários', relatorios.reconstruir)
+
+        # bulk_create não dispara sinais: descarta as respostas em cache
+        for modelo in (Cliente, Pet, Servico, Agendamento):
+            cache_api.invalidar(modelo)
+
+        self.stdout.write(self.style.SUCCESS('Banco de dados populado com sucesso!'))
+
+    def etapa(self, nome, funcao, *args):
+        inicio = cronometro.perf_counter()
+        resultado = funcao(*args)
+        self.stdout.write(self.style.SUCCESS(f'{nome}: {resultado} ({cronometro.perf_counter() - inicio:.1f}s)'))
+        return resultado
+
+    def em_lotes(self, modelo, objetos, depois_do_lote=None):
+        """Grava os objetos gerados sob demanda em lotes de bulk_create; retorna o total"""
+        total = 0
+        lote = []
+        for objeto in objetos:
+            lote.append(objeto)
+            if len(lote) == self.lote:
+                total += self.gravar_lote(modelo, lote, depois_do_lote)
+                lote = []
+        if lote:
+            total += self.gravar_lote(modelo, lote, depois_do_lote)
+        return total
+
+    def gravar_lote(self, modelo, lote, depois_do_lote):
+        criados = modelo.objects.bulk_create(lote)
+        sincronizacao.registrar(modelo, [objeto.id for objeto in criados])
+        if depois_do_lote:
+            depois_do_lote(criados)
+        return len(criados)
+
+    def criar_servicos(self, quantidade):
+        for servico_data in SERVICOS:
             servico, created = Servico.objects.get_or_create(
                 nome=servico_data['nome'],
                 defaults=servico_data
@@ -25,7 +130,121 @@ class Command(BaseCommand):
             if created:
                 self.stdout.write(self.style.SUCCESS(f'Serviço criado: {servico.nome}'))
 
-        # Criar clientes (o resto do código igual ao anterior)
-        # ... [o resto do código permanece igual] ...
-        
-        self.stdout.write(self.style.SUCCESS('Banco de dados populado com sucesso!'))
\ No newline at end of file
+        # Unidades extras do catálogo ("Banho (unidade 2)"...) para agendas paralelas
+        for indice in range(len(SERVICOS), quantidade):
+            base = SERVICOS[indice % len(SERVICOS)]
+            Servico.objects.get_or_create(
+                nome=f"{base['nome']} (unidade {indice // len(SERVICOS) + 1})",
+                defaults={**base, 'nome': f"{base['nome']} (unidade {indice // len(SERVICOS) + 1})"}
+            )
+
+        return list(Servico.objects.filter(ativo=True).order_by('id')[:quantidade])
+
+    def criar_clientes(self, quantidade):
+        inicio = Cliente.objects.count()
+        agora = timezone.now()
+
+        def gerar():
+            for n in range(inicio, inicio + quantidade):
+                nome = self.aleatorio.choice(NOMES)
+                sobrenome = self.aleatorio.choice(SOBRENOMES)
+                yield Cliente(
+                    nome=f'{nome} {sobrenome}',
+                    email=f'{nome.lower()}.{sobrenome.lower()}.{n}@exemplo.com',
+                    telefone=f'(85) 9{self.aleatorio.randint(1000, 9999)}-{self.aleatorio.randint(1000, 9999)}',
+                )
+
+        def espalhar_cadastros(criados):
+            # data_cadastro é auto_now_add: cada lote recebe um dia dos últimos três anos
+            Cliente.objects.filter(id__in=[cliente.id for cliente in criados]).update(
+                data_cadastro=agora - timedelta(days=self.aleatorio.randint(0, 3 * 365))
+            )
+
+        with transaction.atomic():
+            self.etapa('Clientes', self.em_lotes, Cliente, gerar(), espalhar_cadastros)
+
+    def criar_pets(self, quantidade):
+        cliente_ids = list(Cliente.objects.values_list('id', flat=True))
+        if not cliente_ids:
+            raise CommandError('Crie clientes antes dos pets (--clientes)')
+        # Só as espécies aceitas pelo modelo
+        especies = [especie for especie, _ in Pet.ESPECIE_CHOICES]
+        pesos = [PESOS_ESPECIES[especie] for especie in especies]
+
+        def gerar():
+            for _ in range(quantidade):
+                especie = self.aleatorio.choices(especies, pesos)[0]
+                yield Pet(
+                    nome=self.aleatorio.choice(NOMES_PETS),
+                    especie=especie,
+                    raca=self.aleatorio.choice(RACAS[especie]),
+                    cliente_id=self.aleatorio.choice(cliente_ids),
+                )
+
+        with transaction.atomic():
+            self.etapa('Pets', self.em_lotes, Pet, gerar())
+
+    def horarios_do_servico(self, servico):
+        """Horas de início que não se sobrepõem, para um atendimento de cada vez"""
+        passo = math.ceil(servico.duracao_estimada / 60)
+        return list(range(agenda.HORA_PRIMEIRO_HORARIO, agenda.HORA_ULTIMO_HORARIO + 1, passo))
+
+    def criar_agendamentos(self, quantidade, servicos, ocupacao):
+        pet_ids = list(Pet.objects.values_list('id', flat=True))
+        if not pet_ids:
+            raise CommandError('Crie pets antes dos agendamentos (--pets)')
+
+        horarios = {servico.id: self.horarios_do_servico(servico) for servico in servicos}
+        vagas_por_dia = sum(len(lista) for lista in horarios.values()) * ocupacao
+        # Dias de funcionamento necessários (6 por semana), convertidos em dias corridos
+        dias = math.ceil(quantidade / vagas_por_dia * 7 / 6) + 1
+        if dias > MAX_DIAS:
+            raise CommandError(
+                f'{quantidade} agendamentos exigiriam {dias} dias de histórico com {len(servicos)} '
+                f'serviços; aumente --servicos ou --ocupacao'
+            )
+
+        dias_futuros = max(1, int(dias * FRACAO_FUTUROS))
+        primeiro_dia = timezone.localdate() + timedelta(days=dias_futuros - dias)
+        agora = timezone.now()
+        # Horários gerados não se sobrepõem aos agendamentos existentes (a restrição de
+        # exclusão do PostgreSQL abortaria o lote inteiro); faixa sobre o índice do intervalo
+        inicio_geracao = agenda.inicio_do_dia(primeiro_dia)
+        existentes = defaultdict(list)
+        for servico_id, inicio, fim in Agendamento.objects.exclude(status='cancelado').filter(
+            servico__in=servicos,
+            data_agendamento__gt=inicio_geracao - agenda.DURACAO_MAXIMA,
+            data_fim__gt=inicio_geracao,
+        ).values_list('servico_id', 'data_agendamento', 'data_fim'):
+            existentes[servico_id].append((inicio, fim))
+        ocupados = {servico.id: agenda.LinhaDoTempo(existentes[servico.id]) for servico in servicos}
+
+        def gerar():
+            restantes = quantidade
+            dia = primeiro_dia
+            while restantes:
+                if agenda.dia_de_funcionamento(dia):
+                    for servico in servicos:
+                        for hora in horarios[servico.id]:
+                            if not restantes:
+                                return
+                            if self.aleatorio.random() >= ocupacao:
+                                continue
+                            inicio = timezone.make_aware(datetime.combine(dia, time(hora, 0)))
+                            fim = agenda.calcular_fim(inicio, servico)
+                            if not ocupados[servico.id].livre(inicio, fim):
+                                continue
+                            status = STATUS_PASSADOS if inicio < agora else STATUS_FUTUROS
+                            restantes -= 1
+                            yield Agendamento(
+                                pet_id=self.aleatorio.choice(pet_ids),
+                                servico=servico,
+                                data_agendamento=inicio,
+                                data_fim=fim,
+                                preco=servico.preco,
+                                status=self.aleatorio.choices(list(status), list(status.values()))[0],
+                            )
+                dia += timedelta(days=1)
+
+        with transaction.atomic():
+            self.etapa('Agendamentos', self.em_lotes, Agendamento, gerar())
@@ -0,0 +1,56 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from api import tarefas
+
+
+class Command(BaseCommand):
+    help = (
+        'Worker da fila de tarefas em segundo plano (lembretes, conclusão automática, relatórios); '
+        'no PostgreSQL vários processos podem rodar ao mesmo tempo'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--intervalo', type=float, default=5, help='Segundos entre as consultas à fila vazia')
+        parser.add_argument('--lote', type=int, default=10, help='Tarefas reservadas por vez')
+        parser.add_argument('--uma-vez', action='store_true', help='Executa as tarefas vencidas e termina')
+
+    def handle(self, *args, **options):
+        if options['lote'] < 1 or options['intervalo'] <= 0:
+            raise CommandError('--lote e --intervalo devem ser positivos')
+
+        self.parar = False
+        signal.signal(signal.SIGTERM, self.pedir_parada)
+        signal.signal(signal.SIGINT, self.pedir_parada)
+
+        tarefas.agendar_periodicas()
+        total = falhas = 0
+        while not self.parar:
+            # Como entre requisições: descarta conexões quebradas ou vencidas (CONN_MAX_AGE)
+            close_old_connections()
+            liberadas = tarefas.liberar_abandonadas()
+            if liberadas:
+                self.stdout.write(self.style.WARNING(f'{liberadas} tarefas abandonadas devolvidas à fila'))
+
+            executadas, com_erro = tarefas.executar_pendentes(options['lote'])
+            total += executadas
+            falhas += com_erro
+            if executadas:
+                continue
+            if options['uma_vez']:
+                break
+            # Dorme em passos curtos para atender logo ao pedido de parada
+            fim = time.monotonic() + options['intervalo']
+            while not self.parar and time.monotonic() < fim:
+                time.sleep(min(0.5, fim - time.monotonic()))
+        close_old_connections()
+
+        estilo = self.style.ERROR if falhas else self.style.SUCCESS
+        self.stdout.write(estilo(f'{total} tarefas executadas, {falhas} com erro'))
+
+    def pedir_parada(self, signum, frame):
+        # A tarefa em andamento termina antes de o worker sair
+        self.parar = True
@@ -0,0 +1,31 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import relatorios, tarefas
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói os resumos diários (relatórios de receita e ocupação) a partir dos agendamentos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--inicio', help='Primeiro dia (AAAA-MM-DD); padrão: todo o histórico')
+        parser.add_argument('--fim', help='Último dia (AAAA-MM-DD); padrão: todo o histórico')
+        parser.add_argument(
+            '--em-segundo-plano', action='store_true', help='Enfileira a reconstrução para o processar_tarefas'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            inicio = date.fromisoformat(options['inicio']) if options['inicio'] else None
+            fim = date.fromisoformat(options['fim']) if options['fim'] else None
+        except ValueError as e:
+            raise CommandError(f'Data inválida: {e}')
+
+        if options['em_segundo_plano']:
+            tarefas.agendar('reconstruir_resumos', {'inicio': options['inicio'], 'fim': options['fim']})
+            self.stdout.write(self.style.SUCCESS('Reconstrução enfileirada'))
+            return
+
+        total = relatorios.reconstruir(inicio, fim)
+        self.stdout.write(self.style.SUCCESS(f'{total} resumos diários gravados'))
@@ -0,0 +1,83 @@
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models import DurationField, ExpressionWrapper, F, OuterRef, Subquery
+
+
+def preencher_data_fim(apps, schema_editor):
+    # Um único UPDATE no banco, sem carregar os agendamentos
+    Agendamento = apps.get_model('api', 'Agendamento')
+    Servico = apps.get_model('api', 'Servico')
+    duracao = Servico.objects.filter(id=OuterRef('servico_id')).order_by().annotate(
+        duracao=ExpressionWrapper(F('duracao_estimada') * timedelta(minutes=1), output_field=DurationField())
+    ).values('duracao')[:1]
+    Agendamento.objects.update(
+        data_fim=ExpressionWrapper(
+            F('data_agendamento') + Subquery(duracao, output_field=DurationField()),
+            output_field=models.DateTimeField()
+        )
+    )
+
+
+def criar_restricao_sobreposicao(apps, schema_editor):
+    # Exclusão por intervalo só existe no PostgreSQL; nos demais bancos
+    # a verificação fica a cargo de Agendamento.clean
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT a.id, b.id FROM api_agendamento a JOIN api_agendamento b "
+            "ON a.servico_id = b.servico_id AND a.id < b.id "
+            "AND a.data_agendamento < b.data_fim AND b.data_agendamento < a.data_fim "
+            "WHERE a.status IN ('agendado', 'confirmado') AND b.status IN ('agendado', 'confirmado')"
+        )
+        conflitos = cursor.fetchall()
+    if conflitos:
+        raise RuntimeError(
+            'Agendamentos ativos sobrepostos impedem a restrição de intervalo; '
+            f'cancele ou remarque um de cada par antes de migrar: {conflitos}'
+        )
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    schema_editor.execute(
+        "ALTER TABLE api_agendamento ADD CONSTRAINT agendamento_sem_sobreposicao "
+        "EXCLUDE USING gist (servico_id WITH =, tstzrange(data_agendamento, data_fim) WITH &&) "
+        "WHERE (status IN ('agendado', 'confirmado'))"
+    )
+
+
+def remover_restricao_sobreposicao(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'ALTER TABLE api_agendamento DROP CONSTRAINT IF EXISTS agendamento_sem_sobreposicao'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_alter_agendamento_options_alter_cliente_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='agendamento',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='agendamento',
+            name='data_fim',
+            field=models.DateTimeField(editable=False, help_text='Início mais a duração do serviço', null=True),
+        ),
+        migrations.RunPython(preencher_data_fim, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='agendamento',
+            name='data_fim',
+            field=models.DateTimeField(editable=False, help_text='Início mais a duração do serviço'),
+        ),
+        migrations.AddIndex(
+            model_name='agendamento',
+            index=models.Index(condition=models.Q(('status__in', ['agendado', 'confirmado'])), fields=['servico', 'data_agendamento', 'data_fim'], name='agendamento_intervalo_idx'),
+        ),
+        migrations.RunPython(criar_restricao_sobreposicao, remover_restricao_sobreposicao),
+    ]
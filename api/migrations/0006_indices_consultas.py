@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_indices_keyset'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='agendamento',
+            index=models.Index(fields=['pet', '-data_agendamento'], name='agendamento_pet_historico_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='agendamento',
+            index=models.Index(fields=['status', 'data_agendamento'], name='agendamento_status_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(fields=['data_cadastro'], name='cliente_cadastro_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='servico',
+            index=models.Index(condition=models.Q(('ativo', True)), fields=['nome'], name='servico_ativo_nome_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+from django.db import migrations
+
+# (tabela, coluna) cobertas pela busca de clientes, pets e serviços
+COLUNAS_BUSCA = [
+    ('api_cliente', 'nome'),
+    ('api_cliente', 'email'),
+    ('api_cliente', 'telefone'),
+    ('api_pet', 'nome'),
+    ('api_pet', 'raca'),
+    ('api_servico', 'nome'),
+    ('api_servico', 'descricao'),
+]
+
+
+def criar_indices_trigramas(apps, schema_editor):
+    # Índices GIN de trigramas só existem no PostgreSQL; nos demais bancos
+    # a busca continua funcionando, sem índice
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for tabela, coluna in COLUNAS_BUSCA:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {tabela}_{coluna}_trgm_idx '
+            f'ON {tabela} USING gin ({coluna} gin_trgm_ops)'
+        )
+
+
+def remover_indices_trigramas(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for tabela, coluna in COLUNAS_BUSCA:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {tabela}_{coluna}_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_indices_consultas'),
+    ]
+
+    operations = [
+        migrations.RunPython(criar_indices_trigramas, remover_indices_trigramas),
+    ]
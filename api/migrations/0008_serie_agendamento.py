@@ -0,0 +1,50 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_busca_trigramas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='agendamento',
+            name='data_original',
+            field=models.DateTimeField(blank=True, help_text='Ocorrência da série substituída por este agendamento', null=True),
+        ),
+        migrations.CreateModel(
+            name='SerieAgendamento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('inicio', models.DateTimeField(help_text='Data e hora da primeira ocorrência')),
+                ('frequencia', models.CharField(choices=[('semanal', 'Semanal'), ('mensal', 'Mensal')], default='semanal', max_length=7)),
+                ('intervalo', models.PositiveSmallIntegerField(default=1, help_text='A cada quantas semanas/meses')),
+                ('total_ocorrencias', models.PositiveIntegerField(blank=True, null=True)),
+                ('data_limite', models.DateField(blank=True, null=True)),
+                ('ativa', models.BooleanField(default=True)),
+                ('observacoes', models.TextField(blank=True)),
+                ('data_criacao', models.DateTimeField(auto_now_add=True)),
+                ('data_atualizacao', models.DateTimeField(auto_now=True)),
+                ('pet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='series', to='api.pet')),
+                ('servico', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='series', to='api.servico')),
+            ],
+            options={
+                'verbose_name': 'Série de agendamentos',
+                'verbose_name_plural': 'Séries de agendamentos',
+                'ordering': ['inicio'],
+            },
+        ),
+        migrations.AddField(
+            model_name='agendamento',
+            name='serie',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='agendamentos', to='api.serieagendamento'),
+        ),
+        migrations.AddConstraint(
+            model_name='agendamento',
+            constraint=models.UniqueConstraint(condition=models.Q(('serie__isnull', False)), fields=('serie', 'data_original'), name='ocorrencia_unica_por_serie'),
+        ),
+    ]
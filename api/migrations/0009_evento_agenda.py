@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_serie_agendamento'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventoAgenda',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('agendamento_id', models.IntegerField(help_text='Sem chave estrangeira: o evento sobrevive à exclusão')),
+                ('tipo', models.CharField(choices=[('criado', 'Criado'), ('atualizado', 'Atualizado'), ('status', 'Mudança de status'), ('excluido', 'Excluído')], max_length=10)),
+                ('status_anterior', models.CharField(blank=True, max_length=10)),
+                ('dados', models.JSONField(help_text='Agendamento serializado no momento do evento')),
+                ('data_criacao', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Evento da agenda',
+                'verbose_name_plural': 'Eventos da agenda',
+                'ordering': ['id'],
+            },
+        ),
+    ]
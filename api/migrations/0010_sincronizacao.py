@@ -0,0 +1,52 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_evento_agenda'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegistroExclusao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('modelo', models.CharField(max_length=50)),
+                ('objeto_id', models.IntegerField()),
+                ('data_exclusao', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Registro de exclusão',
+                'verbose_name_plural': 'Registros de exclusão',
+                'ordering': ['data_exclusao'],
+            },
+        ),
+        migrations.AlterField(
+            model_name='agendamento',
+            name='data_atualizacao',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='cliente',
+            name='data_atualizacao',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='pet',
+            name='data_atualizacao',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='serieagendamento',
+            name='data_atualizacao',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='servico',
+            name='data_atualizacao',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
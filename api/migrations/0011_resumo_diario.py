@@ -0,0 +1,32 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_sincronizacao'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumoDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField()),
+                ('status', models.CharField(choices=[('agendado', 'Agendado'), ('confirmado', 'Confirmado'), ('cancelado', 'Cancelado'), ('concluido', 'Concluído')], max_length=10)),
+                ('quantidade', models.PositiveIntegerField(default=0)),
+                ('receita', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('minutos', models.PositiveIntegerField(default=0)),
+                ('servico', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumos', to='api.servico')),
+            ],
+            options={
+                'verbose_name': 'Resumo diário',
+                'verbose_name_plural': 'Resumos diários',
+                'ordering': ['data', 'servico'],
+                'constraints': [models.UniqueConstraint(fields=('data', 'servico', 'status'), name='resumo_diario_unico')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def preencher_preco(apps, schema_editor):
+    # O preço cobrado nos agendamentos antigos não foi guardado: usa o atual do serviço
+    Agendamento = apps.get_model('api', 'Agendamento')
+    Servico = apps.get_model('api', 'Servico')
+    Agendamento.objects.update(
+        preco=Subquery(Servico.objects.filter(id=OuterRef('servico_id')).values('preco')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_tarefa'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='agendamento',
+            name='preco',
+            field=models.DecimalField(decimal_places=2, editable=False, help_text='Preço do serviço quando foi agendado; base da receita nos relatórios', max_digits=8, null=True),
+        ),
+        migrations.RunPython(preencher_preco, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='agendamento',
+            name='preco',
+            field=models.DecimalField(decimal_places=2, editable=False, help_text='Preço do serviço quando foi agendado; base da receita nos relatórios', max_digits=8),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_agendamento_preco'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlteracaoSincronizacao',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('modelo', models.CharField(max_length=50)),
+                ('objeto_id', models.IntegerField()),
+                ('excluido', models.BooleanField(default=False)),
+                ('data_registro', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Alteração para sincronização',
+                'verbose_name_plural': 'Alterações para sincronização',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.DeleteModel(
+            name='RegistroExclusao',
+        ),
+    ]
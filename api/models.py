@@ -1,12 +1,26 @@
-from django.db import models
+from django.db import models, router, transaction
 from django.core.exceptions import ValidationError
-from datetime import time
+from django.utils import timezone
+from datetime import datetime, time, timedelta
+import calendar
+
+class ClienteQuerySet(models.QuerySet):
+    def com_total_pets(self):
+        """Anota a quantidade de pets de cada cliente (lida pelos serializers)"""
+        return self.annotate(total_pets=models.Count('pets'))
+
+    def com_pets(self):
+        """Total de pets e os pets de cada cliente (com o cliente já ligado a cada pet)"""
+        return self.com_total_pets().prefetch_related('pets')
 
 class Cliente(models.Model):
     nome = models.CharField(max_length=100)
     email = models.EmailField(unique=True)
     telefone = models.CharField(max_length=15)
     data_cadastro = models.DateTimeField(auto_now_add=True)
+    data_atualizacao = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = ClienteQuerySet.as_manager()
 
     def __str__(self):
         return self.nome
@@ -15,6 +29,26 @@ class Cliente(models.Model):
         verbose_name = "Cliente"
         verbose_name_plural = "Clientes"
         ordering = ['nome']
+        indexes = [
+            # Paginação keyset por (nome, id)
+            models.Index(fields=['nome', 'id'], name='cliente_keyset_idx'),
+            # Novos clientes por período (dashboard)
+            models.Index(fields=['data_cadastro'], name='cliente_cadastro_idx'),
+        ]
+
+class PetQuerySet(models.QuerySet):
+    def com_agendamentos(self, recentes=10):
+        """
+        Carrega o cliente, anota o total de agendamentos e pré-carrega os
+        `recentes` agendamentos mais novos de cada pet em agendamentos_recentes
+        """
+        return self.select_related('cliente').annotate(
+            total_agendamentos=models.Count('agendamentos')
+        ).prefetch_related(models.Prefetch(
+            'agendamentos',
+            queryset=Agendamento.objects.select_related('servico').order_by('-data_agendamento')[:recentes],
+            to_attr='agendamentos_recentes',
+        ))
 
 class Pet(models.Model):
     ESPECIE_CHOICES = [
@@ -29,6 +63,9 @@ class Pet(models.Model):
     cliente = models.ForeignKey(Cliente, on_delete=models.CASCADE, related_name='pets')
     observacoes = models.TextField(blank=True)
     data_cadastro = models.DateTimeField(auto_now_add=True)
+    data_atualizacao = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = PetQuerySet.as_manager()
 
     def __str__(self):
         return f"{self.nome} ({self.cliente.nome})"
@@ -44,6 +81,7 @@ class Servico(models.Model):
     preco = models.DecimalField(max_digits=8, decimal_places=2)
     duracao_estimada = models.IntegerField(help_text="Duração em minutos")
     ativo = models.BooleanField(default=True)
+    data_atualizacao = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return self.nome
@@ -52,6 +90,91 @@ class Servico(models.Model):
         verbose_name = "Serviço"
         verbose_name_plural = "Serviços"
         ordering = ['nome']
+        indexes = [
+            # Listagem de serviços ativos, ordenada por nome
+            models.Index(fields=['nome'], condition=models.Q(ativo=True), name='servico_ativo_nome_idx'),
+        ]
+
+class SerieAgendamento(models.Model):
+    """
+    Agendamento recorrente (ex.: plano de banho mensal) guardado como uma
+    única linha. As ocorrências são calculadas sob demanda por
+    `ocorrencias()`; só viram linhas de Agendamento quando alteradas ou
+    canceladas (ver `Agendamento.serie` / `data_original`).
+    """
+    FREQUENCIA_CHOICES = [
+        ('semanal', 'Semanal'),
+        ('mensal', 'Mensal'),
+    ]
+    
+    pet = models.ForeignKey(Pet, on_delete=models.CASCADE, related_name='series')
+    servico = models.ForeignKey(Servico, on_delete=models.CASCADE, related_name='series')
+    inicio = models.DateTimeField(help_text="Data e hora da primeira ocorrência")
+    frequencia = models.CharField(max_length=7, choices=FREQUENCIA_CHOICES, default='semanal')
+    intervalo = models.PositiveSmallIntegerField(default=1, help_text="A cada quantas semanas/meses")
+    total_ocorrencias = models.PositiveIntegerField(null=True, blank=True)
+    data_limite = models.DateField(null=True, blank=True)
+    ativa = models.BooleanField(default=True)
+    observacoes = models.TextField(blank=True)
+    data_criacao = models.DateTimeField(auto_now_add=True)
+    data_atualizacao = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        verbose_name = "Série de agendamentos"
+        verbose_name_plural = "Séries de agendamentos"
+        ordering = ['inicio']
+
+    def __str__(self):
+        return f"{self.pet.nome} - {self.servico.nome} ({self.get_frequencia_display()})"
+
+    def clean(self):
+        super().clean()
+        if self.intervalo < 1:
+            raise ValidationError('O intervalo deve ser de pelo menos 1.')
+        if self.data_limite and self.inicio and self.data_limite < timezone.localdate(self.inicio):
+            raise ValidationError('A data limite é anterior ao início da série.')
+
+    def ocorrencia(self, indice):
+        """Data e hora da ocorrência de número `indice` (a primeira é 0)"""
+        base = timezone.localtime(self.inicio)
+        if self.frequencia == 'mensal':
+            meses = base.month - 1 + indice * self.intervalo
+            ano, mes = base.year + meses // 12, meses % 12 + 1
+            dia = min(base.day, calendar.monthrange(ano, mes)[1])
+            data = base.date().replace(year=ano, month=mes, day=dia)
+            if data.weekday() == 6:
+                # Fechado aos domingos: a ocorrência passa para a segunda-feira
+                data += timedelta(days=1)
+        else:
+            data = base.date() + timedelta(weeks=indice * self.intervalo)
+        return timezone.make_aware(datetime.combine(data, base.time().replace(tzinfo=None)))
+
+    def _primeiro_indice(self, inicio):
+        """Índice a partir do qual vale procurar ocorrências >= inicio"""
+        base = timezone.localtime(self.inicio)
+        alvo = timezone.localtime(inicio)
+        if alvo <= base:
+            return 0
+        if self.frequencia == 'mensal':
+            meses = (alvo.year - base.year) * 12 + alvo.month - base.month
+            return max(0, meses // self.intervalo - 1)
+        return max(0, (alvo.date() - base.date()).days // (7 * self.intervalo) - 1)
+
+    def ocorrencias(self, inicio, fim):
+        """Gera, em ordem e sob demanda, as ocorrências em [inicio, fim)"""
+        indice = self._primeiro_indice(inicio)
+        while self.total_ocorrencias is None or indice < self.total_ocorrencias:
+            data = self.ocorrencia(indice)
+            if data >= fim or (self.data_limite and timezone.localdate(data) > self.data_limite):
+                return
+            if data >= inicio:
+                yield data
+            indice += 1
+
+class AgendamentoQuerySet(models.QuerySet):
+    def com_relacionados(self):
+        """Carrega pet, cliente e serviço na mesma consulta (usados pelo serializer)"""
+        return self.select_related('pet__cliente', 'servico')
 
 class Agendamento(models.Model):
     STATUS_CHOICES = [
@@ -64,51 +187,118 @@ class Agendamento(models.Model):
     pet = models.ForeignKey(Pet, on_delete=models.CASCADE, related_name='agendamentos')
     servico = models.ForeignKey(Servico, on_delete=models.CASCADE, related_name='agendamentos')
     data_agendamento = models.DateTimeField()
+    data_fim = models.DateTimeField(editable=False, help_text="Início mais a duração do serviço")
+    preco = models.DecimalField(
+        max_digits=8, decimal_places=2, editable=False,
+        help_text="Preço do serviço quando foi agendado; base da receita nos relatórios"
+    )
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='agendado')
     observacoes = models.TextField(blank=True)
+    serie = models.ForeignKey(
+        SerieAgendamento, on_delete=models.CASCADE, null=True, blank=True, related_name='agendamentos'
+    )
+    data_original = models.DateTimeField(
+        null=True, blank=True, help_text="Ocorrência da série substituída por este agendamento"
+    )
     data_criacao = models.DateTimeField(auto_now_add=True)
-    data_atualizacao = models.DateTimeField(auto_now=True)
+    data_atualizacao = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = AgendamentoQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Agendamento"
         verbose_name_plural = "Agendamentos"
         ordering = ['data_agendamento']
-        unique_together = ['data_agendamento', 'servico']
+        indexes = [
+            # Busca de sobreposição entre agendamentos ativos de um serviço
+            models.Index(
+                fields=['servico', 'data_agendamento', 'data_fim'],
+                condition=models.Q(status__in=['agendado', 'confirmado']),
+                name='agendamento_intervalo_idx'
+            ),
+            # Paginação keyset por (data_agendamento, id)
+            models.Index(fields=['data_agendamento', 'id'], name='agendamento_keyset_idx'),
+            # Histórico do pet, mais recentes primeiro
+            models.Index(fields=['pet', '-data_agendamento'], name='agendamento_pet_historico_idx'),
+            # Filtro por status com a ordenação padrão da listagem
+            models.Index(fields=['status', 'data_agendamento'], name='agendamento_status_data_idx'),
+        ]
         constraints = [
             models.CheckConstraint(
                 check=models.Q(data_agendamento__hour__gte=8) & models.Q(data_agendamento__hour__lte=18),
                 name='horario_funcionamento'
-            )
+            ),
+            # Cada ocorrência de uma série é materializada no máximo uma vez
+            models.UniqueConstraint(
+                fields=['serie', 'data_original'],
+                condition=models.Q(serie__isnull=False),
+                name='ocorrencia_unica_por_serie'
+            ),
         ]
 
     def __str__(self):
         return f"{self.pet.nome} - {self.servico.nome} - {self.data_agendamento}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Guarda os valores lidos do banco para detectar mudanças ao salvar (ver signals.py)"""
+        instance = super().from_db(db, field_names, values)
+        instance.status_original = instance.__dict__.get('status')
+        instance.data_agendamento_original = instance.__dict__.get('data_agendamento')
+        instance.servico_id_original = instance.__dict__.get('servico_id')
+        return instance
+
     def clean(self):
         """Validações personalizadas para o agendamento"""
         super().clean()
-        
-        # Verificar se já existe agendamento para o mesmo horário e serviço
-        if Agendamento.objects.filter(
-            data_agendamento=self.data_agendamento,
-            servico=self.servico
-        ).exclude(id=self.id).exists():
+        from . import agenda
+
+        self.validar_horario()
+
+        # Verificar se o intervalo se sobrepõe a outro agendamento ativo do serviço
+        if self.data_fim and self.status in agenda.STATUS_ATIVOS and agenda.existe_conflito(
+            self.servico_id, self.data_agendamento, self.data_fim, excluir_id=self.id,
+            excluir_ocorrencia=(self.serie_id, self.data_original) if self.serie_id else None
+        ):
             raise ValidationError('Já existe um agendamento para este horário e serviço.')
 
+    def validar_horario(self):
+        """Validações do horário que não consultam o banco (usadas também em lote)"""
+        from . import agenda
+
+        if self.data_fim and self.data_fim - self.data_agendamento > agenda.DURACAO_MAXIMA:
+            raise ValidationError('Duração do serviço excede o limite de um agendamento.')
+
         # Verificar se o horário está dentro do funcionamento (8h às 18h)
         hora_agendamento = self.data_agendamento.time()
         if hora_agendamento < time(8, 0) or hora_agendamento > time(18, 0):
             raise ValidationError('Horário fora do funcionamento (8h às 18h).')
 
         # Verificar se a data não é no passado
-        from django.utils import timezone
         if self.data_agendamento < timezone.now():
             raise ValidationError('Não é possível agendar para datas/horários passados.')
 
     def save(self, *args, **kwargs):
-        """Executa validações antes de salvar"""
-        self.full_clean()
-        super().save(*args, **kwargs)
+        """
+        Calcula o fim do atendimento, guarda o preço do serviço (na criação
+        ou na troca de serviço) e executa validações antes de salvar.
+
+        A verificação de conflitos e a gravação acontecem na mesma transação,
+        com a agenda do serviço bloqueada nos dias do atendimento, para que
+        duas requisições simultâneas não reservem o mesmo horário.
+        """
+        from . import agenda
+
+        if self.data_agendamento and self.servico_id:
+            self.data_fim = self.data_agendamento + timedelta(minutes=self.servico.duracao_estimada)
+        servico_trocado = self.servico_id != getattr(self, 'servico_id_original', None)
+        if self.servico_id and (self._state.adding or servico_trocado):
+            self.preco = self.servico.preco
+        with transaction.atomic(using=kwargs.get('using') or router.db_for_write(Agendamento, instance=self)):
+            if self.data_fim and self.status in agenda.STATUS_ATIVOS:
+                agenda.bloquear_agenda([(self.servico_id, self.data_agendamento, self.data_fim)])
+            self.full_clean()
+            super().save(*args, **kwargs)
 
     @property
     def cliente_nome(self):
@@ -123,4 +313,119 @@ class Agendamento(models.Model):
     @property
     def servico_nome(self):
         """Propriedade para acessar o nome do serviço diretamente"""
-        return self.servico.nome
\ No newline at end of file
+        return self.servico.nome
+
+class EventoAgenda(models.Model):
+    """
+    Alteração de um agendamento, registrada na mesma transação da gravação.
+    O id crescente é a posição no feed de eventos (ver eventos.py).
+    """
+    TIPO_CHOICES = [
+        ('criado', 'Criado'),
+        ('atualizado', 'Atualizado'),
+        ('status', 'Mudança de status'),
+        ('excluido', 'Excluído'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    agendamento_id = models.IntegerField(help_text="Sem chave estrangeira: o evento sobrevive à exclusão")
+    tipo = models.CharField(max_length=10, choices=TIPO_CHOICES)
+    status_anterior = models.CharField(max_length=10, blank=True)
+    dados = models.JSONField(help_text="Agendamento serializado no momento do evento")
+    data_criacao = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        verbose_name = "Evento da agenda"
+        verbose_name_plural = "Eventos da agenda"
+        ordering = ['id']
+
+    def __str__(self):
+        return f"#{self.id} {self.tipo} agendamento {self.agendamento_id}"
+
+class AlteracaoSincronizacao(models.Model):
+    """
+    Criação, alteração ou exclusão de um registro, para a sincronização
+    incremental (ver sincronizacao.py). O id é a posição: é confirmado em
+    ordem, como o de EventoAgenda.
+    """
+    id = models.BigAutoField(primary_key=True)
+    modelo = models.CharField(max_length=50)
+    objeto_id = models.IntegerField()
+    excluido = models.BooleanField(default=False)
+    data_registro = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        verbose_name = "Alteração para sincronização"
+        verbose_name_plural = "Alterações para sincronização"
+        ordering = ['id']
+
+    def __str__(self):
+        return f"#{self.id} {self.modelo} #{self.objeto_id}{' (excluído)' if self.excluido else ''}"
+
+class ResumoDiario(models.Model):
+    """
+    Agendamentos de um serviço em um dia, por status: quantidade, receita
+    (preço cobrado em cada agendamento) e minutos reservados. Mantido a cada gravação de
+    agendamento e reconstruível com `manage.py reconstruir_resumos`.
+    """
+    data = models.DateField()
+    servico = models.ForeignKey(Servico, on_delete=models.CASCADE, related_name='resumos')
+    status = models.CharField(max_length=10, choices=Agendamento.STATUS_CHOICES)
+    quantidade = models.PositiveIntegerField(default=0)
+    receita = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    minutos = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Resumo diário"
+        verbose_name_plural = "Resumos diários"
+        ordering = ['data', 'servico']
+        constraints = [
+            models.UniqueConstraint(fields=['data', 'servico', 'status'], name='resumo_diario_unico'),
+        ]
+
+    def __str__(self):
+        return f"{self.data} - {self.servico_id} - {self.status}"
+
+
+class Tarefa(models.Model):
+    """
+    Tarefa da fila em segundo plano, executada pelo comando
+    `manage.py processar_tarefas` (ver tarefas.py).
+    """
+    STATUS_CHOICES = [
+        ('pendente', 'Pendente'),
+        ('executando', 'Executando'),
+        ('concluida', 'Concluída'),
+        ('falhou', 'Falhou'),
+    ]
+
+    nome = models.CharField(max_length=100)
+    argumentos = models.JSONField(default=dict, blank=True)
+    chave = models.CharField(
+        max_length=100, null=True, blank=True,
+        help_text="Identifica a tarefa para remarcá-la ou cancelá-la (ex.: lembrete:42)"
+    )
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pendente')
+    executar_em = models.DateTimeField(default=timezone.now)
+    tentativas = models.PositiveIntegerField(default=0)
+    erro = models.TextField(blank=True)
+    data_criacao = models.DateTimeField(auto_now_add=True)
+    data_inicio = models.DateTimeField(null=True, blank=True)
+    data_conclusao = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Tarefa"
+        verbose_name_plural = "Tarefas"
+        ordering = ['executar_em', 'id']
+        indexes = [
+            # Só as pendentes são procuradas pelos workers
+            models.Index(fields=['executar_em'], condition=models.Q(status='pendente'), name='tarefa_pendente_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['chave'], condition=models.Q(status='pendente'), name='tarefa_chave_pendente_unica'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.nome} #{self.id} ({self.status})"
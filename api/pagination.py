@@ -0,0 +1,100 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class PaginacaoKeysetOpcional(PageNumberPagination):
+    """
+    Paginação por número de página com um modo keyset opcional.
+
+    Com `?paginacao=cursor` (ou um `?cursor=` recebido no link `next`), as
+    linhas são ordenadas por `ordenacao_keyset` e cada página começa depois
+    da última linha da anterior: sem OFFSET e sem COUNT(*), o custo de
+    buscar uma página não depende da profundidade.
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    modo_query_param = 'paginacao'
+    ordenacao_keyset = ('id',)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.modo_keyset = (
+            request.query_params.get(self.modo_query_param) == 'cursor'
+            or self.cursor_query_param in request.query_params
+        )
+        if not self.modo_keyset:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordenacao_keyset)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            queryset = queryset.filter(self._depois_de(queryset.model, cursor))
+
+        linhas = list(queryset[:page_size + 1])
+        self.tem_proxima = len(linhas) > page_size
+        self.pagina = linhas[:page_size]
+        return self.pagina
+
+    def get_paginated_response(self, data):
+        if not self.modo_keyset:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_next_link(self):
+        if not self.modo_keyset:
+            return super().get_next_link()
+        if not self.tem_proxima:
+            return None
+        ultima = self.pagina[-1]
+        # Linhas de .values() (listagem rápida) são dicionários
+        if isinstance(ultima, dict):
+            valores = [ultima[campo] for campo in self.ordenacao_keyset]
+        else:
+            valores = [getattr(ultima, campo) for campo in self.ordenacao_keyset]
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self._codificar(valores))
+
+    def _codificar(self, valores):
+        texto = json.dumps(valores, default=str)
+        return base64.urlsafe_b64encode(texto.encode()).decode()
+
+    def _depois_de(self, modelo, cursor):
+        """
+        Condição "linha posterior ao cursor" para a ordenação composta:
+        (a > x) OR (a = x AND b > y) ..., precedida de a >= x para que o
+        banco percorra o índice a partir do cursor.
+        """
+        try:
+            valores = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            campos = [modelo._meta.get_field(campo) for campo in self.ordenacao_keyset]
+            valores = [campo.to_python(valor) for campo, valor in zip(campos, valores, strict=True)]
+        except (ValueError, TypeError, ValidationError):
+            raise NotFound('Cursor inválido.')
+
+        nomes = self.ordenacao_keyset
+        condicao = Q()
+        for posicao in range(len(nomes)):
+            iguais = {nome: valor for nome, valor in zip(nomes[:posicao], valores)}
+            condicao |= Q(**iguais, **{f'{nomes[posicao]}__gt': valores[posicao]})
+        return Q(**{f'{nomes[0]}__gte': valores[0]}) & condicao
+
+
+class PaginacaoAgendamento(PaginacaoKeysetOpcional):
+    ordenacao_keyset = ('data_agendamento', 'id')
+
+
+class PaginacaoCliente(PaginacaoKeysetOpcional):
+    ordenacao_keyset = ('nome', 'id')
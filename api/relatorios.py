@@ -0,0 +1,276 @@
+"""
+Relatórios de receita e ocupação a partir dos resumos diários.
+
+ResumoDiario guarda, por dia, serviço e status, a quantidade de
+agendamentos, a receita (o preço guardado em cada agendamento, não o atual
+do serviço) e os minutos reservados (o intervalo guardado em cada
+agendamento, não a duração atual do serviço). Cada gravação de agendamento agenda o
+recálculo dos dias/serviços afetados para depois do commit; os relatórios
+somam os resumos em vez de percorrer Agendamento.
+"""
+import threading
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Sum
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+
+from . import agenda
+from .models import Agendamento, ResumoDiario, Servico
+
+# Receita realizada e prevista; cancelados não contam receita nem ocupação
+STATUS_REALIZADOS = ['concluido']
+STATUS_PREVISTOS = agenda.STATUS_ATIVOS
+STATUS_OCUPANTES = STATUS_PREVISTOS + STATUS_REALIZADOS
+
+_local = threading.local()
+
+
+def agregar(queryset):
+    """Linhas (dia, servico_id, status, quantidade, receita, duracao) dos agendamentos"""
+    return queryset.order_by().annotate(
+        dia=TruncDate('data_agendamento', tzinfo=timezone.get_current_timezone())
+    ).values('dia', 'servico_id', 'status').annotate(
+        quantidade=Count('id'),
+        receita=Sum('preco'),
+        duracao=Sum(ExpressionWrapper(F('data_fim') - F('data_agendamento'), output_field=DurationField())),
+    )
+
+
+def _minutos(duracao):
+    return int(duracao.total_seconds() // 60) if duracao else 0
+
+
+def _gravar(linhas):
+    ResumoDiario.objects.bulk_create(
+        [
+            ResumoDiario(
+                data=linha['dia'], servico_id=linha['servico_id'], status=linha['status'],
+                quantidade=linha['quantidade'], receita=linha['receita'] or 0, minutos=_minutos(linha['duracao']),
+            )
+            for linha in linhas
+        ],
+        update_conflicts=True,
+        unique_fields=['data', 'servico', 'status'],
+        update_fields=['quantidade', 'receita', 'minutos'],
+    )
+
+
+def recalcular(buckets):
+    """
+    Recalcula os resumos dos pares (dia, servico_id) informados com uma
+    agregação sobre os agendamentos desses dias e serviços.
+
+    Recálculos simultâneos dos mesmos pares se revezam no bloqueio da agenda
+    e cada um só agrega depois de obtê-lo: quem grava por último leu depois
+    de todos os commits anteriores, então um resultado antigo nunca
+    sobrescreve um mais novo.
+    """
+    buckets = set(buckets)
+    if not buckets:
+        return
+
+    dias = [dia for dia, _ in buckets]
+    servico_ids = {servico_id for _, servico_id in buckets}
+    inicio, _ = agenda.intervalo_do_dia(min(dias))
+    _, fim = agenda.intervalo_do_dia(max(dias))
+
+    with transaction.atomic():
+        agenda.bloquear_agenda([
+            (servico_id, agenda.inicio_do_dia(dia), agenda.inicio_do_dia(dia)) for dia, servico_id in buckets
+        ])
+        linhas = [
+            linha for linha in agregar(Agendamento.objects.filter(
+                servico_id__in=servico_ids, data_agendamento__gte=inicio, data_agendamento__lt=fim
+            ))
+            if (linha['dia'], linha['servico_id']) in buckets
+        ]
+        existentes = ResumoDiario.objects.filter(
+            servico_id__in=servico_ids, data__gte=min(dias), data__lte=max(dias)
+        ).values_list('id', 'data', 'servico_id', 'status')
+        atuais = {(linha['dia'], linha['servico_id'], linha['status']) for linha in linhas}
+        obsoletos = [
+            resumo_id for resumo_id, dia, servico_id, status in existentes
+            if (dia, servico_id) in buckets and (dia, servico_id, status) not in atuais
+        ]
+        if obsoletos:
+            ResumoDiario.objects.filter(id__in=obsoletos).delete()
+        _gravar(linhas)
+
+
+def reconstruir(inicio=None, fim=None):
+    """Refaz os resumos do período (datas inclusive; sem limites, de todo o histórico)"""
+    agendamentos = Agendamento.objects.all()
+    resumos = ResumoDiario.objects.all()
+    if inicio:
+        agendamentos = agendamentos.filter(data_agendamento__gte=agenda.inicio_do_dia(inicio))
+        resumos = resumos.filter(data__gte=inicio)
+    if fim:
+        agendamentos = agendamentos.filter(data_agendamento__lt=agenda.intervalo_do_dia(fim)[1])
+        resumos = resumos.filter(data__lte=fim)
+
+    with transaction.atomic():
+        resumos.delete()
+        linhas = list(agregar(agendamentos))
+        _gravar(linhas)
+    return len(linhas)
+
+
+def _pendentes():
+    if not hasattr(_local, 'buckets'):
+        _local.buckets = set()
+    return _local.buckets
+
+
+def _recalcular_pendentes():
+    buckets = set(_pendentes())
+    _pendentes().clear()
+    recalcular(buckets)
+
+
+def agendar_recalculo(buckets):
+    """
+    Recalcula os pares (dia, servico_id) depois do commit da transação atual.
+    Os pares se acumulam até o primeiro callback, então uma exclusão em
+    cascata com muitos agendamentos gera um único recálculo.
+    """
+    _pendentes().update(buckets)
+    transaction.on_commit(_recalcular_pendentes, robust=True)
+
+
+def bucket(data_agendamento, servico_id):
+    return timezone.localdate(data_agendamento), servico_id
+
+
+def periodo(ano, mes=None):
+    """Primeiro e último dia do ano ou do mês"""
+    if mes:
+        inicio = date(ano, mes, 1)
+        proximo = date(ano + 1, 1, 1) if mes == 12 else date(ano, mes + 1, 1)
+        return inicio, proximo - timedelta(days=1)
+    return date(ano, 1, 1), date(ano, 12, 31)
+
+
+def _dias_de_funcionamento(inicio, fim):
+    return sum(1 for dia in agenda.dias_do_periodo(inicio, fim) if agenda.dia_de_funcionamento(dia))
+
+
+def _chave_periodo(valor, mensal):
+    return valor.strftime('%Y-%m') if mensal else valor.isoformat()
+
+
+def _formatar(valores):
+    # Valores monetários como texto com duas casas, como Servico.preco na API
+    return {
+        chave: f'{valor:.2f}' if isinstance(valor, Decimal) else valor
+        for chave, valor in valores.items()
+    }
+
+
+def receita(inicio, fim):
+    """
+    Receita realizada (concluídos) e prevista (agendados e confirmados) do
+    período, por serviço e por mês (ano) ou dia (mês), mais os cancelados.
+    """
+    mensal = (fim - inicio).days > 31
+    resumos = ResumoDiario.objects.filter(data__gte=inicio, data__lte=fim).order_by()
+    por_servico = resumos.values('servico_id', 'servico__nome', 'status').annotate(
+        quantidade=Sum('quantidade'), receita=Sum('receita')
+    )
+    por_periodo = resumos.annotate(
+        periodo=TruncMonth('data') if mensal else F('data')
+    ).values('periodo', 'status').annotate(quantidade=Sum('quantidade'), receita=Sum('receita'))
+
+    def vazio():
+        return {'quantidade': 0, 'receita_realizada': Decimal('0'), 'receita_prevista': Decimal('0'), 'cancelados': 0}
+
+    def somar(destino, linha):
+        destino['quantidade'] += linha['quantidade']
+        if linha['status'] in STATUS_REALIZADOS:
+            destino['receita_realizada'] += linha['receita']
+        elif linha['status'] in STATUS_PREVISTOS:
+            destino['receita_prevista'] += linha['receita']
+        else:
+            destino['cancelados'] += linha['quantidade']
+
+    servicos = defaultdict(vazio)
+    totais = vazio()
+    for linha in por_servico:
+        somar(servicos[(linha['servico_id'], linha['servico__nome'])], linha)
+        somar(totais, linha)
+
+    periodos = defaultdict(vazio)
+    for linha in por_periodo:
+        somar(periodos[_chave_periodo(linha['periodo'], mensal)], linha)
+
+    return {
+        'data_inicio': inicio.isoformat(),
+        'data_fim': fim.isoformat(),
+        'totais': _formatar(totais),
+        'por_servico': [
+            {'servico_id': servico_id, 'servico': nome, **_formatar(valores)}
+            for (servico_id, nome), valores in sorted(servicos.items(), key=lambda item: item[0][1])
+        ],
+        'por_periodo': [{'periodo': chave, **_formatar(valores)} for chave, valores in sorted(periodos.items())],
+    }
+
+
+def ocupacao(inicio, fim):
+    """
+    Minutos reservados (agendados, confirmados e concluídos) contra a
+    capacidade de cada serviço no período: um atendimento por vez, nos
+    dias e horários de funcionamento.
+    """
+    mensal = (fim - inicio).days > 31
+    resumos = ResumoDiario.objects.filter(
+        data__gte=inicio, data__lte=fim, status__in=STATUS_OCUPANTES
+    ).order_by()
+    ocupados = dict(resumos.values_list('servico_id').annotate(Sum('minutos')))
+    por_periodo = resumos.annotate(
+        periodo=TruncMonth('data') if mensal else F('data')
+    ).values_list('periodo').annotate(Sum('minutos'))
+
+    servicos = list(Servico.objects.filter(ativo=True) | Servico.objects.filter(id__in=list(ocupados)))
+    capacidade_servico = _dias_de_funcionamento(inicio, fim) * agenda.MINUTOS_POR_DIA
+
+    def taxa(minutos, capacidade):
+        return round(minutos / capacidade, 4) if capacidade else None
+
+    linhas_periodo = []
+    for valor, minutos in sorted(por_periodo):
+        if mensal:
+            fim_mes = periodo(valor.year, valor.month)[1]
+            dias = _dias_de_funcionamento(max(valor, inicio), min(fim_mes, fim))
+        else:
+            dias = int(agenda.dia_de_funcionamento(valor))
+        capacidade = dias * agenda.MINUTOS_POR_DIA * len(servicos)
+        linhas_periodo.append({
+            'periodo': _chave_periodo(valor, mensal),
+            'minutos_ocupados': minutos,
+            'capacidade_minutos': capacidade,
+            'taxa_ocupacao': taxa(minutos, capacidade),
+        })
+
+    total_ocupado = sum(ocupados.values())
+    capacidade_total = capacidade_servico * len(servicos)
+    return {
+        'data_inicio': inicio.isoformat(),
+        'data_fim': fim.isoformat(),
+        'minutos_ocupados': total_ocupado,
+        'capacidade_minutos': capacidade_total,
+        'taxa_ocupacao': taxa(total_ocupado, capacidade_total),
+        'por_servico': [
+            {
+                'servico_id': servico.id,
+                'servico': servico.nome,
+                'minutos_ocupados': ocupados.get(servico.id, 0),
+                'capacidade_minutos': capacidade_servico,
+                'taxa_ocupacao': taxa(ocupados.get(servico.id, 0), capacidade_servico),
+            }
+            for servico in sorted(servicos, key=lambda servico: servico.nome)
+        ],
+        'por_periodo': linhas_periodo,
+    }
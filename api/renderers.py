@@ -0,0 +1,46 @@
+"""
+Renderer e parser JSON com orjson.
+
+A saída é a mesma do JSONRenderer do DRF (compacta, UTF-8): tipos que o
+orjson não codifica do mesmo jeito (datas, decimais, textos traduzíveis)
+passam pelo JSONEncoder do DRF.
+"""
+import orjson
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+OPCOES = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+_codificador = JSONEncoder()
+
+
+class ORJSONRenderer(JSONRenderer):
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        # Indentação pedida no Accept (ex.: "application/json; indent=4") fica com o renderer do DRF
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        conteudo = orjson.dumps(data, default=_codificador.default, option=OPCOES)
+        # Como o DRF: separadores de linha Unicode escapados (JSON válido dentro de <script>)
+        return conteudo.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class ORJSONParser(JSONParser):
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        try:
+            conteudo = stream.read() if stream is not None else b''
+            if encoding.lower().replace('-', '') != 'utf8':
+                conteudo = conteudo.decode(encoding)
+            return orjson.loads(conteudo)
+        except (ValueError, UnicodeDecodeError) as exc:
+            raise ParseError(f'JSON parse error - {exc}')
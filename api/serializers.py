@@ -1,17 +1,25 @@
 from rest_framework import serializers
-from .models import Cliente, Pet, Servico, Agendamento
+from . import agenda
+from .campos import CamposDinamicosMixin
+from .models import Cliente, Pet, Servico, Agendamento, SerieAgendamento
 
-class ClienteSerializer(serializers.ModelSerializer):
+class ClienteSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     total_pets = serializers.SerializerMethodField()
     
     class Meta:
         model = Cliente
         fields = '__all__'
+        # total_pets vem da anotação, não de uma coluna
+        colunas_por_metodo = {'total_pets': ()}
+        # ... e, na listagem rápida, é lido direto da anotação de mesmo nome
+        metodos_anotados = ('total_pets',)
     
     def get_total_pets(self, obj):
-        return obj.pets.count()
+        # Usa a anotação de Cliente.objects.com_total_pets() quando disponível
+        total = getattr(obj, 'total_pets', None)
+        return obj.pets.count() if total is None else total
 
-class PetSerializer(serializers.ModelSerializer):
+class PetSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     cliente_nome = serializers.CharField(source='cliente.nome', read_only=True)
     especie_display = serializers.CharField(source='get_especie_display', read_only=True)
     
@@ -19,12 +27,12 @@ class PetSerializer(serializers.ModelSerializer):
         model = Pet
         fields = '__all__'
 
-class ServicoSerializer(serializers.ModelSerializer):
+class ServicoSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     class Meta:
         model = Servico
         fields = '__all__'
 
-class AgendamentoSerializer(serializers.ModelSerializer):
+class AgendamentoSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     pet_nome = serializers.CharField(source='pet.nome', read_only=True)
     servico_nome = serializers.CharField(source='servico.nome', read_only=True)
     cliente_nome = serializers.CharField(source='pet.cliente.nome', read_only=True)
@@ -33,6 +41,8 @@ class AgendamentoSerializer(serializers.ModelSerializer):
     class Meta:
         model = Agendamento
         fields = '__all__'
+        # Ocorrências de séries são materializadas por SerieAgendamentoViewSet.materializar
+        read_only_fields = ['serie', 'data_original']
     
     def validate_data_agendamento(self, value):
         """Validação personalizada para a data do agendamento"""
@@ -47,6 +57,65 @@ class AgendamentoSerializer(serializers.ModelSerializer):
         
         return value
 
+class SerieAgendamentoSerializer(serializers.ModelSerializer):
+    pet_nome = serializers.CharField(source='pet.nome', read_only=True)
+    servico_nome = serializers.CharField(source='servico.nome', read_only=True)
+    frequencia_display = serializers.CharField(source='get_frequencia_display', read_only=True)
+    
+    class Meta:
+        model = SerieAgendamento
+        fields = '__all__'
+    
+    def validate_inicio(self, value):
+        """A primeira ocorrência segue as regras de um agendamento comum"""
+        from django.utils import timezone
+        
+        if value < timezone.now():
+            raise serializers.ValidationError("Não é possível agendar para o passado.")
+        
+        if value.weekday() == 6:  # Domingo
+            raise serializers.ValidationError("Não funcionamos aos domingos.")
+        
+        if not 8 <= value.hour <= 18:
+            raise serializers.ValidationError("Horário fora do funcionamento (8h às 18h).")
+        
+        return value
+    
+    def validate(self, attrs):
+        data_limite = attrs.get('data_limite')
+        if data_limite and 'inicio' in attrs and data_limite < attrs['inicio'].date():
+            raise serializers.ValidationError("A data limite é anterior ao início da série.")
+        return attrs
+
+class MaterializarOcorrenciaSerializer(serializers.Serializer):
+    """Dados para transformar uma ocorrência de série em um agendamento próprio"""
+    data_original = serializers.DateTimeField()
+    data_agendamento = serializers.DateTimeField(required=False)
+    status = serializers.ChoiceField(choices=Agendamento.STATUS_CHOICES, required=False)
+    observacoes = serializers.CharField(required=False, allow_blank=True)
+
+# Serializers para operações em lote
+class RelacionadoPreCarregadoField(serializers.PrimaryKeyRelatedField):
+    """PrimaryKeyRelatedField que usa os objetos já carregados em context['precarregados']"""
+    
+    def to_internal_value(self, data):
+        precarregados = self.context.get('precarregados', {}).get(self.queryset.model, {})
+        try:
+            return precarregados[int(data)]
+        except (KeyError, TypeError, ValueError):
+            return super().to_internal_value(data)
+
+class AgendamentoLoteSerializer(AgendamentoSerializer):
+    """Valida um item da criação em lote sem consultar pet e serviço um a um"""
+    pet = RelacionadoPreCarregadoField(queryset=Pet.objects.all())
+    servico = RelacionadoPreCarregadoField(queryset=Servico.objects.all())
+
+class StatusLoteSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(), allow_empty=False, max_length=agenda.MAX_ITENS_LOTE
+    )
+    status = serializers.ChoiceField(choices=Agendamento.STATUS_CHOICES)
+
 # Serializers para detalhes (usados nas views de detail)
 class PetDetailSerializer(serializers.ModelSerializer):
     cliente_nome = serializers.CharField(source='cliente.nome', read_only=True)
@@ -59,11 +128,15 @@ class PetDetailSerializer(serializers.ModelSerializer):
         fields = '__all__'
     
     def get_total_agendamentos(self, obj):
-        return obj.agendamentos.count()
+        # Usa a anotação de Pet.objects.com_agendamentos() quando disponível
+        total = getattr(obj, 'total_agendamentos', None)
+        return obj.agendamentos.count() if total is None else total
     
     def get_agendamentos_recentes(self, obj):
-        agendamentos = obj.agendamentos.all().order_by('-data_agendamento')[:5]
-        return AgendamentoSerializer(agendamentos, many=True).data
+        agendamentos = getattr(obj, 'agendamentos_recentes', None)
+        if agendamentos is None:
+            agendamentos = obj.agendamentos.select_related('servico').order_by('-data_agendamento')
+        return AgendamentoSerializer(agendamentos[:5], many=True).data
 
 class ClienteDetailSerializer(serializers.ModelSerializer):
     total_pets = serializers.SerializerMethodField()
@@ -74,11 +147,13 @@ class ClienteDetailSerializer(serializers.ModelSerializer):
         fields = '__all__'
     
     def get_total_pets(self, obj):
-        return obj.pets.count()
+        # Usa a anotação de Cliente.objects.com_total_pets() quando disponível
+        total = getattr(obj, 'total_pets', None)
+        return obj.pets.count() if total is None else total
     
     def get_pets_list(self, obj):
-        pets = obj.pets.all()
-        return PetSerializer(pets, many=True).data
+        # Com Cliente.objects.com_pets() os pets (e o cliente de cada um) já vêm carregados
+        return PetSerializer(obj.pets.all(), many=True).data
 
 # Serializers para estatísticas e relatórios
 class ClienteEstatisticasSerializer(serializers.Serializer):
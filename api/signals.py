@@ -0,0 +1,92 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from . import agenda
+from . import cache as cache_api
+from . import eventos
+from . import relatorios
+from . import sincronizacao
+from . import tarefas
+from .models import Cliente, Pet, Servico, Agendamento, SerieAgendamento
+
+
+@receiver([post_save, post_delete], sender=Cliente)
+@receiver([post_save, post_delete], sender=Pet)
+@receiver([post_save, post_delete], sender=Servico)
+@receiver([post_save, post_delete], sender=Agendamento)
+@receiver([post_save, post_delete], sender=SerieAgendamento)
+def invalidar_cache(sender, **kwargs):
+    """Muda, após o commit, a versão do modelo no cache, descartando respostas que dependem dele"""
+    cache_api.invalidar_apos_commit(sender)
+
+
+@receiver(post_save, sender=Agendamento)
+def registrar_alteracao(sender, instance, created, raw=False, **kwargs):
+    """Publica a criação ou alteração do agendamento no feed de eventos"""
+    if raw:
+        return
+    status_original = getattr(instance, 'status_original', None)
+    if created:
+        eventos.registrar(instance, 'criado')
+    elif status_original is not None and status_original != instance.status:
+        eventos.registrar(instance, 'status', status_original)
+    else:
+        eventos.registrar(instance, 'atualizado')
+
+
+@receiver(post_delete, sender=Agendamento)
+def registrar_exclusao(sender, instance, **kwargs):
+    eventos.registrar(instance, 'excluido', instance.status)
+
+
+@receiver([post_save, post_delete], sender=Cliente)
+@receiver([post_save, post_delete], sender=Pet)
+@receiver([post_save, post_delete], sender=Servico)
+@receiver([post_save, post_delete], sender=Agendamento)
+@receiver([post_save, post_delete], sender=SerieAgendamento)
+def registrar_sincronizacao(sender, instance, raw=False, **kwargs):
+    """Registra a gravação ou a exclusão para a sincronização incremental dos clientes offline"""
+    if raw:
+        return
+    sincronizacao.registrar(sender, [instance.pk], excluido=kwargs['signal'] is post_delete)
+
+
+@receiver(post_save, sender=Agendamento)
+@receiver(post_delete, sender=Agendamento)
+def atualizar_resumos(sender, instance, **kwargs):
+    """Recalcula, após o commit, os resumos diários do dia/serviço atual e do anterior"""
+    if kwargs.get('raw'):
+        return
+    buckets = {relatorios.bucket(instance.data_agendamento, instance.servico_id)}
+    data_original = getattr(instance, 'data_agendamento_original', None)
+    if data_original:
+        buckets.add(relatorios.bucket(data_original, instance.servico_id_original))
+    relatorios.agendar_recalculo(buckets)
+
+
+@receiver(post_save, sender=Agendamento)
+def agendar_lembrete(sender, instance, created, raw=False, **kwargs):
+    """Agenda o lembrete na criação, na remarcação e na reativação; cancela ao desativar"""
+    if raw:
+        return
+    status_original = getattr(instance, 'status_original', None)
+    data_original = getattr(instance, 'data_agendamento_original', None)
+    if instance.status not in agenda.STATUS_ATIVOS:
+        if not created and status_original in agenda.STATUS_ATIVOS:
+            tarefas.cancelar_lembretes([instance.id])
+    elif created or status_original not in agenda.STATUS_ATIVOS or data_original != instance.data_agendamento:
+        tarefas.agendar_lembrete(instance)
+
+
+@receiver(post_delete, sender=Agendamento)
+def cancelar_lembrete(sender, instance, **kwargs):
+    tarefas.cancelar_lembretes([instance.pk])
+
+
+@receiver(post_save, sender=Agendamento)
+def atualizar_valores_originais(sender, instance, **kwargs):
+    """Conectado por último: os receptores acima ainda veem os valores anteriores à gravação"""
+    instance.status_original = instance.status
+    instance.data_agendamento_original = instance.data_agendamento
+    instance.servico_id_original = instance.servico_id
+
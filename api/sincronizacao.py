@@ -0,0 +1,135 @@
+"""
+Sincronização incremental para clientes offline (app do tablet).
+
+Cada criação, alteração ou exclusão dos modelos sincronizados grava uma
+AlteracaoSincronizacao na mesma transação (ver signals.py e as gravações em
+lote). Como no feed de eventos, os ids são confirmados em ordem (ver
+eventos.bloquear_feed): o token guarda o último id lido e a sincronização
+seguinte lê só os ids maiores, sem depender do relógio nem do momento do
+commit. A primeira sincronização devolve todos os registros.
+"""
+import base64
+from datetime import datetime, timedelta
+
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from . import eventos
+from .models import Cliente, Pet, Servico, SerieAgendamento, Agendamento, AlteracaoSincronizacao
+from .streaming import TAMANHO_LOTE
+
+# Nome de cada modelo nas linhas da sincronização
+MODELOS = {
+    'cliente': Cliente,
+    'pet': Pet,
+    'servico': Servico,
+    'serie': SerieAgendamento,
+    'agendamento': Agendamento,
+}
+
+# Validade dos tokens; tokens mais antigos exigem uma nova sincronização completa
+RETENCAO_ALTERACOES = timedelta(days=30)
+
+# limpar_historico guarda as alterações um pouco além da validade dos tokens:
+# uma alteração gravada pouco antes da emissão do token, numa transação
+# confirmada depois, ainda precisa ser lida com ele
+MARGEM_RETENCAO = timedelta(days=1)
+
+
+class TokenExpirado(Exception):
+    pass
+
+
+def codificar_token(posicao, instante=None):
+    valor = f'{posicao}|{(instante or timezone.now()).isoformat()}'
+    return base64.urlsafe_b64encode(valor.encode()).decode()
+
+
+def ler_token(token):
+    """
+    Posição representada pelo token; levanta ValueError se inválido e
+    TokenExpirado se antigo (ou no formato anterior, baseado só em data)
+    """
+    valor = base64.urlsafe_b64decode(token.encode()).decode()
+    posicao, separador, emissao = valor.partition('|')
+    if not separador:
+        datetime.fromisoformat(valor)
+        raise TokenExpirado
+    posicao, instante = int(posicao), datetime.fromisoformat(emissao)
+    if posicao < 0 or timezone.is_naive(instante):
+        raise ValueError(token)
+    if instante < timezone.now() - RETENCAO_ALTERACOES:
+        raise TokenExpirado
+    return posicao
+
+
+def registrar(modelo, ids, excluido=False):
+    """
+    Registra a alteração (ou exclusão) dos registros `ids` de `modelo` na
+    transação atual; bulk_create e update, que não disparam sinais, chamam
+    esta função diretamente
+    """
+    novos = [
+        AlteracaoSincronizacao(modelo=modelo._meta.label_lower, objeto_id=objeto_id, excluido=excluido)
+        for objeto_id in ids
+    ]
+    if not novos:
+        return
+    banco = router.db_for_write(AlteracaoSincronizacao)
+    with transaction.atomic(using=banco, savepoint=False):
+        eventos.bloquear_feed(connections[banco])
+        AlteracaoSincronizacao.objects.using(banco).bulk_create(novos, batch_size=TAMANHO_LOTE)
+
+
+def posicao_atual():
+    return AlteracaoSincronizacao.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def _completos():
+    for nome, modelo in MODELOS.items():
+        campos = [campo.name for campo in modelo._meta.concrete_fields]
+        for dados in modelo.objects.order_by().values(*campos).iterator(chunk_size=TAMANHO_LOTE):
+            yield {'modelo': nome, 'dados': dados}
+
+
+def _alterados(desde, ate):
+    """
+    Linhas das alterações com id em (desde, ate], lidas em lotes. Em cada lote
+    vale o último registro de cada objeto: os alterados vêm com os dados
+    atuais (se ainda existirem; a exclusão chega num lote seguinte) e os
+    excluídos, como exclusão.
+    """
+    nomes = {modelo._meta.label_lower: nome for nome, modelo in MODELOS.items()}
+    alteracoes = AlteracaoSincronizacao.objects.filter(id__lte=ate, modelo__in=nomes).order_by('id')
+    while True:
+        lote = list(alteracoes.filter(id__gt=desde).values_list('id', 'modelo', 'objeto_id', 'excluido')[:TAMANHO_LOTE])
+        if not lote:
+            return
+        desde = lote[-1][0]
+
+        ultimos = {(nomes[modelo], objeto_id): excluido for _, modelo, objeto_id, excluido in lote}
+        for nome, modelo in MODELOS.items():
+            ids = [objeto_id for (chave, objeto_id), excluido in ultimos.items() if chave == nome and not excluido]
+            if ids:
+                campos = [campo.name for campo in modelo._meta.concrete_fields]
+                for dados in modelo.objects.filter(id__in=ids).order_by('id').values(*campos):
+                    yield {'modelo': nome, 'dados': dados}
+        for (nome, objeto_id), excluido in ultimos.items():
+            if excluido:
+                yield {'modelo': nome, 'excluido': objeto_id}
+
+
+def registros(desde=None):
+    """
+    Gera as linhas da sincronização: {'modelo', 'dados'} para registros
+    novos ou alterados, {'modelo', 'excluido'} para exclusões e, por último,
+    {'token'} para a próxima chamada. A posição do token é lida antes dos
+    registros: o que for confirmado durante a leitura pode vir agora e de
+    novo na sincronização seguinte (basta sobrescrevê-lo), mas nunca se perde.
+    """
+    posicao = posicao_atual()
+    if desde is None:
+        yield from _completos()
+    else:
+        yield from _alterados(desde, posicao)
+    yield {'token': codificar_token(posicao)}
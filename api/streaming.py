@@ -0,0 +1,71 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+# Linhas por leitura do cursor ao percorrer querysets grandes
+TAMANHO_LOTE = 2000
+
+
+def ndjson(objetos):
+    """Codifica cada objeto como uma linha JSON compacta"""
+    for objeto in objetos:
+        yield json.dumps(objeto, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+
+def resposta_ndjson(objetos, status=200):
+    """
+    Resposta NDJSON (um objeto JSON por linha) gerada sob demanda: as linhas
+    saem à medida que são lidas, sem montar o corpo inteiro em memória.
+    """
+    resposta = StreamingHttpResponse(ndjson(objetos), status=status, content_type='application/x-ndjson')
+    resposta['Cache-Control'] = 'no-store'
+    resposta['X-Accel-Buffering'] = 'no'
+    return resposta
+
+
+class _Eco:
+    """Pseudo-arquivo para o csv.writer: devolve a linha em vez de guardá-la"""
+
+    def write(self, valor):
+        return valor
+
+
+def _valor_csv(valor):
+    if valor is None:
+        return ''
+    if isinstance(valor, (str, int, float)):
+        return valor
+    # Datas, decimais etc. no mesmo formato da API (ISO 8601, decimais como texto)
+    return DjangoJSONEncoder().default(valor)
+
+
+def csv_linhas(campos, objetos):
+    """Cabeçalho e uma linha CSV por dicionário, na ordem de `campos`"""
+    escritor = csv.writer(_Eco())
+    yield escritor.writerow(campos)
+    for objeto in objetos:
+        yield escritor.writerow([_valor_csv(objeto[campo]) for campo in campos])
+
+
+def resposta_csv(campos, objetos, nome_arquivo):
+    """Resposta CSV gerada sob demanda, baixada como `nome_arquivo`"""
+    resposta = StreamingHttpResponse(csv_linhas(campos, objetos), content_type='text/csv; charset=utf-8')
+    resposta['Content-Disposition'] = f'attachment; filename="{nome_arquivo}"'
+    resposta['X-Accel-Buffering'] = 'no'
+    return resposta
+
+
+def exportar(request, queryset, campos, nome):
+    """
+    Exporta os `campos` (lookups de .values()) do queryset em CSV
+    (padrão) ou NDJSON (?formato=ndjson), lendo do banco em lotes.
+    """
+    linhas = queryset.values(*campos).iterator(chunk_size=TAMANHO_LOTE)
+    if request.query_params.get('formato') == 'ndjson':
+        resposta = resposta_ndjson(linhas)
+        resposta['Content-Disposition'] = f'attachment; filename="{nome}.ndjson"'
+        return resposta
+    return resposta_csv(campos, linhas, f'{nome}.csv')
+
@@ -0,0 +1,264 @@
+"""
+Fila de tarefas em segundo plano, guardada no banco (modelo Tarefa), para
+o que não precisa acontecer dentro da requisição: lembretes, conclusão
+automática dos agendamentos passados, relatórios pesados, limpezas.
+
+Tarefas são funções registradas com @tarefa e enfileiradas com agendar(),
+na mesma transação da gravação que as originou. O comando
+`manage.py processar_tarefas` roda os workers (quantos processos forem
+necessários): cada um reserva tarefas vencidas com
+SELECT ... FOR UPDATE SKIP LOCKED, então dois workers nunca pegam a mesma.
+Erros reagendam a tarefa com espera exponencial até esgotar as tentativas.
+"""
+import logging
+import traceback
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+
+from django.conf import settings
+from django.core.mail import send_mail
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import agenda
+from . import relatorios
+from .models import Agendamento, AlteracaoSincronizacao, Tarefa
+from .sincronizacao import MARGEM_RETENCAO, RETENCAO_ALTERACOES
+
+logger = logging.getLogger(__name__)
+
+Registro = namedtuple('Registro', ['funcao', 'max_tentativas', 'intervalo'])
+
+TAREFAS = {}
+
+# Espera antes de uma nova tentativa: ESPERA_BASE * 2^(tentativas - 1), até ESPERA_MAXIMA
+ESPERA_BASE = timedelta(seconds=30)
+ESPERA_MAXIMA = timedelta(hours=6)
+
+# Tarefa em execução há mais tempo que isso é de um worker que morreu e volta para a fila
+TEMPO_LIMITE_EXECUCAO = timedelta(minutes=30)
+
+# Tarefas concluídas ou que falharam ficam guardadas para consulta no admin
+RETENCAO_TAREFAS = timedelta(days=7)
+
+# Agendamentos concluídos automaticamente por transação
+TAMANHO_LOTE_CONCLUSAO = 500
+
+
+def tarefa(nome=None, max_tentativas=5, intervalo=None):
+    """
+    Registra a função como tarefa. Com `intervalo` (timedelta) ela é
+    periódica: o worker a agenda ao iniciar e ela se reagenda ao terminar.
+    """
+    def registrar(funcao):
+        TAREFAS[nome or funcao.__name__] = Registro(funcao, max_tentativas, intervalo)
+        return funcao
+    return registrar
+
+
+def agendar(nome, argumentos=None, executar_em=None, chave=None):
+    """
+    Enfileira a tarefa na transação atual. Com `chave`, substitui a tarefa
+    pendente de mesma chave (ex.: o lembrete de um agendamento remarcado).
+    Os argumentos precisam ser serializáveis em JSON.
+    """
+    if nome not in TAREFAS:
+        raise ValueError(f'Tarefa desconhecida: {nome}')
+    valores = {
+        'nome': nome, 'argumentos': argumentos or {}, 'executar_em': executar_em or timezone.now(),
+        'tentativas': 0, 'erro': '',
+    }
+    if chave and Tarefa.objects.filter(chave=chave, status='pendente').update(**valores):
+        return
+    try:
+        with transaction.atomic():
+            Tarefa.objects.create(chave=chave, **valores)
+    except IntegrityError:
+        # Outra transação enfileirou a mesma chave entre o UPDATE e o INSERT
+        pass
+
+
+def cancelar(*chaves):
+    """Remove as tarefas pendentes com as chaves informadas"""
+    Tarefa.objects.filter(chave__in=chaves, status='pendente').delete()
+
+
+def _chave_lembrete(agendamento_id):
+    return f'lembrete:{agendamento_id}'
+
+
+def _lembrete(agendamento):
+    """Tarefa (não salva) do lembrete do agendamento, ou None se já passou"""
+    agora = timezone.now()
+    if agendamento.status not in agenda.STATUS_ATIVOS or agendamento.data_agendamento <= agora:
+        return None
+    antecedencia = timedelta(hours=getattr(settings, 'LEMBRETE_ANTECEDENCIA_HORAS', 24))
+    return Tarefa(
+        nome='lembrete_agendamento',
+        chave=_chave_lembrete(agendamento.id),
+        argumentos={'agendamento_id': agendamento.id, 'data_agendamento': agendamento.data_agendamento.isoformat()},
+        executar_em=max(agendamento.data_agendamento - antecedencia, agora),
+    )
+
+
+def agendar_lembrete(agendamento):
+    """Agenda (ou remarca) o lembrete por e-mail do agendamento"""
+    lembrete = _lembrete(agendamento)
+    if lembrete is None:
+        cancelar_lembretes([agendamento.id])
+    else:
+        agendar(lembrete.nome, lembrete.argumentos, lembrete.executar_em, lembrete.chave)
+
+
+def agendar_lembretes(agendamentos):
+    """Lembretes de agendamentos recém-criados em lote, com um único INSERT"""
+    lembretes = [lembrete for lembrete in map(_lembrete, agendamentos) if lembrete is not None]
+    Tarefa.objects.bulk_create(lembretes, ignore_conflicts=True)
+
+
+def cancelar_lembretes(agendamento_ids):
+    cancelar(*map(_chave_lembrete, agendamento_ids))
+
+
+def agendar_periodicas():
+    """Enfileira as tarefas periódicas que ainda não estão na fila"""
+    for nome, registro in TAREFAS.items():
+        chave = f'periodica:{nome}'
+        if registro.intervalo and not Tarefa.objects.filter(
+            chave=chave, status__in=['pendente', 'executando']
+        ).exists():
+            agendar(nome, chave=chave)
+
+
+def reservar(limite):
+    """
+    Marca como em execução até `limite` tarefas vencidas e as retorna.
+    Sem SKIP LOCKED (SQLite), cada tarefa é reservada por um UPDATE
+    condicional: o worker que não conseguir mudar o status a deixa para o outro.
+    """
+    conexao = connections[router.db_for_write(Tarefa)]
+    agora = timezone.now()
+    vencidas = Tarefa.objects.filter(status='pendente', executar_em__lte=agora).order_by('executar_em', 'id')
+    alteracao = {'status': 'executando', 'data_inicio': agora, 'tentativas': F('tentativas') + 1}
+
+    with transaction.atomic():
+        if conexao.features.has_select_for_update_skip_locked:
+            tarefas = list(vencidas.select_for_update(skip_locked=True)[:limite])
+            Tarefa.objects.filter(id__in=[tarefa.id for tarefa in tarefas]).update(**alteracao)
+        else:
+            tarefas = [
+                tarefa for tarefa in vencidas[:limite]
+                if Tarefa.objects.filter(id=tarefa.id, status='pendente').update(**alteracao)
+            ]
+    for tarefa in tarefas:
+        tarefa.status = 'executando'
+        tarefa.data_inicio = agora
+        tarefa.tentativas += 1
+    return tarefas
+
+
+def _espera(tentativas):
+    return min(ESPERA_BASE * 2 ** (tentativas - 1), ESPERA_MAXIMA)
+
+
+def executar(tarefa):
+    """
+    Executa uma tarefa reservada e grava o resultado. A função da tarefa
+    controla as próprias transações. Retorna True se deu certo.
+    """
+    registro = TAREFAS.get(tarefa.nome)
+    try:
+        if registro is None:
+            raise LookupError(f'Tarefa desconhecida: {tarefa.nome}')
+        registro.funcao(**tarefa.argumentos)
+    except Exception:
+        agora = timezone.now()
+        ultima = registro is None or tarefa.tentativas >= registro.max_tentativas
+        logger.exception('Tarefa %s #%s falhou (tentativa %d)', tarefa.nome, tarefa.id, tarefa.tentativas)
+        Tarefa.objects.filter(id=tarefa.id).update(
+            status='falhou' if ultima else 'pendente',
+            erro=traceback.format_exc(),
+            executar_em=tarefa.executar_em if ultima else agora + _espera(tarefa.tentativas),
+            data_conclusao=agora if ultima else None,
+        )
+        sucesso = False
+    else:
+        ultima = True
+        Tarefa.objects.filter(id=tarefa.id).update(status='concluida', erro='', data_conclusao=timezone.now())
+        sucesso = True
+
+    if ultima and registro is not None and registro.intervalo:
+        agendar(tarefa.nome, tarefa.argumentos, timezone.now() + registro.intervalo, f'periodica:{tarefa.nome}')
+    return sucesso
+
+
+def executar_pendentes(limite=10):
+    """Reserva e executa um lote de tarefas vencidas. Retorna (executadas, falhas)"""
+    tarefas = reservar(limite)
+    falhas = sum(not executar(tarefa) for tarefa in tarefas)
+    return len(tarefas), falhas
+
+
+def liberar_abandonadas():
+    """Devolve à fila as tarefas em execução há mais de TEMPO_LIMITE_EXECUCAO"""
+    return Tarefa.objects.filter(
+        status='executando', data_inicio__lt=timezone.now() - TEMPO_LIMITE_EXECUCAO
+    ).update(status='pendente', executar_em=timezone.now())
+
+
+@tarefa()
+def lembrete_agendamento(agendamento_id, data_agendamento):
+    """Envia ao cliente o lembrete do agendamento"""
+    agendamento = Agendamento.objects.com_relacionados().filter(id=agendamento_id).first()
+    # Excluído, cancelado ou remarcado depois de o lembrete ser agendado
+    if (
+        agendamento is None
+        or agendamento.status not in agenda.STATUS_ATIVOS
+        or agendamento.data_agendamento != datetime.fromisoformat(data_agendamento)
+    ):
+        return
+    cliente = agendamento.pet.cliente
+    quando = timezone.localtime(agendamento.data_agendamento)
+    send_mail(
+        f'Lembrete: {agendamento.servico.nome} de {agendamento.pet.nome} em {quando:%d/%m às %H:%M}',
+        f'Olá, {cliente.nome}!\n\n'
+        f'Lembramos que {agendamento.pet.nome} tem {agendamento.servico.nome} agendado para '
+        f'{quando:%d/%m/%Y às %H:%M}.\n\nAté breve!',
+        None,
+        [cliente.email],
+    )
+
+
+@tarefa(intervalo=timedelta(hours=1))
+def concluir_agendamentos_passados():
+    """Conclui os agendamentos ativos que terminaram antes do dia de hoje"""
+    limite = agenda.inicio_do_dia(timezone.localdate())
+    while True:
+        atuais = dict(
+            Agendamento.objects.filter(status__in=agenda.STATUS_ATIVOS, data_fim__lte=limite)
+            .order_by('id').values_list('id', 'status')[:TAMANHO_LOTE_CONCLUSAO]
+        )
+        if not atuais or not agenda.alterar_status_em_lote(list(atuais), 'concluido', atuais):
+            return
+
+
+@tarefa(intervalo=timedelta(days=1))
+def limpar_historico():
+    """Remove alterações fora da janela de sincronização e tarefas antigas"""
+    agora = timezone.now()
+    AlteracaoSincronizacao.objects.filter(
+        data_registro__lt=agora - RETENCAO_ALTERACOES - MARGEM_RETENCAO
+    ).delete()
+    Tarefa.objects.filter(
+        status__in=['concluida', 'falhou'], data_conclusao__lt=agora - RETENCAO_TAREFAS
+    ).delete()
+
+
+@tarefa(max_tentativas=3)
+def reconstruir_resumos(inicio=None, fim=None):
+    """Reconstrói os resumos diários do período (datas em ISO 8601)"""
+    relatorios.reconstruir(
+        date.fromisoformat(inicio) if inicio else None,
+        date.fromisoformat(fim) if fim else None,
+    )
@@ -1,3 +1,1171 @@
-from django.test import TestCase
+import base64
+import csv
+import importlib
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.core import mail
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.cache import cache
+from django.db import IntegrityError, connection, connections
+from django.db.backends.postgresql.base import DatabaseWrapper as PostgreSQLWrapper
+from django.http import HttpResponse
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APITestCase
+
+from . import agenda, busca, eventos, instrumentacao, relatorios, tarefas
+from .models import (
+    Cliente, Pet, Servico, Agendamento, SerieAgendamento, ResumoDiario, Tarefa, EventoAgenda, AlteracaoSincronizacao
+)
+from .renderers import ORJSONRenderer
+
+
+def criar_agendamentos(quantidade, dia=None, inicio=0):
+    """Cria agendamentos com pet, cliente e serviço próprios (sem passar por save)"""
+    dia = dia or timezone.localdate() + timedelta(days=1)
+    agendamentos = []
+    for n in range(inicio, inicio + quantidade):
+        cliente = Cliente.objects.create(nome=f'Cliente {n}', email=f'cliente{n}@email.com', telefone='0')
+        pet = Pet.objects.create(nome=f'Pet {n}', especie='C', cliente=cliente)
+        servico = Servico.objects.create(nome=f'Serviço {n}', preco=10, duracao_estimada=60)
+        data = timezone.make_aware(datetime.combine(dia, time(9, 0)))
+        agendamentos.append(Agendamento(
+            pet=pet, servico=servico, data_agendamento=data, data_fim=data + timedelta(hours=1),
+            preco=servico.preco
+        ))
+    return Agendamento.objects.bulk_create(agendamentos)
+
+
+class ConsultasConstantesTests(APITestCase):
+    """Garante que o número de consultas por endpoint não cresce com a página"""
+
+    def contar_consultas(self, url):
+        with CaptureQueriesContext(connection) as consultas:
+            resposta = self.client.get(url, secure=True)
+        self.assertEqual(resposta.status_code, 200)
+        return len(consultas)
+
+    def assertConsultasConstantes(self, url, criar):
+        criar(1, 0)
+        poucas = self.contar_consultas(url)
+        criar(14, 1)
+        self.assertEqual(self.contar_consultas(url), poucas)
+
+    def test_lista_agendamentos(self):
+        self.assertConsultasConstantes(
+            '/api/agendamentos/', lambda n, inicio: criar_agendamentos(n, inicio=inicio)
+        )
+
+    def test_agendamentos_hoje(self):
+        hoje = timezone.localdate()
+        self.assertConsultasConstantes(
+            '/api/agendamentos/hoje/', lambda n, inicio: criar_agendamentos(n, hoje, inicio)
+        )
+
+    def test_proximos_agendamentos(self):
+        self.assertConsultasConstantes(
+            '/api/agendamentos/proximos/', lambda n, inicio: criar_agendamentos(n, inicio=inicio)
+        )
+
+    def test_lista_pets(self):
+        self.assertConsultasConstantes(
+            '/api/pets/', lambda n, inicio: criar_agendamentos(n, inicio=inicio)
+        )
+
+    def test_lista_clientes(self):
+        self.assertConsultasConstantes(
+            '/api/clientes/', lambda n, inicio: criar_agendamentos(n, inicio=inicio)
+        )
+
+    def test_dashboard_proximos_agendamentos(self):
+        self.assertConsultasConstantes(
+            '/api/dashboard/proximos_agendamentos/', lambda n, inicio: criar_agendamentos(n, inicio=inicio)
+        )
+
+    def test_estatisticas_dashboard(self):
+        cache.clear()
+        agendamento, _ = criar_agendamentos(2, timezone.localdate())
+        Agendamento.objects.filter(id=agendamento.id).update(status='confirmado')
+        Servico.objects.filter(id=agendamento.servico_id).update(ativo=False)
+        with self.assertNumQueries(1):
+            dados = self.client.get('/api/dashboard/estatisticas/', secure=True).json()
+        self.assertEqual(dados, {
+            'total_clientes': 2, 'total_pets': 2, 'total_servicos': 1, 'agendamentos_hoje': 2,
+            'agendamentos_confirmados': 1, 'novos_clientes_30_dias': 2,
+        })
+
+    def test_estatisticas_dashboard_sem_dados(self):
+        cache.clear()
+        dados = self.client.get('/api/dashboard/estatisticas/', secure=True).json()
+        self.assertEqual(set(dados.values()), {0})
+
+        # Sem clientes, as contagens das outras tabelas continuam corretas
+        cache.clear()
+        Servico.objects.create(nome='Banho', preco=35, duracao_estimada=60)
+        dados = self.client.get('/api/dashboard/estatisticas/', secure=True).json()
+        self.assertEqual(dados['total_servicos'], 1)
+        self.assertEqual(dados['total_clientes'], 0)
+
+    def test_detalhes_completos_cliente(self):
+        cliente = Cliente.objects.create(nome='Ana', email='ana@email.com', telefone='0')
+        Pet.objects.bulk_create([Pet(nome=f'Pet {n}', especie='G', cliente=cliente) for n in range(5)])
+        with self.assertNumQueries(2):
+            dados = self.client.get(f'/api/clientes/{cliente.id}/detalhes_completos/', secure=True).json()
+        self.assertEqual(dados['total_pets'], 5)
+        self.assertEqual({pet['cliente_nome'] for pet in dados['pets']}, {'Ana'})
+
+    def test_detalhes_completos_pet(self):
+        agendamentos = criar_agendamentos(1)
+        pet = agendamentos[0].pet
+        servico = agendamentos[0].servico
+        inicio = agendamentos[0].data_agendamento
+        Agendamento.objects.bulk_create([
+            Agendamento(
+                pet=pet, servico=servico, data_agendamento=inicio + timedelta(days=dia),
+                data_fim=inicio + timedelta(days=dia, hours=1), preco=servico.preco
+            )
+            for dia in range(1, 12)
+        ])
+        with self.assertNumQueries(2):
+            dados = self.client.get(f'/api/pets/{pet.id}/detalhes_completos/', secure=True).json()
+        # Total real, não o tamanho da página de recentes
+        self.assertEqual(dados['total_agendamentos'], 12)
+        self.assertEqual(len(dados['agendamentos']), 10)
+        mais_recente = (inicio + timedelta(days=11)).isoformat().replace('+00:00', 'Z')
+        self.assertEqual(dados['agendamentos'][0]['data_agendamento'], mais_recente)
+        self.assertEqual(dados['agendamentos'][0]['cliente_nome'], 'Cliente 0')
+
+
+class IntervaloAgendamentoTests(APITestCase):
+    """Agendamentos ocupam [início, fim) conforme a duração do serviço"""
+
+    def setUp(self):
+        cliente = Cliente.objects.create(nome='Ana', email='ana@email.com', telefone='0')
+        self.pet = Pet.objects.create(nome='Rex', especie='C', cliente=cliente)
+        self.servico = Servico.objects.create(nome='Banho e Tosa', preco=75, duracao_estimada=120)
+        dia = timezone.localdate() + timedelta(days=1)
+        if dia.weekday() == 6:
+            dia += timedelta(days=1)
+        self.dia = dia
+
+    def agendar(self, hora):
+        inicio = timezone.make_aware(datetime.combine(self.dia, time(hora, 0)))
+        return self.client.post('/api/agendamentos/', {
+            'pet': self.pet.id, 'servico': self.servico.id, 'data_agendamento': inicio.isoformat()
+        }, format='json', secure=True)
+
+    def test_sobreposicao_parcial_recusada(self):
+        self.assertEqual(self.agendar(9).status_code, 201)
+        # 09:00-11:00 cobre o início às 10:00 e o término de 08:00-10:00
+        self.assertEqual(self.agendar(10).status_code, 400)
+        self.assertEqual(self.agendar(8).status_code, 400)
+        self.assertEqual(Agendamento.objects.count(), 1)
+
+    def test_agendamentos_encostados_aceitos(self):
+        self.assertEqual(self.agendar(11).status_code, 201)
+        # 09:00-11:00 termina quando o outro começa; 13:00 começa quando ele termina
+        self.assertEqual(self.agendar(9).status_code, 201)
+        self.assertEqual(self.agendar(13).status_code, 201)
+        self.assertEqual(Agendamento.objects.count(), 3)
+
+    def test_cancelado_nao_ocupa_horario(self):
+        resposta = self.agendar(9)
+        self.client.post(f"/api/agendamentos/{resposta.data['id']}/cancelar/", secure=True)
+        self.assertEqual(self.agendar(10).status_code, 201)
+
+    def test_violacao_de_restricao_vira_409(self):
+        # Corrida perdida para a restrição de exclusão do PostgreSQL
+        with mock.patch.object(Agendamento, 'save', side_effect=IntegrityError('agendamento_sem_sobreposicao')):
+            resposta = self.agendar(9)
+        self.assertEqual(resposta.status_code, 409)
+        self.assertIn('error', resposta.data)
+
+
+class LoteTests(APITestCase):
+    """Criação e mudança de status em lote, com erros reportados por item"""
+
+    def setUp(self):
+        cliente = Cliente.objects.create(nome='Ana', email='ana@email.com', telefone='0')
+        self.pet = Pet.objects.create(nome='Rex', especie='C', cliente=cliente)
+        self.servico = Servico.objects.create(nome='Banho e Tosa', preco=75, duracao_estimada=120)
+        dia = timezone.localdate() + timedelta(days=1)
+        if dia.weekday() == 6:
+            dia += timedelta(days=1)
+        self.dia = dia
+
+    def item(self, hora, pet=None):
+        inicio = timezone.make_aware(datetime.combine(self.dia, time(hora, 0)))
+        return {'pet': pet or self.pet.id, 'servico': self.servico.id, 'data_agendamento': inicio.isoformat()}
+
+    def enviar_lote(self, itens):
+        return self.client.post('/api/agendamentos/lote/', itens, format='json', secure=True)
+
+    def test_conflitos_reportados_por_item(self):
+        existente = self.client.post('/api/agendamentos/', self.item(14), format='json', secure=True)
+        self.assertEqual(existente.status_code, 201)
+
+        resposta = self.enviar_lote([
+            self.item(8),
+            self.item(9),             # sobrepõe o item 0 (08:00-10:00)
+            self.item(10),            # encosta no item 0
+            self.item(15),            # sobrepõe o agendamento existente (14:00-16:00)
+            self.item(12, pet=9999),  # pet inexistente
+        ])
+        self.assertEqual(resposta.status_code, 201)
+        self.assertEqual([erro['indice'] for erro in resposta.data['erros']], [1, 3, 4])
+        self.assertIn('non_field_errors', resposta.data['erros'][0]['erros'])
+        self.assertIn('non_field_errors', resposta.data['erros'][1]['erros'])
+        self.assertIn('pet', resposta.data['erros'][2]['erros'])
+        # Os itens válidos são criados mesmo com erros nos demais
+        horarios = sorted(
+            timezone.localtime(agendamento.data_agendamento).hour for agendamento in Agendamento.objects.all()
+        )
+        self.assertEqual(horarios, [8, 10, 14])
+        self.assertEqual(len(resposta.data['criados']), 2)
+
+    def test_lote_sem_itens_validos(self):
+        resposta = self.enviar_lote([self.item(9, pet=9999), self.item(19)])
+        self.assertEqual(resposta.status_code, 400)
+        self.assertEqual(resposta.data['criados'], [])
+        self.assertEqual([erro['indice'] for erro in resposta.data['erros']], [0, 1])
+        self.assertFalse(Agendamento.objects.exists())
+
+    def test_falha_na_gravacao_desfaz_o_lote_inteiro(self):
+        # Erro depois do bulk_create, dentro da mesma transação
+        with mock.patch.object(eventos, 'registrar_em_lote', side_effect=IntegrityError):
+            resposta = self.enviar_lote([self.item(8), self.item(10)])
+        self.assertEqual(resposta.status_code, 409)
+        self.assertFalse(Agendamento.objects.exists())
+
+    def test_status_em_lote_por_item(self):
+        criados = self.enviar_lote([self.item(8), self.item(10)]).data['criados']
+        cancelado = self.client.post('/api/agendamentos/', self.item(12), format='json', secure=True).data['id']
+        self.client.post(f'/api/agendamentos/{cancelado}/cancelar/', secure=True)
+
+        resposta = self.client.post('/api/agendamentos/status_lote/', {
+            'ids': [criados[0]['id'], cancelado, 0, criados[1]['id']], 'status': 'confirmado'
+        }, format='json', secure=True)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.data['atualizados'], 2)
+        self.assertEqual([erro['id'] for erro in resposta.data['erros']], [cancelado, 0])
+        self.assertEqual(
+            dict(Agendamento.objects.values_list('id', 'status')),
+            {criados[0]['id']: 'confirmado', criados[1]['id']: 'confirmado', cancelado: 'cancelado'}
+        )
+
+    def test_status_nao_permitido_em_lote(self):
+        criados = self.enviar_lote([self.item(8)]).data['criados']
+        resposta = self.client.post('/api/agendamentos/status_lote/', {
+            'ids': [criados[0]['id']], 'status': 'agendado'
+        }, format='json', secure=True)
+        self.assertEqual(resposta.status_code, 400)
+        self.assertEqual(Agendamento.objects.get().status, 'agendado')
+
+
+class DisponibilidadeTests(APITestCase):
+    """Horários livres por dia e serviço a partir da linha do tempo de ocupação"""
+
+    def setUp(self):
+        cliente = Cliente.objects.create(nome='Ana', email='ana@email.com', telefone='0')
+        self.pet = Pet.objects.create(nome='Rex', especie='C', cliente=cliente)
+        self.banho = Servico.objects.create(nome='Banho', preco=50, duracao_estimada=60)
+        self.tosa = Servico.objects.create(nome='Tosa', preco=75, duracao_estimada=120)
+        self.dia = timezone.localdate() + timedelta(days=1)
+
+    def ocupar(self, servico, dia, hora, minutos, duracao):
+        inicio = timezone.make_aware(datetime.combine(dia, time(hora, minutos)))
+        # bulk_create grava o intervalo como está, sem a validação de horário
+        Agendamento.objects.bulk_create([Agendamento(
+            pet=self.pet, servico=servico, data_agendamento=inicio, data_fim=inicio + timedelta(minutes=duracao),
+            preco=servico.preco
+        )])
+
+    def consultar(self, inicio, fim):
+        url = (
+            f'/api/agendamentos/horarios_disponiveis/?data_inicio={inicio}&data_fim={fim}'
+            f'&servico_ids={self.banho.id},{self.tosa.id}'
+        )
+        resposta = self.client.get(url, secure=True)
+        self.assertEqual(resposta.status_code, 200)
+        return {
+            (item['data'], item['servico_id']): item['horarios_disponiveis']
+            for item in resposta.json()['disponibilidade']
+        }
+
+    def test_periodo_com_varios_servicos(self):
+        segundo_dia = self.dia + timedelta(days=1)
+        # Atendimento longo (10:30-12:30) cobre só parte dos horários das 10h e das 12h
+        self.ocupar(self.banho, self.dia, 10, 30, 120)
+        self.ocupar(self.tosa, segundo_dia, 9, 0, 120)
+        disponibilidade = self.consultar(self.dia, self.dia + timedelta(days=2))
+
+        self.assertEqual(len(disponibilidade), 6)
+        todos = [f'{hora:02d}:00' for hora in range(agenda.HORA_PRIMEIRO_HORARIO, agenda.HORA_ULTIMO_HORARIO + 1)]
+        banho = disponibilidade[(self.dia.isoformat(), self.banho.id)]
+        self.assertIn('09:00', banho)
+        self.assertNotIn('10:00', banho)
+        self.assertNotIn('11:00', banho)
+        self.assertNotIn('12:00', banho)
+        self.assertIn('13:00', banho)
+        # Tosa (2h) das 09:00 às 11:00: às 08:00 terminaria depois de ela começar
+        tosa = disponibilidade[(segundo_dia.isoformat(), self.tosa.id)]
+        self.assertNotIn('08:00', tosa)
+        self.assertNotIn('09:00', tosa)
+        self.assertNotIn('10:00', tosa)
+        self.assertIn('11:00', tosa)
+        # Cada serviço só é afetado pelos próprios agendamentos
+        self.assertEqual(disponibilidade[(self.dia.isoformat(), self.tosa.id)], todos)
+        self.assertEqual(disponibilidade[(segundo_dia.isoformat(), self.banho.id)], todos)
+
+    def test_agendamento_que_comeca_antes_do_periodo(self):
+        # Começa às 17:00 da véspera e termina às 09:30 do dia consultado
+        self.ocupar(self.banho, self.dia - timedelta(days=1), 17, 0, 16 * 60 + 30)
+        disponibilidade = self.consultar(self.dia, self.dia)
+        banho = disponibilidade[(self.dia.isoformat(), self.banho.id)]
+        self.assertNotIn('08:00', banho)
+        self.assertNotIn('09:00', banho)
+        self.assertIn('10:00', banho)
+
+    def test_consultas_nao_crescem_com_periodo_e_agendamentos(self):
+        self.ocupar(self.banho, self.dia, 9, 0, 60)
+        # Serviços, agendamentos do período (uma única faixa) e séries
+        with self.assertNumQueries(3):
+            self.consultar(self.dia, self.dia)
+        for n in range(1, 10):
+            self.ocupar(self.tosa, self.dia + timedelta(days=n), 8 + n, 0, 120)
+        with self.assertNumQueries(3):
+            self.consultar(self.dia, self.dia + timedelta(days=agenda.MAX_DIAS_CONSULTA - 1))
+
+
+@override_settings(API_CACHE_COMPARTILHADO=True)
+class RespostaCondicionalTests(APITestCase):
+    """ETag e Last-Modified saem das versões por modelo, sem consultas extras"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_304_sem_consultas(self):
+        criar_agendamentos(2)
+        resposta = self.client.get('/api/agendamentos/', secure=True)
+        self.assertIn('Last-Modified', resposta)
+        with self.assertNumQueries(0):
+            resposta = self.client.get('/api/agendamentos/', secure=True, HTTP_IF_NONE_MATCH=resposta['ETag'])
+        self.assertEqual(resposta.status_code, 304)
+
+    def test_etag_muda_apos_gravacao(self):
+        agendamento, = criar_agendamentos(1)
+        url = f'/api/agendamentos/{agendamento.id}/'
+        etag = self.client.get(url, secure=True)['ETag']
+
+        # O nome do pet aparece no agendamento: gravar o pet também muda o ETag
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/pets/{agendamento.pet_id}/', {'nome': 'Thor'}, format='json', secure=True)
+        resposta = self.client.get(url, secure=True, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.data['pet_nome'], 'Thor')
+        self.assertNotEqual(resposta['ETag'], etag)
+
+    def test_sem_cache_compartilhado_nao_emite_validadores(self):
+        agendamento, = criar_agendamentos(1)
+        etag = self.client.get('/api/agendamentos/', secure=True)['ETag']
+        with override_settings(API_CACHE_COMPARTILHADO=False):
+            # Outro processo (worker de tarefas) grava sem mudar a versão deste
+            Agendamento.objects.filter(id=agendamento.id).update(status='concluido')
+            resposta = self.client.get('/api/agendamentos/', secure=True, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertNotIn('ETag', resposta)
+        self.assertEqual(resposta.data['results'][0]['status'], 'concluido')
+
+    def test_cursor_sem_agregacao(self):
+        criar_agendamentos(3)
+        with self.assertNumQueries(1):
+            resposta = self.client.get('/api/agendamentos/', {'paginacao': 'cursor'}, secure=True)
+        self.assertEqual(len(resposta.data['results']), 3)
+
+
+@override_settings(API_CACHE_COMPARTILHADO=True)
+class RespostaEmCacheTests(APITestCase):
+    """Respostas em cache por versão dos modelos: acerto, falha e invalidação"""
+
+    def setUp(self):
+        cache.clear()
+        self.servico = Servico.objects.create(nome='Banho', preco=50, duracao_estimada=60)
+
+    def listar(self):
+        return self.client.get('/api/servicos/', secure=True)
+
+    def nomes(self, resposta):
+        return [servico['nome'] for servico in resposta.data['results']]
+
+    def test_acerto_sem_consultas(self):
+        primeira = self.listar()
+        self.assertEqual(primeira['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            segunda = self.listar()
+        self.assertEqual(segunda['X-Cache'], 'HIT')
+        self.assertEqual(segunda.data, primeira.data)
+        self.assertEqual(segunda['ETag'], primeira['ETag'])
+
+    def test_parametros_diferentes_nao_compartilham_resposta(self):
+        self.listar()
+        resposta = self.client.get('/api/servicos/', {'ordering': '-preco'}, secure=True)
+        self.assertEqual(resposta['X-Cache'], 'MISS')
+
+    def test_gravacoes_invalidam(self):
+        url = f'/api/servicos/{self.servico.id}/'
+        gravacoes = [
+            (lambda: self.client.post('/api/servicos/', {
+                'nome': 'Tosa', 'preco': '75.00', 'duracao_estimada': 60
+            }, format='json', secure=True), ['Banho', 'Tosa']),
+            (lambda: self.client.patch(url, {'nome': 'Banho Completo'}, format='json', secure=True),
+             ['Banho Completo', 'Tosa']),
+            (lambda: self.client.delete(url, secure=True), ['Tosa']),
+        ]
+        for gravar, esperados in gravacoes:
+            self.listar()
+            with self.captureOnCommitCallbacks() as callbacks:
+                self.assertLess(gravar().status_code, 300)
+                # Até o commit a versão não muda: uma leitura concorrente, que
+                # ainda vê as linhas antigas, não as guarda sob a versão nova
+                self.assertEqual(self.listar()['X-Cache'], 'HIT')
+            for callback in callbacks:
+                callback()
+            resposta = self.listar()
+            self.assertEqual(resposta['X-Cache'], 'MISS')
+            self.assertEqual(self.nomes(resposta), esperados)
+
+    def test_sem_cache_compartilhado_nao_guarda_respostas(self):
+        with override_settings(API_CACHE_COMPARTILHADO=False):
+            self.listar()
+            resposta = self.listar()
+        self.assertNotIn('X-Cache', resposta)
+
+    def test_gravacao_em_modelo_relacionado_invalida(self):
+        cliente = Cliente.objects.create(nome='Ana', email='ana@email.com', telefone='0')
+        url = f'/api/clientes/{cliente.id}/detalhes_completos/'
+        self.assertEqual(self.client.get(url, secure=True).data['total_pets'], 0)
+        self.assertEqual(self.client.get(url, secure=True)['X-Cache'], 'HIT')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/pets/', {
+                'nome': 'Rex', 'especie': 'C', 'cliente': cliente.id
+            }, format='json', secure=True)
+        resposta = self.client.get(url, secure=True)
+        self.assertEqual(resposta['X-Cache'], 'MISS')
+        self.assertEqual(resposta.data['total_pets'], 1)
+
+
+class BuscaTests(APITestCase):
+    """A busca filtra com ILIKE sobre a coluna pura, a expressão dos índices de trigramas"""
+
+    def test_filtro_compilado_para_os_indices(self):
+        colunas = importlib.import_module('api.migrations.0007_busca_trigramas').COLUNAS_BUSCA
+        postgresql = PostgreSQLWrapper({**connection.settings_dict, 'ENGINE': 'django.db.backends.postgresql'})
+        queryset = busca.buscar(Cliente.objects.all(), 'ana', ['nome', 'email', 'telefone'])
+        sql, params = queryset.query.get_compiler(connection=postgresql).as_sql()
+        filtro = sql.split(' WHERE ')[1]
+
+        self.assertNotIn('UPPER(', filtro)
+        for tabela, coluna in colunas:
+            if tabela == 'api_cliente':
+                self.assertIn(f'"{tabela}"."{coluna}" ILIKE %s', filtro)
+        self.assertIn('%ana%', params)
+
+    def test_busca_ordena_por_relevancia(self):
+        cliente = Cliente.objects.create(nome='Mariana', email='m@email.com', telefone='0')
+        Cliente.objects.create(nome='Ana', email='ana@email.com', telefone='0')
+        Cliente.objects.create(nome='Bruno', email='b@email.com', telefone='0')
+        resposta = self.client.get('/api/clientes/', {'search': 'ana'}, secure=True)
+        nomes = [linha['nome'] for linha in resposta.data['results']]
+        self.assertEqual(nomes, ['Ana', cliente.nome])
+
+
+class SerieAgendamentoTests(APITestCase):
+    """Ocorrências de séries são expandidas sob demanda e ocupam horário"""
+
+    def setUp(self):
+        cliente = Cliente.objects.create(nome='Ana', email='ana@email.com', telefone='0')
+        self.pet = Pet.objects.create(nome='Rex', especie='C', cliente=cliente)
+        self.servico = Servico.objects.create(nome='Banho', preco=35, duracao_estimada=60)
+        dia = timezone.localdate() + timedelta(days=1)
+        while dia.weekday() == 6:
+            dia += timedelta(days=1)
+        self.inicio = timezone.make_aware(datetime.combine(dia, time(10, 0)))
+        self.serie = SerieAgendamento.objects.create(
+            pet=self.pet, servico=self.servico, inicio=self.inicio,
+            frequencia='semanal', total_ocorrencias=3
+        )
+
+    def test_expansao_limitada(self):
+        ocorrencias = agenda.ocorrencias_virtuais(self.inicio, self.inicio + timedelta(days=365))
+        self.assertEqual(
+            [ocorrencia.data_agendamento for ocorrencia in ocorrencias],
+            [self.inicio + timedelta(weeks=n) for n in range(3)]
+        )
+
+    def test_ocorrencia_virtual_ocupa_horario(self):
+        segunda = self.inicio + timedelta(weeks=1)
+        self.assertTrue(agenda.existe_conflito(self.servico.id, segunda, segunda + timedelta(hours=1)))
+
+    def test_materializar_libera_horario_original(self):
+        segunda = self.inicio + timedelta(weeks=1)
+        resposta = self.client.post(f'/api/series/{self.serie.id}/materializar/', {
+            'data_original': segunda.isoformat(),
+            'data_agendamento': (segunda + timedelta(hours=3)).isoformat(),
+        }, format='json', secure=True)
+        self.assertEqual(resposta.status_code, 201)
+
+        self.assertFalse(agenda.existe_conflito(self.servico.id, segunda, segunda + timedelta(hours=1)))
+        ocorrencias = agenda.ocorrencias_virtuais(self.inicio, self.inicio + timedelta(days=365))
+        self.assertEqual(len(list(ocorrencias)), 2)
+
+    def criar_serie(self, inicio, **dados):
+        return self.client.post('/api/series/', {
+            'pet': self.pet.id, 'servico': self.servico.id, 'inicio': inicio.isoformat(),
+            'frequencia': 'semanal', **dados
+        }, format='json', secure=True)
+
+    def test_serie_em_conflito_recusada(self):
+        # Mesmo horário das ocorrências da série existente
+        self.assertEqual(self.criar_serie(self.inicio, total_ocorrencias=2).status_code, 400)
+
+        # Agendamento comum na segunda ocorrência da nova série
+        Agendamento.objects.create(
+            pet=self.pet, servico=self.servico, data_agendamento=self.inicio + timedelta(weeks=4, minutes=30)
+        )
+        resposta = self.criar_serie(self.inicio + timedelta(weeks=3), total_ocorrencias=2)
+        self.assertEqual(resposta.status_code, 400)
+        self.assertIn('conflito', resposta.data['error'])
+        self.assertEqual(SerieAgendamento.objects.count(), 1)
+
+        self.assertEqual(self.criar_serie(self.inicio + timedelta(hours=2)).status_code, 201)
+
+    def test_agenda_bloqueada_antes_do_feed(self):
+        # Mesma ordem do save de agendamento, para não haver impasse entre os dois bloqueios
+        chamadas = []
+        with mock.patch.object(agenda, 'bloquear_agenda', side_effect=lambda reservas: chamadas.append('agenda')), \
+                mock.patch.object(eventos, 'bloquear_feed', side_effect=lambda conexao: chamadas.append('feed')):
+            resposta = self.client.patch(f'/api/series/{self.serie.id}/', {
+                'inicio': (self.inicio + timedelta(hours=2)).isoformat()
+            }, format='json', secure=True)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(chamadas[0], 'agenda')
+        self.assertIn('feed', chamadas)
+
+    def test_mensal_nao_cai_no_domingo(self):
+        inicio = timezone.make_aware(datetime(2030, 1, 15, 10, 0))
+        serie = SerieAgendamento(pet=self.pet, servico=self.servico, inicio=inicio, frequencia='mensal')
+        for indice in range(24):
+            ano, mes = 2030 + indice // 12, indice % 12 + 1
+            esperado = datetime(ano, mes, 15).date()
+            if esperado.weekday() == 6:
+                esperado += timedelta(days=1)
+            self.assertEqual(timezone.localdate(serie.ocorrencia(indice)), esperado)
+
+
+class EndpointsAssincronosTests(APITestCase):
+    """As versões assíncronas respondem o mesmo que as síncronas"""
+
+    def setUp(self):
+        self.agendamentos = criar_agendamentos(3, timezone.localdate() + timedelta(days=1))
+        criar_agendamentos(2, timezone.localdate(), inicio=3)
+
+    def assertMesmaResposta(self, caminho):
+        sincrona = self.client.get(f'/api/{caminho}', secure=True)
+        assincrona = self.client.get(f'/api/async/{caminho}', secure=True)
+        self.assertEqual(assincrona.status_code, sincrona.status_code)
+        self.assertEqual(assincrona.json(), sincrona.json())
+
+    def test_horarios_disponiveis(self):
+        dia = self.agendamentos[0].data_agendamento.date()
+        servico = self.agendamentos[0].servico_id
+        self.assertMesmaResposta(f'agendamentos/horarios_disponiveis/?data={dia}&servico_id={servico}')
+        self.assertMesmaResposta(f'agendamentos/horarios_disponiveis/?data_inicio={dia}&servico_ids={servico}')
+        self.assertMesmaResposta('agendamentos/horarios_disponiveis/?data=ontem&servico_id=1')
+
+    def test_hoje_e_proximos(self):
+        self.assertMesmaResposta('agendamentos/hoje/')
+        self.assertMesmaResposta('agendamentos/proximos/')
+
+    def test_estatisticas(self):
+        self.assertMesmaResposta('dashboard/estatisticas/')
+
+
+class FeedEventosTests(APITestCase):
+    """Criações e mudanças de status, unitárias ou em lote, chegam ao feed em ordem"""
+
+    def test_eventos_desde_posicao(self):
+        agendamento, outro = criar_agendamentos(2)
+        posicao = self.client.get('/api/agendamentos/eventos/', secure=True).json()['posicao']
+
+        self.client.post(f'/api/agendamentos/{agendamento.id}/confirmar/', secure=True)
+        self.client.post('/api/agendamentos/status_lote/', {
+            'ids': [agendamento.id, outro.id], 'status': 'cancelado'
+        }, format='json', secure=True)
+
+        resposta = self.client.get(f'/api/agendamentos/eventos/?desde={posicao}', secure=True).json()
+        self.assertEqual(
+            [(evento['agendamento_id'], evento['tipo'], evento['status_anterior'], evento['dados']['status'])
+             for evento in resposta['eventos']],
+            [
+                (agendamento.id, 'status', 'agendado', 'confirmado'),
+                (agendamento.id, 'status', 'confirmado', 'cancelado'),
+                (outro.id, 'status', 'agendado', 'cancelado'),
+            ]
+        )
+
+        ultimo = resposta['posicao']
+        self.assertEqual(
+            self.client.get('/api/agendamentos/eventos/', HTTP_LAST_EVENT_ID=str(ultimo), secure=True).json(),
+            {'eventos': [], 'posicao': ultimo}
+        )
+
+    def test_evento_confirmado_com_data_antiga_entregue(self):
+        agendamento, outro = criar_agendamentos(2)
+        posicao = self.client.get('/api/agendamentos/eventos/', secure=True).json()['posicao']
+        self.client.post(f'/api/agendamentos/{agendamento.id}/confirmar/', secure=True)
+        self.client.post(f'/api/agendamentos/{outro.id}/confirmar/', secure=True)
+        # Transação longa: o evento confirmou bem depois da sua data_criacao
+        EventoAgenda.objects.filter(agendamento_id=agendamento.id).update(
+            data_criacao=timezone.now() - timedelta(hours=1)
+        )
+
+        resposta = self.client.get(f'/api/agendamentos/eventos/?desde={posicao}', secure=True).json()
+        self.assertEqual([evento['agendamento_id'] for evento in resposta['eventos']], [agendamento.id, outro.id])
+
+    def test_ids_gerados_sob_bloqueio_do_feed(self):
+        agendamento, = criar_agendamentos(1)
+        ultimos = []
+        with mock.patch.object(
+            eventos, 'bloquear_feed',
+            side_effect=lambda conexao: ultimos.append(eventos.posicao_atual())
+        ):
+            self.client.post(f'/api/agendamentos/{agendamento.id}/confirmar/', secure=True)
+            self.client.post('/api/agendamentos/status_lote/', {
+                'ids': [agendamento.id], 'status': 'cancelado'
+            }, format='json', secure=True)
+        # Bloqueio pedido antes de cada inserção, unitária ou em lote, no feed
+        # e no registro da sincronização
+        primeiro, segundo = EventoAgenda.objects.values_list('id', flat=True)
+        self.assertEqual(ultimos, [0, primeiro, primeiro, segundo])
+        self.assertLess(primeiro, segundo)
+
+
+class SincronizacaoTests(APITestCase):
+    """Com um token, /sync/ devolve só o que mudou desde ele"""
+
+    def linhas(self, url):
+        resposta = self.client.get(url, secure=True)
+        self.assertEqual(resposta.status_code, 200)
+        return [json.loads(linha) for linha in b''.join(resposta.streaming_content).splitlines()]
+
+    def token(self, linhas):
+        self.assertEqual(list(linhas[-1]), ['token'])
+        return linhas[-1]['token']
+
+    def test_sincronizacao_incremental(self):
+        alterado, excluido, intocado = criar_agendamentos(3)
+        completa = self.linhas('/api/sync/')
+        self.assertEqual(sum(1 for linha in completa if linha.get('modelo') == 'agendamento'), 3)
+        token = self.token(completa)
+        self.assertEqual(len(self.linhas(f'/api/sync/?since={token}')), 1)
+
+        alterado.observacoes = 'Trazer coleira'
+        alterado.save()
+        excluido_id = excluido.id
+        excluido.delete()
+
+        linhas = self.linhas(f'/api/sync/?since={token}')
+        self.assertEqual(linhas[:-1], [
+            {'modelo': 'agendamento', 'dados': mock.ANY},
+            {'modelo': 'agendamento', 'excluido': excluido_id},
+        ])
+        self.assertEqual(linhas[0]['dados']['id'], alterado.id)
+        self.assertEqual(linhas[0]['dados']['observacoes'], 'Trazer coleira')
+        self.assertEqual(len(self.linhas(f'/api/sync/?since={self.token(linhas)}')), 1)
+
+    def test_alteracao_confirmada_depois_do_token_entregue(self):
+        agendamento, = criar_agendamentos(1)
+        token = self.token(self.linhas('/api/sync/'))
+        self.client.post('/api/agendamentos/status_lote/', {
+            'ids': [agendamento.id], 'status': 'cancelado'
+        }, format='json', secure=True)
+        cliente = Cliente.objects.create(nome='Ana', email='ana@email.com', telefone='0')
+        # Transações longas: gravadas antes do token, confirmadas depois dele
+        antes = timezone.now() - timedelta(hours=1)
+        Agendamento.objects.filter(id=agendamento.id).update(data_atualizacao=antes)
+        Cliente.objects.filter(id=cliente.id).update(data_atualizacao=antes)
+        AlteracaoSincronizacao.objects.update(data_registro=antes)
+
+        linhas = self.linhas(f'/api/sync/?since={token}')
+        self.assertEqual(
+            [(linha['modelo'], linha['dados']['id']) for linha in linhas[:-1]],
+            [('cliente', cliente.id), ('agendamento', agendamento.id)]
+        )
+        self.assertEqual(linhas[1]['dados']['status'], 'cancelado')
+
+    def test_token_no_formato_antigo_exige_sincronizacao_completa(self):
+        token = base64.urlsafe_b64encode(timezone.now().isoformat().encode()).decode()
+        resposta = self.client.get(f'/api/sync/?since={token}', secure=True)
+        self.assertEqual(resposta.status_code, 410)
+        resposta = self.client.get('/api/sync/?since=invalido', secure=True)
+        self.assertEqual(resposta.status_code, 400)
+
+
+class ExportacaoTests(APITestCase):
+    """A exportação lê todas as linhas, já com os relacionados, em uma consulta"""
+
+    def test_exportar_agendamentos_csv(self):
+        criar_agendamentos(5)
+        with CaptureQueriesContext(connection) as consultas:
+            resposta = self.client.get('/api/agendamentos/exportar/', secure=True)
+            linhas = list(csv.DictReader(b''.join(resposta.streaming_content).decode().splitlines()))
+        self.assertEqual(len(consultas), 1)
+        self.assertEqual(len(linhas), 5)
+        self.assertEqual(linhas[0]['pet__cliente__nome'], 'Cliente 0')
+        self.assertEqual(linhas[0]['servico__preco'], '10.00')
+
+    def test_exportar_clientes_ndjson(self):
+        criar_agendamentos(3)
+        resposta = self.client.get('/api/clientes/exportar/?formato=ndjson&search=Cliente 1', secure=True)
+        linhas = [json.loads(linha) for linha in b''.join(resposta.streaming_content).splitlines()]
+        self.assertEqual([(linha['nome'], linha['total_pets']) for linha in linhas], [('Cliente 1', 1)])
+
+
+class ResumoDiarioTests(APITestCase):
+    """Os resumos mantidos a cada gravação coincidem com os reconstruídos do zero"""
+
+    def resumos(self):
+        return sorted(ResumoDiario.objects.values_list('data', 'servico_id', 'status', 'quantidade', 'receita', 'minutos'))
+
+    def test_resumos_incrementais(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            agendamento, outro, remarcado = criar_agendamentos(3)
+            relatorios.reconstruir()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/agendamentos/{agendamento.id}/concluir/', secure=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/agendamentos/status_lote/', {
+                'ids': [outro.id], 'status': 'cancelado'
+            }, format='json', secure=True)
+        nova_data = remarcado.data_agendamento + timedelta(days=1)
+        if nova_data.weekday() == 6:
+            nova_data += timedelta(days=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            resposta = self.client.patch(f'/api/agendamentos/{remarcado.id}/', {
+                'data_agendamento': nova_data.isoformat()
+            }, format='json', secure=True)
+        self.assertEqual(resposta.status_code, 200)
+
+        incrementais = self.resumos()
+        relatorios.reconstruir()
+        self.assertEqual(incrementais, self.resumos())
+
+        dia = timezone.localdate(agendamento.data_agendamento)
+        self.assertEqual(relatorios.receita(dia, timezone.localdate(nova_data))['totais'], {
+            'quantidade': 3, 'receita_realizada': '10.00', 'receita_prevista': '10.00', 'cancelados': 1
+        })
+
+    def test_minutos_usam_o_intervalo_reservado(self):
+        agendamento, = criar_agendamentos(1)
+        relatorios.reconstruir()
+        servico = agendamento.servico
+        self.assertEqual(ResumoDiario.objects.get(servico=servico).minutos, servico.duracao_estimada)
+
+        # Mudar a duração do serviço não muda o intervalo já reservado
+        Servico.objects.filter(id=servico.id).update(duracao_estimada=servico.duracao_estimada * 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            relatorios.agendar_recalculo([relatorios.bucket(agendamento.data_agendamento, servico.id)])
+        self.assertEqual(ResumoDiario.objects.get(servico=servico).minutos, servico.duracao_estimada)
+        relatorios.reconstruir()
+        self.assertEqual(ResumoDiario.objects.get(servico=servico).minutos, servico.duracao_estimada)
+
+    def test_receita_usa_o_preco_cobrado(self):
+        cliente = Cliente.objects.create(nome='Ana', email='ana@email.com', telefone='0')
+        pet = Pet.objects.create(nome='Rex', especie='C', cliente=cliente)
+        banho = Servico.objects.create(nome='Banho', preco=35, duracao_estimada=60)
+        tosa = Servico.objects.create(nome='Tosa', preco=50, duracao_estimada=60)
+        dia = timezone.localdate() + timedelta(days=1)
+        if dia.weekday() == 6:
+            dia += timedelta(days=1)
+        inicio = timezone.make_aware(datetime.combine(dia, time(9, 0)))
+        with self.captureOnCommitCallbacks(execute=True):
+            resposta = self.client.post('/api/agendamentos/', {
+                'pet': pet.id, 'servico': banho.id, 'data_agendamento': inicio.isoformat()
+            }, format='json', secure=True)
+        self.assertEqual(resposta.data['preco'], '35.00')
+
+        # Reajuste depois do agendamento não muda o que foi cobrado
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/servicos/{banho.id}/', {'preco': '40.00'}, format='json', secure=True)
+            self.client.post(f"/api/agendamentos/{resposta.data['id']}/confirmar/", secure=True)
+        self.assertEqual(relatorios.receita(dia, dia)['totais']['receita_prevista'], '35.00')
+        relatorios.reconstruir()
+        self.assertEqual(relatorios.receita(dia, dia)['totais']['receita_prevista'], '35.00')
+
+        # Trocar o serviço passa a cobrar o preço do novo
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f"/api/agendamentos/{resposta.data['id']}/", {
+                'servico': tosa.id
+            }, format='json', secure=True)
+        self.assertEqual(Agendamento.objects.get().preco, Decimal('50.00'))
+        self.assertEqual(relatorios.receita(dia, dia)['totais']['receita_prevista'], '50.00')
+
+    def test_recalculo_agrega_depois_do_bloqueio(self):
+        agendamento, = criar_agendamentos(1)
+        bucket = relatorios.bucket(agendamento.data_agendamento, agendamento.servico_id)
+        bloquear = agenda.bloquear_agenda
+
+        def gravacao_concorrente(reservas):
+            # Outra transação cancela o agendamento enquanto este recálculo espera o bloqueio
+            bloquear(reservas)
+            Agendamento.objects.filter(id=agendamento.id).update(status='cancelado')
+
+        with mock.patch.object(agenda, 'bloquear_agenda', side_effect=gravacao_concorrente) as bloqueio:
+            relatorios.recalcular([bucket])
+        self.assertEqual(bloqueio.call_args.args[0], [
+            (agendamento.servico_id, agenda.inicio_do_dia(bucket[0]), agenda.inicio_do_dia(bucket[0]))
+        ])
+        self.assertEqual(
+            list(ResumoDiario.objects.values_list('status', 'quantidade')), [('cancelado', 1)]
+        )
+
+
+class PopulatedbTests(APITestCase):
+    """Os dados sintéticos respeitam as espécies do modelo e os intervalos já ocupados"""
+
+    def test_gera_dados_validos_sem_sobreposicao(self):
+        call_command('populatedb', stdout=io.StringIO())
+        banho = Servico.objects.get(nome='Banho')
+        cliente = Cliente.objects.create(nome='Ana', email='ana@email.com', telefone='0')
+        pet = Pet.objects.create(nome='Rex', especie='C', cliente=cliente)
+        # Agendamentos existentes que começam na meia hora (fora da grade gerada)
+        hoje = timezone.localdate()
+        Agendamento.objects.bulk_create([
+            Agendamento(
+                pet=pet, servico=banho, data_agendamento=inicio, data_fim=inicio + timedelta(hours=1),
+                preco=banho.preco
+            )
+            for dias in range(-10, 3)
+            for inicio in [timezone.make_aware(datetime.combine(hoje + timedelta(days=dias), time(8, 30)))]
+        ])
+
+        call_command(
+            'populatedb', clientes=5, pets=40, agendamentos=60, servicos=1, ocupacao=1,
+            semente=1, sem_resumos=True, stdout=io.StringIO()
+        )
+        especies = {especie for especie, _ in Pet.ESPECIE_CHOICES}
+        self.assertTrue(set(Pet.objects.values_list('especie', flat=True)) <= especies)
+
+        intervalos = sorted(Agendamento.objects.exclude(status='cancelado').filter(
+            servico=banho
+        ).values_list('data_agendamento', 'data_fim'))
+        self.assertGreater(len(intervalos), 13)
+        for (_, fim), (inicio, _) in zip(intervalos, intervalos[1:]):
+            self.assertLessEqual(fim, inicio)
+
+
+class BenchmarkIndicesTests(APITestCase):
+    """O benchmark de índices bloqueia as tabelas: só roda em DEBUG ou confirmado"""
+
+    def test_recusa_sem_confirmacao(self):
+        with self.assertRaises(CommandError):
+            call_command('benchmark_indices', repeticoes=1, stdout=io.StringIO())
+
+    def test_confirmado_restaura_os_indices(self):
+        call_command('benchmark_indices', repeticoes=1, confirmar=True, stdout=io.StringIO())
+        with connection.cursor() as cursor:
+            indices = connection.introspection.get_constraints(cursor, Agendamento._meta.db_table)
+        self.assertIn('agendamento_intervalo_idx', indices)
+
+
+class CamposEsparsosTests(APITestCase):
+    """?fields= e ?omit= limitam a resposta e as colunas lidas do banco"""
+
+    def test_fields_limita_resposta_e_consulta(self):
+        criar_agendamentos(2)
+        with CaptureQueriesContext(connection) as consultas:
+            resposta = self.client.get('/api/agendamentos/?fields=id,status,pet_nome', secure=True)
+        self.assertEqual(
+            [set(item) for item in resposta.json()['results']], [{'id', 'status', 'pet_nome'}] * 2
+        )
+        sql = consultas.captured_queries[-1]['sql']
+        self.assertNotIn('observacoes', sql)
+        self.assertNotIn('api_servico', sql)
+
+    def test_omit_com_paginacao_cursor(self):
+        criar_agendamentos(3)
+        resposta = self.client.get(
+            '/api/agendamentos/?paginacao=cursor&page_size=2&omit=observacoes,data_criacao', secure=True
+        )
+        dados = resposta.json()
+        self.assertNotIn('observacoes', dados['results'][0])
+        self.assertIn('cliente_nome', dados['results'][0])
+        self.assertEqual(len(self.client.get(dados['next'], secure=True).json()['results']), 1)
+
+    def test_renderer_orjson_igual_ao_do_drf(self):
+        dados = {
+            'data': timezone.now(), 'dia': timezone.localdate(), 'valor': Decimal('10.50'),
+            1: ['ção', None, True, 1.5], 'linha': 'a\u2028b',
+        }
+        self.assertEqual(ORJSONRenderer().render(dados), JSONRenderer().render(dados))
+
+
+class ListagemRapidaTests(APITestCase):
+    """As listas montadas com .values() são idênticas às dos serializers"""
+
+    def comparar(self, url):
+        with override_settings(LISTAGEM_RAPIDA=False):
+            cache.clear()
+            esperado = self.client.get(url, secure=True)
+        cache.clear()
+        resposta = self.client.get(url, secure=True)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.content, esperado.content)
+        return resposta
+
+    def test_listas_iguais_as_dos_serializers(self):
+        criar_agendamentos(3)
+        Agendamento.objects.filter(id=Agendamento.objects.first().id).update(status='confirmado', observacoes='ção')
+        for url in [
+            '/api/agendamentos/', '/api/pets/', '/api/clientes/', '/api/servicos/',
+            '/api/agendamentos/?status=confirmado&fields=id,status_display,cliente_nome',
+            '/api/pets/?omit=observacoes,especie',
+        ]:
+            with self.subTest(url=url):
+                self.comparar(url)
+
+    def test_paginacao_cursor_com_dicionarios(self):
+        criar_agendamentos(3)
+        resposta = self.comparar('/api/agendamentos/?paginacao=cursor&page_size=2')
+        proxima = self.comparar(resposta.json()['next'])
+        self.assertEqual(len(proxima.json()['results']), 1)
+
+
+class InstrumentacaoTests(APITestCase):
+    """Server-Timing em cada resposta, métricas agregadas por rota e consultas repetidas"""
+
+    def setUp(self):
+        instrumentacao.metricas.limpar()
+
+    def test_server_timing_e_metricas(self):
+        criar_agendamentos(2)
+        resposta = self.client.get('/api/agendamentos/', secure=True)
+        self.assertRegex(resposta['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ consultas", view;dur=')
+
+        metricas = self.client.get('/api/interno/metricas/', secure=True, REMOTE_ADDR='127.0.0.1')
+        texto = metricas.content.decode()
+        self.assertIn('api_requisicoes_total{rota="agendamento-list",metodo="GET",status="200"} 1', texto)
+        self.assertIn('api_duracao_segundos_count{rota="agendamento-list",metodo="GET"} 1', texto)
+
+        self.assertEqual(
+            self.client.get('/api/interno/metricas/', secure=True, REMOTE_ADDR='10.0.0.1').status_code, 403
+        )
+
+    async def test_views_assincronas_no_event_loop(self):
+        async def view(request):
+            return HttpResponse()
+
+        self.assertTrue(iscoroutinefunction(instrumentacao.InstrumentacaoMiddleware(view)))
+        self.assertFalse(iscoroutinefunction(instrumentacao.InstrumentacaoMiddleware(lambda request: None)))
+
+        await sync_to_async(criar_agendamentos)(2, timezone.localdate())
+        resposta = await self.async_client.get('/api/async/agendamentos/hoje/', secure=True)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertRegex(resposta['Server-Timing'], r'^db;dur=[\d.]+;desc="[1-9]\d* consultas"')
+
+    def test_consultas_repetidas_com_origem(self):
+        registro = instrumentacao.RegistroConsultas(limiar_duplicadas=3)
+        for pet_id in range(4):
+            registro(lambda *args: None, 'SELECT * FROM api_pet WHERE id = %s', [pet_id], False, {})
+        registro(lambda *args: None, 'SELECT 1', [], False, {})
+
+        self.assertEqual(registro.total, 5)
+        (sql, (repeticoes, origem)), = registro.duplicadas.items()
+        self.assertEqual(repeticoes, 4)
+        self.assertIn('api/tests.py', origem)
+
+
+class TarefasTests(APITestCase):
+    """Fila de tarefas: lembretes no ciclo do agendamento, novas tentativas e conclusão automática"""
+
+    def setUp(self):
+        self.cliente = Cliente.objects.create(nome='Ana', email='ana@email.com', telefone='0')
+        self.pet = Pet.objects.create(nome='Rex', especie='C', cliente=self.cliente)
+        self.servico = Servico.objects.create(nome='Banho', preco=10, duracao_estimada=60)
+
+    def horario(self, dias, hora=10):
+        dia = timezone.localdate() + timedelta(days=dias)
+        if dia.weekday() == 6:
+            dia += timedelta(days=1)
+        return timezone.make_aware(datetime.combine(dia, time(hora, 0)))
+
+    def vencer_tarefas(self):
+        Tarefa.objects.filter(status='pendente').update(executar_em=timezone.now())
+
+    def test_lembrete_acompanha_agendamento(self):
+        resposta = self.client.post('/api/agendamentos/', {
+            'pet': self.pet.id, 'servico': self.servico.id, 'data_agendamento': self.horario(3).isoformat()
+        }, format='json', secure=True)
+        self.assertEqual(resposta.status_code, 201)
+        lembrete = Tarefa.objects.get(chave=f"lembrete:{resposta.data['id']}")
+        self.assertEqual(lembrete.executar_em, self.horario(3) - timedelta(hours=24))
+
+        # Remarcar move o lembrete existente em vez de criar outro
+        self.client.patch(f"/api/agendamentos/{resposta.data['id']}/", {
+            'data_agendamento': self.horario(3, hora=14).isoformat()
+        }, format='json', secure=True)
+        self.assertEqual(Tarefa.objects.get().executar_em, self.horario(3, hora=14) - timedelta(hours=24))
+
+        self.vencer_tarefas()
+        self.assertEqual(tarefas.executar_pendentes(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['ana@email.com'])
+        self.assertEqual(Tarefa.objects.get().status, 'concluida')
+
+    def test_lembrete_cancelado_com_agendamento(self):
+        resposta = self.client.post('/api/agendamentos/lote/', [
+            {'pet': self.pet.id, 'servico': self.servico.id, 'data_agendamento': self.horario(2, hora).isoformat()}
+            for hora in (10, 14)
+        ], format='json', secure=True)
+        cancelado, excluido = [agendamento['id'] for agendamento in resposta.data['criados']]
+        self.assertEqual(Tarefa.objects.filter(status='pendente').count(), 2)
+
+        self.client.post('/api/agendamentos/status_lote/', {
+            'ids': [cancelado], 'status': 'cancelado'
+        }, format='json', secure=True)
+        self.client.delete(f'/api/agendamentos/{excluido}/', secure=True)
+        self.assertFalse(Tarefa.objects.exists())
+
+    def test_falha_tenta_novamente_ate_esgotar(self):
+        chamadas = []
+
+        def quebrada():
+            chamadas.append(1)
+            raise RuntimeError('serviço de e-mail fora do ar')
+
+        with mock.patch.dict(tarefas.TAREFAS, {'quebrada': tarefas.Registro(quebrada, 2, None)}):
+            tarefas.agendar('quebrada')
+            with self.assertLogs('api.tarefas', 'ERROR'):
+                self.assertEqual(tarefas.executar_pendentes(), (1, 1))
+            tarefa = Tarefa.objects.get()
+            self.assertEqual((tarefa.status, tarefa.tentativas), ('pendente', 1))
+            self.assertGreater(tarefa.executar_em, timezone.now())
+            # Ainda não venceu a espera
+            self.assertEqual(tarefas.executar_pendentes(), (0, 0))
+
+            self.vencer_tarefas()
+            with self.assertLogs('api.tarefas', 'ERROR'):
+                tarefas.executar_pendentes()
+        tarefa.refresh_from_db()
+        self.assertEqual((tarefa.status, tarefa.tentativas, len(chamadas)), ('falhou', 2, 2))
+        self.assertIn('serviço de e-mail fora do ar', tarefa.erro)
+
+    def test_conclusao_automatica_dos_passados(self):
+        passados = criar_agendamentos(2, timezone.localdate() - timedelta(days=2))
+        futuro, = criar_agendamentos(1, inicio=2)
+        with self.captureOnCommitCallbacks(execute=True):
+            tarefas.concluir_agendamentos_passados()
+
+        status = dict(Agendamento.objects.values_list('id', 'status'))
+        self.assertEqual([status[agendamento.id] for agendamento in passados], ['concluido', 'concluido'])
+        self.assertEqual(status[futuro.id], 'agendado')
+        self.assertEqual(EventoAgenda.objects.filter(tipo='status').count(), 2)
+
+
+class BloqueioAgendaTests(TransactionTestCase):
+    """O bloqueio da agenda vale para a verificação de conflitos e a gravação (qualquer banco)"""
+
+    def setUp(self):
+        cliente = Cliente.objects.create(nome='Ana', email='ana@email.com', telefone='0')
+        self.pet = Pet.objects.create(nome='Rex', especie='C', cliente=cliente)
+        self.servico = Servico.objects.create(nome='Banho', preco=35, duracao_estimada=60)
+        dia = timezone.localdate() + timedelta(days=1)
+        if dia.weekday() == 6:
+            dia += timedelta(days=1)
+        self.inicio = timezone.make_aware(datetime.combine(dia, time(10, 0)))
+
+    def salvar_registrando(self, agendamento):
+        chamadas = []
+        validar = Agendamento.full_clean
+
+        def bloquear(reservas):
+            chamadas.append(('bloqueio', connection.in_atomic_block, reservas))
+
+        def full_clean(instancia, *args, **kwargs):
+            chamadas.append(('validacao', connection.in_atomic_block))
+            return validar(instancia, *args, **kwargs)
+
+        def bloquear_feed(conexao):
+            chamadas.append(('feed', connection.in_atomic_block))
+
+        self.assertFalse(connection.in_atomic_block)
+        # O recálculo dos resumos, depois do commit, bloqueia a agenda por conta própria
+        with mock.patch.object(agenda, 'bloquear_agenda', side_effect=bloquear), \
+                mock.patch.object(eventos, 'bloquear_feed', side_effect=bloquear_feed), \
+                mock.patch.object(Agendamento, 'full_clean', autospec=True, side_effect=full_clean), \
+                mock.patch.object(relatorios, 'agendar_recalculo'):
+            agendamento.save()
+        return chamadas
+
+    def test_save_bloqueia_dentro_da_transacao(self):
+        agendamento = Agendamento(pet=self.pet, servico=self.servico, data_agendamento=self.inicio)
+        chamadas = self.salvar_registrando(agendamento)
+        # Bloqueio antes da verificação de conflitos, e o do feed só no evento e
+        # no registro da sincronização, sempre nessa ordem e na transação aberta pelo save
+        self.assertEqual(chamadas, [
+            ('bloqueio', True, [(self.servico.id, self.inicio, self.inicio + timedelta(hours=1))]),
+            ('validacao', True),
+            ('feed', True),
+            ('feed', True),
+        ])
+        self.assertTrue(Agendamento.objects.filter(id=agendamento.id).exists())
+
+    def test_cancelado_nao_bloqueia(self):
+        agendamento = Agendamento(
+            pet=self.pet, servico=self.servico, data_agendamento=self.inicio, status='cancelado'
+        )
+        self.assertEqual(self.salvar_registrando(agendamento), [('validacao', True), ('feed', True), ('feed', True)])
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Concorrência real exige PostgreSQL')
+class ReservaConcorrenteTests(TransactionTestCase):
+    """Requisições simultâneas para o mesmo horário geram um único agendamento"""
+    requisicoes = 200
+
+    def test_sem_reserva_dupla(self):
+        cliente = Cliente.objects.create(nome='Ana', email='ana@email.com', telefone='0')
+        pet = Pet.objects.create(nome='Rex', especie='C', cliente=cliente)
+        servico = Servico.objects.create(nome='Banho', preco=35, duracao_estimada=60)
+        dia = timezone.localdate() + timedelta(days=1)
+        while dia.weekday() == 6:
+            dia += timedelta(days=1)
+        # Horários que se sobrepõem parcialmente (10h e 10h30) também disputam a vaga
+        horarios = [
+            timezone.make_aware(datetime.combine(dia, time(10, 30 * (n % 2))))
+            for n in range(self.requisicoes)
+        ]
+
+        def reservar(horario):
+            try:
+                return APIClient().post('/api/agendamentos/', {
+                    'pet': pet.id, 'servico': servico.id, 'data_agendamento': horario.isoformat(),
+                }, format='json', secure=True).status_code
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=50) as executor:
+            codigos = list(executor.map(reservar, horarios))
+
+        self.assertEqual(codigos.count(201), 1)
+        self.assertEqual(len(codigos), codigos.count(201) + codigos.count(400) + codigos.count(409))
+        self.assertEqual(Agendamento.objects.filter(servico=servico).count(), 1)
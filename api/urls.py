@@ -1,13 +1,34 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ClienteViewSet, PetViewSet, ServicoViewSet, AgendamentoViewSet
+from . import views_async
+from .instrumentacao import metricas_prometheus
+from .views import (
+    ClienteViewSet, PetViewSet, ServicoViewSet, AgendamentoViewSet, DashboardViewSet, BuscaViewSet,
+    SerieAgendamentoViewSet, SincronizacaoViewSet, RelatorioViewSet
+)
 
 router = DefaultRouter()
 router.register(r'clientes', ClienteViewSet)
 router.register(r'pets', PetViewSet)
 router.register(r'servicos', ServicoViewSet)
 router.register(r'agendamentos', AgendamentoViewSet)
+router.register(r'series', SerieAgendamentoViewSet)
+router.register(r'dashboard', DashboardViewSet, basename='dashboard')
+router.register(r'busca', BuscaViewSet, basename='busca')
+router.register(r'sync', SincronizacaoViewSet, basename='sync')
+router.register(r'relatorios', RelatorioViewSet, basename='relatorios')
+
+# Versões assíncronas (ASGI) dos endpoints de leitura mais acessados
+urls_async = [
+    path('agendamentos/horarios_disponiveis/', views_async.horarios_disponiveis, name='async-horarios-disponiveis'),
+    path('agendamentos/hoje/', views_async.hoje, name='async-agendamentos-hoje'),
+    path('agendamentos/proximos/', views_async.proximos, name='async-agendamentos-proximos'),
+    path('agendamentos/eventos/', views_async.eventos_agenda, name='async-agendamentos-eventos'),
+    path('dashboard/estatisticas/', views_async.estatisticas, name='async-dashboard-estatisticas'),
+]
 
 urlpatterns = [
+    path('async/', include(urls_async)),
+    path('interno/metricas/', metricas_prometheus, name='metricas'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
@@ -3,144 +3,287 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 from django.utils import timezone
+from copy import copy
 from datetime import datetime, timedelta, time
+import heapq
+from itertools import islice
 from django.shortcuts import get_object_or_404
+from django.db.models import Func, IntegerField
+from django.core.cache import cache
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import IntegrityError, connections, router, transaction
 from rest_framework import status
 
-from .models import Cliente, Pet, Servico, Agendamento
+from . import agenda
+from . import eventos
+from . import relatorios
+from . import sincronizacao
+from . import tarefas
+from . import cache as cache_api
+from .cache import RespostaEmCacheMixin
+from .busca import BuscaFilter, buscar
+from .campos import CamposEsparsosMixin
+from .condicional import RespostaCondicionalMixin
+from .leitura import ListagemRapidaMixin
+from .pagination import PaginacaoAgendamento, PaginacaoCliente
+from .streaming import exportar, resposta_ndjson
+from .models import Cliente, Pet, Servico, Agendamento, SerieAgendamento
 from .serializers import (
     ClienteSerializer, 
     PetSerializer, 
     ServicoSerializer, 
-    AgendamentoSerializer
+    AgendamentoSerializer,
+    AgendamentoLoteSerializer,
+    StatusLoteSerializer,
+    SerieAgendamentoSerializer,
+    MaterializarOcorrenciaSerializer
 )
 
-class ClienteViewSet(viewsets.ModelViewSet):
-    queryset = Cliente.objects.all()
+
+def _ids_do_lote(itens, campo):
+    """Ids numéricos de `campo` nos itens de um lote (os inválidos são ignorados)"""
+    ids = set()
+    for item in itens:
+        try:
+            ids.add(int(item.get(campo)))
+        except (AttributeError, TypeError, ValueError):
+            pass
+    return ids
+
+def ler_consulta_disponibilidade(params):
+    """
+    Lê os parâmetros da consulta de horários disponíveis (usada também pela
+    versão assíncrona). Retorna (inicio, fim, servico_ids) ou levanta
+    ValueError com a mensagem de erro.
+    """
+    data = params.get('data')
+    data_inicio = params.get('data_inicio', data)
+    data_fim = params.get('data_fim', data_inicio)
+    servico_ids = params.get('servico_ids', params.get('servico_id'))
+    
+    if not data_inicio or not servico_ids:
+        raise ValueError('Parâmetros data e servico_id são obrigatórios')
+    
+    try:
+        inicio = datetime.strptime(data_inicio, '%Y-%m-%d').date()
+        fim = datetime.strptime(data_fim, '%Y-%m-%d').date()
+        ids = {int(valor) for valor in servico_ids.split(',') if valor.strip()}
+    except ValueError:
+        raise ValueError('Data ou serviço inválidos')
+    if not ids:
+        raise ValueError('Data ou serviço inválidos')
+    
+    if fim < inicio or (fim - inicio).days >= agenda.MAX_DIAS_CONSULTA:
+        raise ValueError(f'Período inválido (máximo de {agenda.MAX_DIAS_CONSULTA} dias)')
+    
+    return inicio, fim, ids
+
+def formatar_disponibilidade(params, servicos, inicio, fim, disponibilidade):
+    """Corpo da resposta de horários disponíveis"""
+    # Consulta simples (um dia, um serviço) mantém o formato original
+    if params.get('data') and params.get('servico_id') and 'data_fim' not in params \
+            and 'servico_ids' not in params:
+        return {
+            'data': params['data'],
+            'servico': servicos[0].nome,
+            'horarios_disponiveis': disponibilidade[0]['horarios_disponiveis'],
+            'total_horarios': disponibilidade[0]['total_horarios']
+        }
+    
+    return {
+        'data_inicio': inicio.isoformat(),
+        'data_fim': fim.isoformat(),
+        'disponibilidade': disponibilidade
+    }
+
+def _contagem(queryset):
+    """
+    SELECT COUNT(id) da consulta. O Func (e não Count) evita o GROUP BY que
+    values() acrescenta às agregações: sem ele há sempre uma linha, mesmo
+    com a tabela vazia.
+    """
+    return queryset.order_by().values(total=Func('pk', function='COUNT', output_field=IntegerField()))
+
+
+def calcular_estatisticas():
+    """
+    Estatísticas do dashboard em uma única consulta, SELECT (contagem) AS
+    nome, ...: cada contagem é uma subconsulta escalar gerada pelo ORM,
+    independente das demais, então nenhuma tabela vazia zera as outras.
+    """
+    hoje = timezone.localdate()
+    inicio_hoje, fim_hoje = agenda.intervalo_do_dia(hoje)
+    contagens = {
+        'total_clientes': Cliente.objects.all(),
+        'total_pets': Pet.objects.all(),
+        'total_servicos': Servico.objects.filter(ativo=True),
+        'agendamentos_hoje': Agendamento.objects.filter(
+            data_agendamento__gte=inicio_hoje,
+            data_agendamento__lt=fim_hoje
+        ),
+        'agendamentos_confirmados': Agendamento.objects.filter(status='confirmado'),
+        'novos_clientes_30_dias': Cliente.objects.filter(
+            data_cadastro__gte=agenda.inicio_do_dia(hoje - timedelta(days=30))
+        ),
+    }
+
+    conexao = connections[router.db_for_read(Cliente)]
+    colunas, parametros = [], []
+    for nome, queryset in contagens.items():
+        sql, params = _contagem(queryset).query.get_compiler(connection=conexao).as_sql()
+        colunas.append(f'({sql}) AS {conexao.ops.quote_name(nome)}')
+        parametros.extend(params)
+    with conexao.cursor() as cursor:
+        cursor.execute(f"SELECT {', '.join(colunas)}", parametros)
+        return dict(zip(contagens, cursor.fetchone()))
+
+class ClienteViewSet(
+    CamposEsparsosMixin, RespostaCondicionalMixin, ListagemRapidaMixin, RespostaEmCacheMixin,
+    viewsets.ModelViewSet
+):
+    queryset = Cliente.objects.com_total_pets()
     serializer_class = ClienteSerializer
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    pagination_class = PaginacaoCliente
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, BuscaFilter]
     search_fields = ['nome', 'email', 'telefone']
     ordering_fields = ['nome', 'data_cadastro']
     ordering = ['nome']
+    cache_acoes = ['retrieve', 'detalhes_completos']
+    cache_modelos = [Cliente, Pet]
+    condicional_relacionados = ['pets']
 
     @action(detail=True, methods=['get'])
     def detalhes_completos(self, request, pk=None):
         """Endpoint personalizado para detalhes do cliente com pets"""
-        cliente = get_object_or_404(Cliente, pk=pk)
-        
-        # Buscar pets do cliente
-        pets = Pet.objects.filter(cliente=cliente)
+        # Duas consultas: o cliente (com o total anotado) e os seus pets
+        cliente = get_object_or_404(Cliente.objects.com_pets(), pk=pk)
         
         data = {
             'cliente': ClienteSerializer(cliente).data,
-            'total_pets': pets.count(),
-            'pets': PetSerializer(pets, many=True).data
+            'total_pets': cliente.total_pets,
+            'pets': PetSerializer(cliente.pets.all(), many=True).data
         }
         
         return Response(data)
 
-class PetViewSet(viewsets.ModelViewSet):
-    queryset = Pet.objects.all()
+    @action(detail=False, methods=['get'])
+    def exportar(self, request):
+        """
+        Exporta os clientes (com os filtros e a busca da listagem) em CSV ou
+        NDJSON (?formato=ndjson), gerado sob demanda em memória constante
+        """
+        queryset = self.filter_queryset(self.get_queryset()).order_by('nome', 'id')
+        campos = ['id', 'nome', 'email', 'telefone', 'data_cadastro', 'total_pets']
+        return exportar(request, queryset, campos, 'clientes')
+
+class PetViewSet(
+    CamposEsparsosMixin, RespostaCondicionalMixin, ListagemRapidaMixin, RespostaEmCacheMixin,
+    viewsets.ModelViewSet
+):
+    queryset = Pet.objects.select_related('cliente')
     serializer_class = PetSerializer
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
+    filter_backends = [DjangoFilterBackend, BuscaFilter]
     filterset_fields = ['cliente', 'especie']
     search_fields = ['nome', 'raca']
+    cache_acoes = ['detalhes_completos']
+    cache_modelos = [Pet, Cliente, Agendamento, Servico]
+    condicional_relacionados = ['cliente']
 
     @action(detail=True, methods=['get'])
     def detalhes_completos(self, request, pk=None):
         """Endpoint personalizado para detalhes do pet com agendamentos"""
-        pet = get_object_or_404(Pet, pk=pk)
-        
-        # Buscar agendamentos do pet
-        agendamentos = Agendamento.objects.filter(pet=pet).order_by('-data_agendamento')[:10]
+        # Duas consultas: o pet (com cliente e total de agendamentos) e os 10 mais recentes
+        pet = get_object_or_404(Pet.objects.com_agendamentos(recentes=10), pk=pk)
         
         data = {
             'pet': PetSerializer(pet).data,
-            'total_agendamentos': agendamentos.count(),
-            'agendamentos': AgendamentoSerializer(agendamentos, many=True).data
+            'total_agendamentos': pet.total_agendamentos,
+            'agendamentos': AgendamentoSerializer(pet.agendamentos_recentes, many=True).data
         }
         
         return Response(data)
 
-class ServicoViewSet(viewsets.ModelViewSet):
+class ServicoViewSet(
+    CamposEsparsosMixin, RespostaCondicionalMixin, ListagemRapidaMixin, RespostaEmCacheMixin,
+    viewsets.ModelViewSet
+):
     queryset = Servico.objects.filter(ativo=True)
     serializer_class = ServicoSerializer
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [filters.OrderingFilter, BuscaFilter]
     search_fields = ['nome', 'descricao']
     ordering_fields = ['nome', 'preco']
     ordering = ['nome']
+    cache_acoes = ['list', 'retrieve']
+    cache_modelos = [Servico]
 
-class AgendamentoViewSet(viewsets.ModelViewSet):
-    queryset = Agendamento.objects.all()
+class AgendamentoViewSet(CamposEsparsosMixin, RespostaCondicionalMixin, ListagemRapidaMixin, viewsets.ModelViewSet):
+    queryset = Agendamento.objects.com_relacionados()
     serializer_class = AgendamentoSerializer
+    pagination_class = PaginacaoAgendamento
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['pet', 'servico', 'status']
     ordering_fields = ['data_agendamento', 'data_criacao']
     ordering = ['-data_agendamento']
+    condicional_relacionados = ['pet', 'pet__cliente', 'servico']
 
     @action(detail=False, methods=['get'])
     def horarios_disponiveis(self, request):
-        data = request.query_params.get('data')
-        servico_id = request.query_params.get('servico_id')
-        
-        if not data or not servico_id:
-            return Response(
-                {'error': 'Parâmetros data e servico_id são obrigatórios'}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
+        """
+        Retorna os horários livres por dia e serviço.
+
+        Aceita `data` ou o período `data_inicio`/`data_fim`, e `servico_id`
+        ou uma lista `servico_ids` (separada por vírgulas). Todos os
+        agendamentos do período são buscados em uma única consulta.
+        """
         try:
-            data_obj = datetime.strptime(data, '%Y-%m-%d').date()
-            servico = Servico.objects.get(id=servico_id)
-        except (ValueError, Servico.DoesNotExist) as e:
-            return Response(
-                {'error': 'Data ou serviço inválidos'}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        # Gerar horários disponíveis (8h às 18h, de hora em hora)
-        horarios_disponiveis = []
+            inicio, fim, ids = ler_consulta_disponibilidade(request.query_params)
+            servicos = list(Servico.objects.filter(id__in=ids))
+            if len(servicos) != len(ids):
+                raise ValueError('Data ou serviço inválidos')
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
-        for hora in range(8, 18):  # 8h às 17h
-            horario_str = f"{hora:02d}:00"
-            
-            # Criar datetime completo para a verificação
-            horario_datetime = datetime.combine(data_obj, time(hora, 0))
-            
-            # Verificar se o horário está disponível
-            if not Agendamento.objects.filter(
-                data_agendamento=horario_datetime,
-                servico=servico,
-                status__in=['agendado', 'confirmado']  # Só considerar agendamentos ativos
-            ).exists():
-                horarios_disponiveis.append(horario_str)
-        
-        return Response({
-            'data': data,
-            'servico': servico.nome,
-            'horarios_disponiveis': horarios_disponiveis,
-            'total_horarios': len(horarios_disponiveis)
-        })
+        disponibilidade = agenda.horarios_disponiveis(servicos, inicio, fim)
+        return Response(formatar_disponibilidade(request.query_params, servicos, inicio, fim, disponibilidade))
 
     @action(detail=False, methods=['get'])
     def hoje(self, request):
-        """Retorna os agendamentos de hoje"""
-        hoje = timezone.now().date()
-        agendamentos_hoje = Agendamento.objects.filter(
-            data_agendamento__date=hoje
+        """
+        Retorna os agendamentos de hoje. O cabeçalho X-Eventos-Posicao indica
+        de onde seguir o feed de eventos para receber as alterações seguintes.
+        """
+        posicao = eventos.posicao_atual()
+        inicio, fim = agenda.intervalo_do_dia(timezone.localdate())
+        agendamentos_hoje = Agendamento.objects.com_relacionados().filter(
+            data_agendamento__gte=inicio,
+            data_agendamento__lt=fim
         ).order_by('data_agendamento')
         
+        # Ocorrências de séries ainda não materializadas entram na agenda do dia
+        agendamentos_hoje = list(heapq.merge(
+            agendamentos_hoje,
+            agenda.ocorrencias_virtuais(inicio, fim),
+            key=lambda agendamento: agendamento.data_agendamento
+        ))
+        
         serializer = self.get_serializer(agendamentos_hoje, many=True)
-        return Response(serializer.data)
+        return Response(serializer.data, headers={'X-Eventos-Posicao': posicao})
 
     @action(detail=False, methods=['get'])
     def proximos(self, request):
         """Retorna os próximos agendamentos"""
         agora = timezone.now()
-        proximos_agendamentos = Agendamento.objects.filter(
+        proximos_agendamentos = Agendamento.objects.com_relacionados().filter(
             data_agendamento__gte=agora
         ).order_by('data_agendamento')[:10]
         
+        proximos_agendamentos = list(islice(heapq.merge(
+            proximos_agendamentos,
+            agenda.ocorrencias_virtuais(agora, agora + agenda.HORIZONTE_SERIES),
+            key=lambda agendamento: agendamento.data_agendamento
+        ), 10))
+        
         serializer = self.get_serializer(proximos_agendamentos, many=True)
         return Response(serializer.data)
 
@@ -174,35 +317,313 @@ class AgendamentoViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(agendamento)
         return Response(serializer.data)
 
-    def create(self, request, *args, **kwargs):
-        """Sobrescreve create para melhor tratamento de erros"""
+    @action(detail=False, methods=['get'])
+    def exportar(self, request):
+        """
+        Exporta os agendamentos com pet, cliente e preço do serviço em CSV ou
+        NDJSON (?formato=ndjson). Aceita os filtros da listagem e o período
+        data_inicio/data_fim (AAAA-MM-DD); as linhas são lidas do banco em
+        lotes e enviadas à medida que chegam, em memória constante.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
         try:
-            # Verificar conflitos antes de criar
-            data_agendamento = request.data.get('data_agendamento')
-            servico_id = request.data.get('servico')
-            
-            if data_agendamento and servico_id:
-                # Converter para datetime
-                from django.utils.dateparse import parse_datetime
-                dt = parse_datetime(data_agendamento)
-                
-                if Agendamento.objects.filter(
-                    data_agendamento=dt,
-                    servico_id=servico_id,
-                    status__in=['agendado', 'confirmado']  # Só verificar agendamentos ativos
-                ).exists():
-                    return Response(
-                        {'error': 'Já existe um agendamento para este horário e serviço.'},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-            
-            return super().create(request, *args, **kwargs)
+            if request.query_params.get('data_inicio'):
+                inicio = datetime.strptime(request.query_params['data_inicio'], '%Y-%m-%d').date()
+                queryset = queryset.filter(data_agendamento__gte=agenda.inicio_do_dia(inicio))
+            if request.query_params.get('data_fim'):
+                fim = datetime.strptime(request.query_params['data_fim'], '%Y-%m-%d').date()
+                queryset = queryset.filter(data_agendamento__lt=agenda.inicio_do_dia(fim + timedelta(days=1)))
+        except ValueError:
+            return Response({'error': 'Datas inválidas'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        campos = [
+            'id', 'data_agendamento', 'data_fim', 'status',
+            'pet_id', 'pet__nome', 'pet__cliente_id', 'pet__cliente__nome', 'pet__cliente__email',
+            'servico_id', 'servico__nome', 'servico__preco', 'observacoes',
+        ]
+        return exportar(request, queryset.order_by('data_agendamento', 'id'), campos, 'agendamentos')
+
+    @action(detail=False, methods=['get'], url_path='eventos')
+    def feed_eventos(self, request):
+        """
+        Alterações de agendamentos após a posição `desde` (ou Last-Event-ID),
+        para clientes que consultam periodicamente; o fluxo contínuo por
+        Server-Sent Events está em /api/async/agendamentos/eventos/.
+        """
+        try:
+            desde = eventos.ler_posicao(request)
+        except ValueError:
+            return Response({'error': 'Posição inválida'}, status=status.HTTP_400_BAD_REQUEST)
+        if desde is None:
+            return Response({'eventos': [], 'posicao': eventos.posicao_atual()})
+        
+        lidos = [eventos.como_dict(evento) for evento in eventos.publicados(desde)]
+        return Response({
+            'eventos': lidos,
+            'posicao': lidos[-1]['id'] if lidos else desde,
+        })
+
+    @action(detail=False, methods=['post'])
+    def lote(self, request):
+        """
+        Cria vários agendamentos de uma vez (ex.: pacotes semanais).
+
+        Pets e serviços são carregados em duas consultas, os conflitos do lote
+        inteiro são verificados em uma e a gravação é um único bulk_create.
+        Itens inválidos são reportados em `erros` pelo índice; os demais são criados.
+        """
+        itens = request.data
+        if not isinstance(itens, list) or not itens or len(itens) > agenda.MAX_ITENS_LOTE:
+            return Response(
+                {'error': f'Envie uma lista com 1 a {agenda.MAX_ITENS_LOTE} agendamentos'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        contexto = self.get_serializer_context()
+        contexto['precarregados'] = {
+            Pet: Pet.objects.select_related('cliente').in_bulk(_ids_do_lote(itens, 'pet')),
+            Servico: Servico.objects.in_bulk(_ids_do_lote(itens, 'servico')),
+        }
+        
+        erros = []
+        candidatos = []
+        for indice, item in enumerate(itens):
+            serializer = AgendamentoLoteSerializer(data=item, context=contexto)
+            if not serializer.is_valid():
+                erros.append({'indice': indice, 'erros': serializer.errors})
+                continue
             
-        except Exception as e:
+            agendamento = Agendamento(**serializer.validated_data)
+            agendamento.data_fim = agenda.calcular_fim(agendamento.data_agendamento, agendamento.servico)
+            agendamento.preco = agendamento.servico.preco
+            try:
+                agendamento.validar_horario()
+            except DjangoValidationError as e:
+                erros.append({'indice': indice, 'erros': {'non_field_errors': e.messages}})
+                continue
+            candidatos.append((indice, agendamento))
+        
+        # Só agendamentos ativos ocupam a agenda
+        ativos = [
+            (indice, agendamento) for indice, agendamento in candidatos
+            if agendamento.status in agenda.STATUS_ATIVOS
+        ]
+        reservas = [
+            (agendamento.servico_id, agendamento.data_agendamento, agendamento.data_fim)
+            for _, agendamento in ativos
+        ]
+        try:
+            with transaction.atomic():
+                # Verificação e gravação sob o bloqueio da agenda dos serviços/dias do lote
+                agenda.bloquear_agenda(reservas)
+                livres = dict(zip([indice for indice, _ in ativos], agenda.reservar_em_lote(reservas)))
+                novos = []
+                for indice, agendamento in candidatos:
+                    if livres.get(indice, True):
+                        novos.append(agendamento)
+                    else:
+                        erros.append({
+                            'indice': indice,
+                            'erros': {'non_field_errors': ['Já existe um agendamento para este horário e serviço.']}
+                        })
+                criados = Agendamento.objects.bulk_create(novos)
+                eventos.registrar_em_lote(criados, 'criado')
+                sincronizacao.registrar(Agendamento, [agendamento.id for agendamento in criados])
+                tarefas.agendar_lembretes(criados)
+                relatorios.agendar_recalculo(
+                    relatorios.bucket(agendamento.data_agendamento, agendamento.servico_id)
+                    for agendamento in criados
+                )
+                if criados:
+                    cache_api.invalidar_apos_commit(Agendamento)
+        except IntegrityError:
+            # Ocorrência de série criada por outra requisição ou restrição do banco
+            return Response(
+                {'error': 'A agenda mudou durante a gravação do lote; tente novamente.'},
+                status=status.HTTP_409_CONFLICT
+            )
+        erros.sort(key=lambda erro: erro['indice'])
+        return Response(
+            {'criados': self.get_serializer(criados, many=True).data, 'erros': erros},
+            status=status.HTTP_201_CREATED if criados else status.HTTP_400_BAD_REQUEST
+        )
+
+    @action(detail=False, methods=['post'])
+    def status_lote(self, request):
+        """
+        Altera o status de vários agendamentos com um único UPDATE
+        (ex.: concluir todos os atendimentos do dia).
+        """
+        serializer = StatusLoteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        novo_status = serializer.validated_data['status']
+        ids = list(dict.fromkeys(serializer.validated_data['ids']))
+        
+        origens = agenda.TRANSICOES_EM_LOTE.get(novo_status)
+        if origens is None:
+            return Response(
+                {'error': f'Status {novo_status} não pode ser aplicado em lote'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        atuais = dict(Agendamento.objects.filter(id__in=ids).values_list('id', 'status'))
+        erros = []
+        validos = []
+        for agendamento_id in ids:
+            if agendamento_id not in atuais:
+                erros.append({'id': agendamento_id, 'erro': 'Agendamento não encontrado.'})
+            elif atuais[agendamento_id] not in origens:
+                erros.append({
+                    'id': agendamento_id,
+                    'erro': f'Transição de {atuais[agendamento_id]} para {novo_status} não permitida.'
+                })
+            else:
+                validos.append(agendamento_id)
+        
+        atualizados = agenda.alterar_status_em_lote(validos, novo_status, atuais)
+        
+        return Response({
+            'status': novo_status,
+            'atualizados': atualizados,
+            'erros': erros
+        })
+
+    def handle_exception(self, exc):
+        """
+        Erros da validação do modelo (inclusive conflito de horário, verificado
+        em Agendamento.save sob bloqueio) viram 400; violações de restrição do
+        banco, como a de sobreposição no PostgreSQL, viram 409.
+        """
+        if isinstance(exc, DjangoValidationError):
+            return Response({'error': ' '.join(exc.messages)}, status=status.HTTP_400_BAD_REQUEST)
+        if isinstance(exc, IntegrityError):
             return Response(
-                {'error': f'Erro ao criar agendamento: {str(e)}'}, 
+                {'error': 'Já existe um agendamento para este horário e serviço.'},
+                status=status.HTTP_409_CONFLICT
+            )
+        return super().handle_exception(exc)
+
+class SerieAgendamentoViewSet(viewsets.ModelViewSet):
+    """Agendamentos recorrentes; as ocorrências são expandidas sob demanda"""
+    queryset = SerieAgendamento.objects.select_related('pet', 'servico')
+    serializer_class = SerieAgendamentoSerializer
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['pet', 'servico', 'ativa']
+
+    def perform_create(self, serializer):
+        self._salvar_sem_conflitos(serializer)
+
+    def perform_update(self, serializer):
+        self._salvar_sem_conflitos(serializer)
+
+    def _salvar_sem_conflitos(self, serializer):
+        """
+        Grava a série e confere as ocorrências do horizonte contra a agenda,
+        sob o bloqueio dos dias afetados; havendo conflito, nada é gravado.
+        O bloqueio vem antes da gravação, que registra a alteração para a
+        sincronização sob o bloqueio do feed (ver eventos.bloquear_feed)
+        """
+        previa = copy(serializer.instance) if serializer.instance else SerieAgendamento()
+        for campo, valor in serializer.validated_data.items():
+            setattr(previa, campo, valor)
+        with transaction.atomic():
+            if previa.ativa:
+                agenda.bloquear_serie(previa)
+            serie = serializer.save()
+            conflitos = agenda.conflitos_da_serie(serie) if serie.ativa else []
+            if conflitos:
+                datas = ', '.join(timezone.localtime(data).strftime('%d/%m/%Y %H:%M') for data in conflitos)
+                raise DjangoValidationError(f'Ocorrências em conflito com agendamentos existentes: {datas}')
+
+    def handle_exception(self, exc):
+        if isinstance(exc, DjangoValidationError):
+            return Response({'error': ' '.join(exc.messages)}, status=status.HTTP_400_BAD_REQUEST)
+        return super().handle_exception(exc)
+
+    @action(detail=True, methods=['get'])
+    def ocorrencias(self, request, pk=None):
+        """Ocorrências da série no período (data_inicio/data_fim, padrão: 30 dias)"""
+        serie = self.get_object()
+        
+        try:
+            inicio = datetime.strptime(
+                request.query_params.get('data_inicio', timezone.localdate().isoformat()), '%Y-%m-%d'
+            ).date()
+            fim = datetime.strptime(
+                request.query_params.get('data_fim', (inicio + timedelta(days=30)).isoformat()), '%Y-%m-%d'
+            ).date()
+        except ValueError:
+            return Response(
+                {'error': 'Datas inválidas'},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        
+        inicio, fim = agenda.inicio_do_dia(inicio), agenda.inicio_do_dia(fim + timedelta(days=1))
+        materializadas = {
+            agendamento.data_original: agendamento
+            for agendamento in Agendamento.objects.com_relacionados().filter(
+                serie=serie, data_original__gte=inicio, data_original__lt=fim
+            )
+        }
+        ocorrencias = [
+            materializadas.get(data) or Agendamento(
+                pet=serie.pet, servico=serie.servico, serie=serie, data_original=data,
+                data_agendamento=data, data_fim=agenda.calcular_fim(data, serie.servico),
+                preco=serie.servico.preco, observacoes=serie.observacoes
+            )
+            for data in serie.ocorrencias(inicio, fim)
+        ]
+        
+        return Response(AgendamentoSerializer(ocorrencias, many=True).data)
+
+    @action(detail=True, methods=['post'])
+    def materializar(self, request, pk=None):
+        """
+        Cria o agendamento próprio de uma ocorrência, para remarcá-la,
+        confirmá-la ou cancelá-la sem afetar o resto da série
+        """
+        serie = self.get_object()
+        serializer = MaterializarOcorrenciaSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        dados = serializer.validated_data
+        data_original = dados['data_original']
+        
+        if data_original not in serie.ocorrencias(data_original, data_original + timedelta(seconds=1)):
+            return Response(
+                {'error': 'A data informada não é uma ocorrência da série'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if serie.agendamentos.filter(data_original=data_original).exists():
+            return Response(
+                {'error': 'Esta ocorrência já foi materializada'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        agendamento = Agendamento(
+            pet=serie.pet,
+            servico=serie.servico,
+            serie=serie,
+            data_original=data_original,
+            data_agendamento=dados.get('data_agendamento', data_original),
+            status=dados.get('status', 'agendado'),
+            observacoes=dados.get('observacoes', serie.observacoes)
+        )
+        try:
+            agendamento.save()
+        except DjangoValidationError as e:
+            return Response(
+                {'error': e.messages},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        except IntegrityError:
+            # Materializada por outra requisição simultânea
+            return Response(
+                {'error': 'Esta ocorrência já foi materializada'},
+                status=status.HTTP_409_CONFLICT
+            )
+        
+        return Response(AgendamentoSerializer(agendamento).data, status=status.HTTP_201_CREATED)
 
 # Views adicionais para dashboard e estatísticas
 class DashboardViewSet(viewsets.ViewSet):
@@ -210,38 +631,122 @@ class DashboardViewSet(viewsets.ViewSet):
     
     @action(detail=False, methods=['get'])
     def estatisticas(self, request):
-        """Retorna estatísticas para o dashboard"""
-        from django.db.models import Count, Q
-        from datetime import datetime, timedelta
-        
-        hoje = datetime.now().date()
-        
-        estatisticas = {
-            'total_clientes': Cliente.objects.count(),
-            'total_pets': Pet.objects.count(),
-            'total_servicos': Servico.objects.filter(ativo=True).count(),
-            'agendamentos_hoje': Agendamento.objects.filter(
-                data_agendamento__date=hoje
-            ).count(),
-            'agendamentos_confirmados': Agendamento.objects.filter(
-                status='confirmado'
-            ).count(),
-            'novos_clientes_30_dias': Cliente.objects.filter(
-                data_cadastro__gte=hoje - timedelta(days=30)
-            ).count()
-        }
+        """Retorna estatísticas para o dashboard (em cache por alguns segundos)"""
+        chave = cache_api.chave(
+            'dashboard:estatisticas', [Cliente, Pet, Servico, Agendamento]
+        )
+        estatisticas = cache.get(chave)
+        cache_api.registrar_acesso(estatisticas is not None)
+        
+        if estatisticas is None:
+            estatisticas = calcular_estatisticas()
+            cache.set(chave, estatisticas, settings.DASHBOARD_CACHE_TIMEOUT)
         
         return Response(estatisticas)
 
+    @action(detail=False, methods=['get'])
+    def cache(self, request):
+        """Acertos e falhas do cache da API"""
+        return Response(cache_api.estatisticas())
+
     @action(detail=False, methods=['get'])
     def proximos_agendamentos(self, request):
         """Retorna os próximos agendamentos para o dashboard"""
         agora = timezone.now()
-        proximos = Agendamento.objects.filter(
+        proximos = Agendamento.objects.com_relacionados().filter(
             data_agendamento__gte=agora
         ).order_by('data_agendamento')[:5]
         
         serializer = AgendamentoSerializer(proximos, many=True)
         return Response(serializer.data)
+
+
+class BuscaViewSet(viewsets.ViewSet):
+    """Busca global em clientes, pets e serviços (campo de busca da recepção)"""
     
+    LIMITE_PADRAO = 5
+    LIMITE_MAXIMO = 20
+
+    def list(self, request):
+        termo = request.query_params.get('q', '').strip()
+        
+        try:
+            limite = min(int(request.query_params.get('limite', self.LIMITE_PADRAO)), self.LIMITE_MAXIMO)
+        except ValueError:
+            limite = self.LIMITE_PADRAO
+        
+        if not termo:
+            return Response(
+                {'error': 'Parâmetro q é obrigatório'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        clientes = buscar(
+            Cliente.objects.com_total_pets(), termo, ClienteViewSet.search_fields
+        ).order_by('-relevancia', 'nome')[:limite]
+        pets = buscar(
+            Pet.objects.select_related('cliente'), termo, PetViewSet.search_fields
+        ).order_by('-relevancia', 'nome')[:limite]
+        servicos = buscar(
+            Servico.objects.filter(ativo=True), termo, ServicoViewSet.search_fields
+        ).order_by('-relevancia', 'nome')[:limite]
+        
+        return Response({
+            'termo': termo,
+            'clientes': ClienteSerializer(clientes, many=True).data,
+            'pets': PetSerializer(pets, many=True).data,
+            'servicos': ServicoSerializer(servicos, many=True).data
+        })
+
+class SincronizacaoViewSet(viewsets.ViewSet):
+    """
+    Sincronização incremental: GET /sync/ devolve tudo; GET /sync/?since=<token>
+    só o que mudou desde o token. A resposta é NDJSON, gerada sob demanda.
+    """
+
+    def list(self, request):
+        token = request.query_params.get('since')
+        desde = None
+        if token:
+            try:
+                desde = sincronizacao.ler_token(token)
+            except sincronizacao.TokenExpirado:
+                return Response(
+                    {'error': 'Token expirado; faça uma sincronização completa'},
+                    status=status.HTTP_410_GONE
+                )
+            except ValueError:
+                return Response({'error': 'Token inválido'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return resposta_ndjson(sincronizacao.registros(desde))
+
+class RelatorioViewSet(viewsets.ViewSet):
+    """
+    Relatórios de receita e ocupação por ano (?ano=) ou mês (?ano=&mes=),
+    calculados sobre os resumos diários (ver relatorios.py)
+    """
+
+    def _periodo(self, request):
+        try:
+            ano = int(request.query_params.get('ano', timezone.localdate().year))
+            mes = request.query_params.get('mes')
+            return relatorios.periodo(ano, int(mes) if mes else None)
+        except ValueError:
+            return None
+
+    @action(detail=False, methods=['get'])
+    def receita(self, request):
+        """Receita realizada e prevista por serviço e por mês (ou dia)"""
+        periodo = self._periodo(request)
+        if periodo is None:
+            return Response({'error': 'Ano ou mês inválido'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(relatorios.receita(*periodo))
+
+    @action(detail=False, methods=['get'])
+    def ocupacao(self, request):
+        """Minutos reservados contra a capacidade, por serviço e por mês (ou dia)"""
+        periodo = self._periodo(request)
+        if periodo is None:
+            return Response({'error': 'Ano ou mês inválido'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(relatorios.ocupacao(*periodo))
 
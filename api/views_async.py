@@ -0,0 +1,129 @@
+"""
+Versões assíncronas dos endpoints de leitura mais acessados.
+
+São views Django assíncronas (o DRF só executa views síncronas) que usam o
+ORM assíncrono, para que um worker ASGI atenda muitas conexões lentas ao
+mesmo tempo sem prender uma thread por requisição. As respostas têm o
+mesmo corpo das versões síncronas em AgendamentoViewSet e DashboardViewSet.
+"""
+import heapq
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.views.decorators.http import require_GET
+
+from . import agenda
+from . import eventos
+from . import cache as cache_api
+from .models import Cliente, Pet, Servico, Agendamento
+from .serializers import AgendamentoSerializer
+from .views import (
+    ler_consulta_disponibilidade,
+    formatar_disponibilidade,
+    calcular_estatisticas,
+)
+
+
+def _resposta(dados, status=200):
+    return JsonResponse(dados, status=status, safe=False, json_dumps_params={'ensure_ascii': False})
+
+
+def _serializar(agendamentos):
+    # Relacionados já carregados com select_related: serializar não consulta o banco
+    return AgendamentoSerializer(agendamentos, many=True).data
+
+
+@require_GET
+async def horarios_disponiveis(request):
+    """Horários livres por dia e serviço (mesmos parâmetros da versão síncrona)"""
+    try:
+        inicio, fim, ids = ler_consulta_disponibilidade(request.GET)
+        servicos = [servico async for servico in Servico.objects.filter(id__in=ids)]
+        if len(servicos) != len(ids):
+            raise ValueError('Data ou serviço inválidos')
+    except ValueError as e:
+        return _resposta({'error': str(e)}, status=400)
+
+    disponibilidade = await agenda.ahorarios_disponiveis(servicos, inicio, fim)
+    return _resposta(formatar_disponibilidade(request.GET, servicos, inicio, fim, disponibilidade))
+
+
+@require_GET
+async def hoje(request):
+    """Agendamentos de hoje, com as ocorrências de séries e a posição do feed de eventos"""
+    posicao = await eventos.aposicao_atual()
+    inicio, fim = agenda.intervalo_do_dia(timezone.localdate())
+    agendamentos = [
+        agendamento async for agendamento in Agendamento.objects.com_relacionados().filter(
+            data_agendamento__gte=inicio,
+            data_agendamento__lt=fim
+        ).order_by('data_agendamento')
+    ]
+
+    agendamentos = list(heapq.merge(
+        agendamentos,
+        await agenda.aocorrencias_virtuais(inicio, fim),
+        key=lambda agendamento: agendamento.data_agendamento
+    ))
+    resposta = _resposta(_serializar(agendamentos))
+    resposta['X-Eventos-Posicao'] = posicao
+    return resposta
+
+
+@require_GET
+async def proximos(request):
+    """Próximos 10 agendamentos, com as ocorrências de séries"""
+    agora = timezone.now()
+    agendamentos = [
+        agendamento async for agendamento in Agendamento.objects.com_relacionados().filter(
+            data_agendamento__gte=agora
+        ).order_by('data_agendamento')[:10]
+    ]
+
+    agendamentos = list(islice(heapq.merge(
+        agendamentos,
+        await agenda.aocorrencias_virtuais(agora, agora + agenda.HORIZONTE_SERIES),
+        key=lambda agendamento: agendamento.data_agendamento
+    ), 10))
+    return _resposta(_serializar(agendamentos))
+
+
+@require_GET
+async def estatisticas(request):
+    """Estatísticas do dashboard (em cache por alguns segundos)"""
+    chave = await cache_api.achave('dashboard:estatisticas', [Cliente, Pet, Servico, Agendamento])
+    dados = await cache.aget(chave)
+    await cache_api.aregistrar_acesso(dados is not None)
+
+    if dados is None:
+        # Consulta composta com o cursor: roda numa thread, como as do ORM assíncrono
+        dados = await sync_to_async(calcular_estatisticas)()
+        await cache.aset(chave, dados, settings.DASHBOARD_CACHE_TIMEOUT)
+
+    return _resposta(dados)
+
+
+@require_GET
+async def eventos_agenda(request):
+    """
+    Fluxo Server-Sent Events com as alterações de agendamentos. Sem posição
+    informada, começa do evento atual; ao reconectar, o navegador envia
+    Last-Event-ID e o fluxo retoma sem perder eventos.
+    """
+    try:
+        desde = eventos.ler_posicao(request)
+    except ValueError:
+        return _resposta({'error': 'Posição inválida'}, status=400)
+    if desde is None:
+        desde = await eventos.aposicao_atual()
+
+    resposta = StreamingHttpResponse(eventos.fluxo(desde), content_type='text/event-stream')
+    resposta['Cache-Control'] = 'no-cache'
+    # Desliga o buffer de proxies (nginx) para os eventos saírem na hora
+    resposta['X-Accel-Buffering'] = 'no'
+    return resposta
+
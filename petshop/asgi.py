@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'petshop.settings')
+# Conexões com o banco não persistentes por padrão (ver DB_CONEXOES em settings.py)
+os.environ.setdefault('SERVIDOR_ASGI', 'True')
 
 application = get_asgi_application()
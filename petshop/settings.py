@@ -1,6 +1,7 @@
 from pathlib import Path
 import os
 from decouple import config
+from django.core.exceptions import ImproperlyConfigured
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -22,6 +23,47 @@ DATABASES = {
     }
 }
 
+# Gerenciamento das conexões com o banco (DB_CONEXOES):
+#   persistente    - cada worker reaproveita a conexão por até DB_CONN_MAX_AGE segundos
+#                    (padrão sob WSGI; só WSGI)
+#   por_requisicao - abre e fecha uma conexão a cada requisição (padrão sob ASGI)
+#   pool           - pool nativo do psycopg 3 (exige "psycopg[binary,pool]" no lugar do psycopg2)
+#   pgbouncer      - atrás do PgBouncer em modo transaction: sem cursores do lado do servidor
+# Sob ASGI (petshop/asgi.py define SERVIDOR_ASGI) o Django pede conexões não
+# persistentes: as abertas pelo ORM nas threads de sync_to_async não são
+# fechadas com segurança ao fim da requisição e se acumulam no banco
+SERVIDOR_ASGI = config('SERVIDOR_ASGI', default=False, cast=bool)
+DB_CONEXOES = config('DB_CONEXOES', default='por_requisicao' if SERVIDOR_ASGI else 'persistente')
+
+if SERVIDOR_ASGI and DB_CONEXOES == 'persistente':
+    raise ImproperlyConfigured(
+        'DB_CONEXOES=persistente só vale sob WSGI; sob ASGI use por_requisicao, pool ou pgbouncer'
+    )
+
+if DB_CONEXOES == 'persistente':
+    DATABASES['default']['CONN_MAX_AGE'] = config('DB_CONN_MAX_AGE', default=600, cast=int)
+    # Testa a conexão reaproveitada no início da requisição e reconecta se o servidor a fechou
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+elif DB_CONEXOES == 'pool':
+    # O pool substitui as conexões persistentes (CONN_MAX_AGE precisa ser 0)
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': config('DB_POOL_MIN', default=2, cast=int),
+            'max_size': config('DB_POOL_MAX', default=10, cast=int),
+            'timeout': config('DB_POOL_TIMEOUT', default=10, cast=int),
+        },
+    }
+elif DB_CONEXOES == 'pgbouncer':
+    # O PgBouncer mantém o pool; sob WSGI a conexão até ele pode ser
+    # reaproveitada, sob ASGI é aberta a cada requisição (e é barata)
+    if not SERVIDOR_ASGI:
+        DATABASES['default']['CONN_MAX_AGE'] = config('DB_CONN_MAX_AGE', default=600, cast=int)
+        DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+    # Cursores do lado do servidor (QuerySet.iterator) não sobrevivem à troca de conexão entre transações
+    DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+elif DB_CONEXOES != 'por_requisicao':
+    raise ImproperlyConfigured(f'DB_CONEXOES inválido: {DB_CONEXOES}')
+
 INSTALLED_APPS = [
     'django.contrib.admin',
     'django.contrib.auth',
@@ -36,6 +78,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Primeiro, para que o tempo total medido inclua os demais middlewares
+    'api.instrumentacao.InstrumentacaoMiddleware',
     'corsheaders.middleware.CorsMiddleware',  
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -107,8 +151,75 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
+    # JSON com orjson (mesma saída do JSONRenderer, codificação mais rápida)
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'api.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
+# Cache: memória local por padrão, Redis quando REDIS_URL estiver definida
+REDIS_URL = config('REDIS_URL', default='')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'petshop',
+        }
+    }
+
+# As versões por modelo que geram ETag/Last-Modified (e as chaves das respostas
+# em cache) ficam no cache: só valem se todos os processos que gravam no banco
+# (workers do servidor, processar_tarefas, populatedb) usarem o mesmo cache.
+# Sem REDIS_URL, as respostas condicionais e o cache de respostas dos viewsets
+# ficam desligados e os contadores de acertos são por processo. Com vários
+# workers use Redis; com cache local, ligue só quando um único processo grava
+# no banco (ex.: runserver sem o worker de tarefas).
+API_CACHE_COMPARTILHADO = config('API_CACHE_COMPARTILHADO', default=bool(REDIS_URL), cast=bool)
+
+# Tempo (segundos) das respostas em cache dos viewsets
+API_CACHE_TIMEOUT = config('API_CACHE_TIMEOUT', default=300, cast=int)
+
+# Tempo (segundos) em que as estatísticas do dashboard ficam em cache
+DASHBOARD_CACHE_TIMEOUT = config('DASHBOARD_CACHE_TIMEOUT', default=10, cast=int)
+
+# Instrumentação por requisição (cabeçalho Server-Timing e /api/interno/metricas/)
+INSTRUMENTACAO_ATIVA = config('INSTRUMENTACAO_ATIVA', default=True, cast=bool)
+# Repetições da mesma consulta numa requisição a partir das quais ela é registrada no log
+INSTRUMENTACAO_LIMIAR_DUPLICADAS = config('INSTRUMENTACAO_LIMIAR_DUPLICADAS', default=3, cast=int)
+# Token exigido pelo endpoint de métricas; vazio, só INTERNAL_IPS têm acesso
+METRICAS_TOKEN = config('METRICAS_TOKEN', default='')
+INTERNAL_IPS = ['127.0.0.1']
+
+# Listas de clientes, pets, serviços e agendamentos montadas direto de .values()
+# (mesma saída dos serializers; ver api/leitura.py)
+LISTAGEM_RAPIDA = config('LISTAGEM_RAPIDA', default=True, cast=bool)
+
+# E-mails (lembretes de agendamento); sem configuração, são impressos no console
+EMAIL_BACKEND = config('EMAIL_BACKEND', default='django.core.mail.backends.console.EmailBackend')
+EMAIL_HOST = config('EMAIL_HOST', default='localhost')
+EMAIL_PORT = config('EMAIL_PORT', default=25, cast=int)
+EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
+EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
+EMAIL_USE_TLS = config('EMAIL_USE_TLS', default=False, cast=bool)
+DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='MyPet <nao-responda@mypet.com.br>')
+
+# Horas de antecedência do lembrete enviado pela fila de tarefas (ver api/tarefas.py)
+LEMBRETE_ANTECEDENCIA_HORAS = config('LEMBRETE_ANTECEDENCIA_HORAS', default=24, cast=int)
+
 # CORS configuration
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
@@ -117,6 +228,8 @@ CORS_ALLOWED_ORIGINS = [
 
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
+# Permite ao front-end ler os tempos do servidor (DevTools e PerformanceServerTiming)
+CORS_EXPOSE_HEADERS = ['Server-Timing']
 
 CORS_ALLOW_HEADERS = [
     'accept',